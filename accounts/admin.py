@@ -1,6 +1,25 @@
 from django.contrib import admin
-from .models import Wallet, TransactionHistory
+from .models import (
+    Wallet,
+    WalletHold,
+    TransactionHistory,
+    BulkTransfer,
+    IdempotencyKey,
+    StatementArtifact,
+    StatementJob,
+    StatementRun,
+    StatementRunChunk,
+    ArchivedSegment,
+)
 
 # Register your models here.
 admin.site.register(Wallet)
+admin.site.register(WalletHold)
 admin.site.register(TransactionHistory)
+admin.site.register(BulkTransfer)
+admin.site.register(IdempotencyKey)
+admin.site.register(StatementArtifact)
+admin.site.register(StatementJob)
+admin.site.register(StatementRun)
+admin.site.register(StatementRunChunk)
+admin.site.register(ArchivedSegment)
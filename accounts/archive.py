@@ -0,0 +1,495 @@
+import gzip
+import hashlib
+import json
+import struct
+import tempfile
+from collections import Counter, namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
+from uuid import UUID
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedSegment, TransactionHistory, Wallet
+from .partitions import add_months, month_start
+from .utils.ids import id_generated_at
+
+# A segment file holds the rows of one month for an id range of wallets,
+# sorted by (wallet_id, created_at desc, id desc): independently gzipped
+# blocks of JSON lines, then a gzipped JSON sparse index with the first and
+# last (wallet_id, created_at) and byte range of every block and the row
+# count of every wallet, then a footer giving the index's offset and length.
+# Segments written before the counts were added have a bare list of blocks as
+# their index.
+SEGMENT_MAGIC = b"LPSEG1\n"
+FOOTER = struct.Struct(">QQ")
+ARCHIVE_FIELDS = [
+    "id",
+    "wallet_id",
+    "amount",
+    "type",
+    "transaction_id",
+    "session_id",
+    "sender_id",
+    "receiver_id",
+    "sender_name",
+    "receiver_name",
+    "narration",
+    "created_at",
+    "updated_at",
+    "balance_after_transaction",
+]
+WALLET_INDEX = ARCHIVE_FIELDS.index("wallet_id")
+CREATED_AT_INDEX = ARCHIVE_FIELDS.index("created_at")
+UUID_FIELDS = {"id", "wallet_id", "sender_id", "receiver_id"}
+DECIMAL_FIELDS = {"amount", "balance_after_transaction"}
+DATETIME_FIELDS = {"created_at", "updated_at"}
+
+# wallet_counts maps wallet ids to row counts, or is None for older segments
+SegmentIndex = namedtuple("SegmentIndex", ["blocks", "wallet_counts"])
+
+
+def encode_value(field, value):
+    if value is None:
+        return None
+    if field in DATETIME_FIELDS:
+        return value.isoformat()
+    if field in UUID_FIELDS or field in DECIMAL_FIELDS:
+        return str(value)
+    return value
+
+
+def decode_row(line):
+    """A read-only TransactionHistory instance from one segment line."""
+    values = []
+    for field, value in zip(ARCHIVE_FIELDS, json.loads(line)):
+        if value is not None:
+            if field in UUID_FIELDS:
+                value = UUID(value)
+            elif field in DECIMAL_FIELDS:
+                value = Decimal(value)
+            elif field in DATETIME_FIELDS:
+                value = parse_datetime(value)
+        values.append(value)
+    return TransactionHistory.from_db("default", ARCHIVE_FIELDS, values)
+
+
+def month_range(month):
+    """Aware datetimes bounding ``month`` in the current time zone."""
+    return (
+        timezone.make_aware(datetime.combine(month, time.min)),
+        timezone.make_aware(datetime.combine(add_months(month, 1), time.min)),
+    )
+
+
+class SegmentWriter:
+    """Write sorted rows, as ARCHIVE_FIELDS tuples, to a segment file."""
+
+    def __init__(self, output, block_rows=None):
+        self.output = output
+        self.block_rows = block_rows or settings.HISTORY_ARCHIVE_BLOCK_ROWS
+        self.digest = hashlib.sha256()
+        self.position = 0
+        self.index = []
+        self.block = []
+        self.row_count = 0
+        self.wallet_counts = Counter()
+        self.write(SEGMENT_MAGIC)
+
+    def write(self, data):
+        self.output.write(data)
+        self.digest.update(data)
+        self.position += len(data)
+
+    def add(self, values):
+        self.block.append(values)
+        self.row_count += 1
+        self.wallet_counts[str(values[WALLET_INDEX])] += 1
+        if len(self.block) == self.block_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.block:
+            return
+        lines = (
+            json.dumps([encode_value(f, v) for f, v in zip(ARCHIVE_FIELDS, values)])
+            for values in self.block
+        )
+        data = gzip.compress("\n".join(lines).encode())
+        first, last = self.block[0], self.block[-1]
+        self.index.append(
+            [
+                str(first[WALLET_INDEX]),
+                first[CREATED_AT_INDEX].isoformat(),
+                str(last[WALLET_INDEX]),
+                last[CREATED_AT_INDEX].isoformat(),
+                self.position,
+                len(data),
+            ]
+        )
+        self.write(data)
+        self.block = []
+
+    def close(self):
+        """Write the index and footer; return the file's sha256 hex digest."""
+        self.flush()
+        index = gzip.compress(
+            json.dumps({"blocks": self.index, "wallets": self.wallet_counts}).encode()
+        )
+        offset = self.position
+        self.write(index)
+        self.write(FOOTER.pack(offset, len(index)))
+        return self.digest.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def segment_index(name):
+    """
+    The sparse index of segment file ``name``: its blocks as ``(first_wallet,
+    newest, last_wallet, oldest, offset, length)`` tuples and the row count of
+    each wallet. Segments never change, so indexes are cached for the life of
+    the process.
+    """
+    storage = ArchivedSegment._meta.get_field("file").storage
+    with storage.open(name, "rb") as handle:
+        if handle.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{name} is not a history segment")
+        handle.seek(-FOOTER.size, 2)
+        offset, length = FOOTER.unpack(handle.read(FOOTER.size))
+        handle.seek(offset)
+        index = json.loads(gzip.decompress(handle.read(length)))
+    wallet_counts = None
+    if isinstance(index, dict):
+        wallet_counts = {UUID(key): n for key, n in index["wallets"].items()}
+        index = index["blocks"]
+    blocks = [
+        (UUID(first), parse_datetime(newest), UUID(last), parse_datetime(oldest))
+        + tuple(block)
+        for first, newest, last, oldest, *block in index
+    ]
+    return SegmentIndex(blocks, wallet_counts)
+
+
+def segment_rows(segment, first_wallet_id, last_wallet_id, start=None, end=None):
+    """
+    Yield the segment's rows for wallets in the id range created in
+    ``[start, end)``, in segment order. Only the blocks the sparse index
+    says can hold such rows are read.
+    """
+    blocks = []
+    for first, newest, last, oldest, offset, length in segment_index(
+        segment.file.name
+    ).blocks:
+        if last < first_wallet_id or first > last_wallet_id:
+            continue
+        if first == last and (
+            (start is not None and newest < start)
+            or (end is not None and oldest >= end)
+        ):
+            continue
+        blocks.append((offset, length))
+    if not blocks:
+        return
+
+    with segment.file.storage.open(segment.file.name, "rb") as handle:
+        for offset, length in blocks:
+            handle.seek(offset)
+            for line in gzip.decompress(handle.read(length)).splitlines():
+                row = decode_row(line)
+                if not first_wallet_id <= row.wallet_id <= last_wallet_id:
+                    continue
+                if start is not None and row.created_at < start:
+                    continue
+                if end is not None and row.created_at >= end:
+                    continue
+                yield row
+
+
+def overlapping_segments(first_wallet_id, last_wallet_id, start=None, end=None):
+    """Segments that can hold rows of the wallet range in ``[start, end)``."""
+    segments = ArchivedSegment.objects.filter(
+        first_wallet_id__lte=last_wallet_id, last_wallet_id__gte=first_wallet_id
+    )
+    if start is not None:
+        segments = segments.filter(month__gte=month_start(timezone.localtime(start)))
+    if end is not None:
+        last_moment = timezone.localtime(end - timedelta(microseconds=1))
+        segments = segments.filter(month__lte=last_moment.date())
+    return segments
+
+
+class ArchivedHistory:
+    """
+    One wallet's archived rows, optionally narrowed by a validated
+    ``TransactionHistoryFilterSerializer``.
+
+    The archiver moves whole months, oldest first, so every archived row of
+    a wallet is older than all of its live rows: history reads live rows
+    first and continues into the archive. Nothing is queried until rows are
+    asked for.
+    """
+
+    def __init__(self, wallet_id=None, user=None, filters=None, start=None, end=None):
+        self._wallet_id = wallet_id
+        self.user = user
+        self.filters = filters
+        if filters is not None:
+            start, end = filters.created_at_range()
+        self.start, self.end = start, end
+        self._months = None
+
+    @property
+    def wallet_id(self):
+        if self._wallet_id is None:
+            self._wallet_id = (
+                Wallet.objects.filter(user=self.user)
+                .values_list("pk", flat=True)
+                .first()
+            )
+        return self._wallet_id
+
+    def months(self):
+        """Segments holding this wallet, newest month first, queried once."""
+        if self._months is None:
+            if self.wallet_id is None:
+                self._months = []
+            else:
+                self._months = list(
+                    overlapping_segments(
+                        self.wallet_id, self.wallet_id, self.start, self.end
+                    ).order_by("-month")
+                )
+        return self._months
+
+    def matching(self, rows):
+        if self.filters is None:
+            return rows
+        return (row for row in rows if self.filters.matches(row))
+
+    def newest_first(self, before=None):
+        """Rows whose ``(created_at, pk)`` is below ``before``, newest first."""
+        end = self.end
+        if before is not None and (end is None or before[0] < end):
+            # Ties on created_at are resolved on pk below
+            end = before[0] + timedelta(microseconds=1)
+        for segment in self.months():
+            if end is not None and month_range(segment.month)[0] >= end:
+                continue
+            rows = segment_rows(
+                segment, self.wallet_id, self.wallet_id, self.start, end
+            )
+            for row in self.matching(rows):
+                if before is None or (row.created_at, row.pk) < before:
+                    yield row
+
+    def oldest_first(self, after=None):
+        """Rows whose ``(created_at, pk)`` is above ``after``, oldest first."""
+        start = self.start
+        if after is not None and (start is None or after[0] > start):
+            start = after[0]
+        for segment in reversed(self.months()):
+            if start is not None and month_range(segment.month)[1] <= start:
+                continue
+            # One wallet's rows for one month, read newest first
+            rows = list(
+                segment_rows(segment, self.wallet_id, self.wallet_id, start, self.end)
+            )
+            for row in self.matching(reversed(rows)):
+                if after is None or (row.created_at, row.pk) > after:
+                    yield row
+
+    def count(self, limit=None):
+        """
+        Number of rows, counting no further than ``limit``. Whole months are
+        counted from the segment indexes unless rows are filtered on more
+        than their dates; only the other segments are read.
+        """
+        total = 0
+        for segment in self.months():
+            if limit is not None and total >= limit:
+                return limit
+            stored = self.stored_count(segment)
+            if stored is None:
+                rows = self.matching(
+                    segment_rows(
+                        segment, self.wallet_id, self.wallet_id, self.start, self.end
+                    )
+                )
+                stored = sum(
+                    1 for _ in islice(rows, None if limit is None else limit - total)
+                )
+            total += stored
+        return total if limit is None else min(total, limit)
+
+    def stored_count(self, segment):
+        """The wallet's row count in ``segment`` if the index can answer, else None."""
+        if self.filters is not None and self.filters.filters_rows():
+            return None
+        first, after = month_range(segment.month)
+        if (self.start is not None and self.start > first) or (
+            self.end is not None and self.end < after
+        ):
+            return None
+        wallet_counts = segment_index(segment.file.name).wallet_counts
+        if wallet_counts is None:
+            return None
+        return wallet_counts.get(self.wallet_id, 0)
+
+    def position_of(self, transaction_id):
+        """``(created_at, pk)`` of the archived row with ``transaction_id``."""
+        windows = [(self.start, self.end)]
+        generated_at = id_generated_at(transaction_id)
+        if generated_at is not None:
+            # Rows are saved just after their id is generated; look there first
+            start = generated_at - timedelta(minutes=5)
+            end = generated_at + timedelta(days=1)
+            if self.start is not None:
+                start = max(start, self.start)
+            if self.end is not None:
+                end = min(end, self.end)
+            windows.insert(0, (start, end))
+        for start, end in windows:
+            for segment in self.months():
+                rows = segment_rows(segment, self.wallet_id, self.wallet_id, start, end)
+                for row in self.matching(rows):
+                    if row.transaction_id == transaction_id:
+                        return row.created_at, row.pk
+        return None
+
+
+class MergedHistory:
+    """
+    Live rows of a newest-first queryset followed by the wallet's archived
+    rows, as a sequence Django's Paginator can slice.
+    """
+
+    def __init__(self, queryset, archive):
+        self.queryset = queryset
+        self.archive = archive
+        self._live_count = None
+
+    def live_count(self):
+        if self._live_count is None:
+            self._live_count = self.queryset.count()
+        return self._live_count
+
+    def count(self):
+        return self.live_count() + self.archive.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+        start, stop = index.start or 0, index.stop
+        rows = list(self.queryset[start:stop])
+        if stop is None or len(rows) < stop - start:
+            live = self.live_count()
+            rows += islice(
+                self.archive.newest_first(),
+                max(start - live, 0),
+                None if stop is None else stop - live,
+            )
+        return rows
+
+
+def archive_month(month, segment_wallets=None, block_rows=None):
+    """
+    Move ``month``'s TransactionHistory rows into segments of up to
+    ``segment_wallets`` wallets each. A segment's rows are deleted in the
+    transaction that records it, and only if exactly the archived rows are
+    deleted. Returns ``(segments, rows)`` archived.
+    """
+    segment_wallets = segment_wallets or settings.HISTORY_ARCHIVE_SEGMENT_WALLETS
+    start, end = month_range(month)
+    in_month = TransactionHistory.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    )
+    wallets = in_month.order_by("wallet_id").values_list("wallet_id", flat=True)
+    segments = rows = 0
+    last_wallet_id = None
+    while True:
+        remaining = wallets
+        if last_wallet_id is not None:
+            remaining = wallets.filter(wallet_id__gt=last_wallet_id)
+        ids = list(remaining.distinct()[:segment_wallets])
+        if not ids:
+            break
+        archived = archive_segment(month, in_month, ids[0], ids[-1], block_rows)
+        segments += 1
+        rows += archived.row_count
+        last_wallet_id = ids[-1]
+    return segments, rows
+
+
+def archive_segment(month, in_month, first_wallet_id, last_wallet_id, block_rows):
+    in_range = in_month.filter(
+        wallet_id__gte=first_wallet_id, wallet_id__lte=last_wallet_id
+    )
+    with tempfile.TemporaryFile() as handle:
+        writer = SegmentWriter(handle, block_rows)
+        for values in (
+            in_range.order_by("wallet_id", "-created_at", "-id")
+            .values_list(*ARCHIVE_FIELDS)
+            .iterator(chunk_size=settings.HISTORY_ARCHIVE_BLOCK_ROWS * 8)
+        ):
+            writer.add(values)
+        segment = ArchivedSegment(
+            month=month,
+            first_wallet_id=first_wallet_id,
+            last_wallet_id=last_wallet_id,
+            sha256=writer.close(),
+            size=writer.position,
+            row_count=writer.row_count,
+        )
+        handle.seek(0)
+        segment.file.save(
+            f"{month:%Y/%m}/{first_wallet_id}_{last_wallet_id}.seg",
+            File(handle),
+            save=False,
+        )
+
+    try:
+        with transaction.atomic():
+            segment.save()
+            deleted, _ = in_range.delete()
+            if deleted != segment.row_count:
+                raise RuntimeError(
+                    f"Rows of {segment} changed while archiving: wrote "
+                    f"{segment.row_count}, would delete {deleted}"
+                )
+    except Exception:
+        segment.file.delete(save=False)
+        raise
+    return segment
+
+
+def archive_cold_history(before=None, segment_wallets=None):
+    """
+    Archive every month before ``before`` (a month start; default
+    HISTORY_ARCHIVE_AFTER_MONTHS ago), oldest first. Returns
+    ``(month, segments, rows)`` for each month archived.
+    """
+    if before is None:
+        before = add_months(
+            month_start(timezone.localdate()), -settings.HISTORY_ARCHIVE_AFTER_MONTHS
+        )
+    oldest = TransactionHistory.objects.aggregate(oldest=Min("created_at"))["oldest"]
+    if oldest is None:
+        return []
+    archived = []
+    month = month_start(timezone.localtime(oldest))
+    while month < before:
+        segments, rows = archive_month(month, segment_wallets)
+        if segments:
+            archived.append((month, segments, rows))
+        month = add_months(month, 1)
+    return archived
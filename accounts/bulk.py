@@ -0,0 +1,275 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from notifications.service import notification, notify_many
+from .holds import draw_hold, place_hold, release_hold
+from .ledger import InsufficientFunds, apply_balance_changes
+from .models import BulkTransfer, TransactionHistory, Wallet
+from .serializers import SendMoneySerializer, check_transfer
+
+
+def error_message(exc):
+    """Flatten a DRF ValidationError into its first message."""
+    detail = exc.detail
+    while isinstance(detail, (dict, list)):
+        detail = next(iter(detail.values())) if isinstance(detail, dict) else detail[0]
+    return str(detail)
+
+
+def recipient_wallets(rows):
+    """The rows' recipient wallets by account number, in one query."""
+    recipients = {str(row.get("recipient", "")).strip() for row in rows}
+    return {
+        wallet.account_number: wallet
+        for wallet in Wallet.objects.select_related("user").filter(
+            account_number__in=recipients
+        )
+    }
+
+
+def validate_row(sender_wallet, wallets, row):
+    """
+    A row's validated data and recipient wallet, with the same rules as a
+    single transfer. Raises ``ValidationError``.
+    """
+    data = SendMoneySerializer().to_internal_value(row)
+    recipient_wallet = wallets.get(data["recipient"])
+    check_transfer(sender_wallet, recipient_wallet, data["amount"])
+    return data, recipient_wallet
+
+
+def batch_total(sender_wallet, rows, wallets=None):
+    """Sum of the amounts of the rows that pass every transfer check."""
+    if wallets is None:
+        wallets = recipient_wallets(rows)
+    total = Decimal("0")
+    for row in rows:
+        try:
+            data, _ = validate_row(sender_wallet, wallets, row)
+        except ValidationError:
+            continue
+        total += data["amount"]
+    return total
+
+
+def create_bulk_transfer(wallet, rows):
+    """
+    Create a bulk transfer and hold the total of its valid rows on the
+    sender's wallet, so the batch's funds cannot be spent elsewhere while it
+    is pending. Rows that will fail validation hold nothing. Raises
+    ``InsufficientFunds`` if the wallet cannot cover the total.
+    """
+    with transaction.atomic():
+        bulk = BulkTransfer.objects.create(
+            wallet=wallet, rows=rows, total_rows=len(rows)
+        )
+        bulk.hold = place_hold(
+            wallet.pk,
+            batch_total(wallet, rows),
+            reference=f"bulk:{bulk.pk}",
+            narration=f"Bulk transfer of {len(rows)} payments",
+            expires_in=settings.BULK_TRANSFER_HOLD_TIMEOUT,
+        )
+        bulk.save(update_fields=["hold", "updated_at"])
+    return bulk
+
+
+def run_bulk_transfer(bulk, chunk_size=None):
+    """
+    Execute the rows of a ``BulkTransfer`` in chunked transactions.
+
+    Recipient wallets are resolved with one query up front. Each chunk
+    applies every payable row against what is left of the batch's hold, then
+    draws the chunk's debits from the hold, credits the recipients with
+    conditional updates and writes the history rows in bulk. Progress is
+    committed with each chunk, so a retried job resumes after the last
+    finished chunk; the unused part of the hold is released at the end.
+    """
+    chunk_size = chunk_size or settings.BULK_TRANSFER_CHUNK_SIZE
+    bulk.status = "processing"
+    bulk.save(update_fields=["status", "updated_at"])
+
+    sender_wallet = Wallet.objects.select_related("user").get(pk=bulk.wallet_id)
+    wallets = recipient_wallets(bulk.rows[bulk.processed_rows :])
+
+    hold = bulk.hold
+    for start in range(bulk.processed_rows, len(bulk.rows), chunk_size):
+        chunk = bulk.rows[start : start + chunk_size]
+        with transaction.atomic():
+            results = process_chunk(sender_wallet, hold, wallets, chunk, start)
+            succeeded = [r for r in results if r["status"] == "succeeded"]
+            bulk.results.extend(results)
+            bulk.processed_rows = start + len(chunk)
+            bulk.succeeded += len(succeeded)
+            bulk.failed += len(results) - len(succeeded)
+            bulk.total_amount += sum(Decimal(r["amount"]) for r in succeeded)
+            bulk.save(
+                update_fields=[
+                    "results",
+                    "processed_rows",
+                    "succeeded",
+                    "failed",
+                    "total_amount",
+                    "updated_at",
+                ]
+            )
+
+    if hold is not None:
+        release_hold(hold)
+    bulk.status = "completed"
+    bulk.save(update_fields=["status", "updated_at"])
+    return bulk
+
+
+def available_funds(sender_wallet, hold):
+    """What the chunk may spend: the hold's remainder, or the free balance."""
+    if hold is not None:
+        hold.refresh_from_db(fields=["status", "captured_amount"])
+        if hold.status == "active":
+            return hold.remaining
+    balance, reserved = Wallet.objects.values_list("balance", "reserved").get(
+        pk=sender_wallet.pk
+    )
+    return balance - reserved
+
+
+def pay_chunk(sender_wallet, hold, total, credits):
+    """
+    Debit the chunk's ``total`` from the sender, from the hold while it is
+    active and otherwise (an expired hold, or a batch queued without one)
+    from the free balance, and apply the recipients' ``credits``. Every
+    change is a single-statement update, made in the same wallet order as
+    ``apply_balance_changes`` so concurrent batches cannot deadlock.
+    Returns the new balances of every wallet touched.
+    """
+    sender_id = str(sender_wallet.pk)
+    balances = apply_balance_changes(
+        {pk: amount for pk, amount in credits.items() if str(pk) < sender_id}
+    )
+    if hold is None or not draw_hold(hold, total):
+        apply_balance_changes({sender_wallet.pk: -total})
+    balances.update(
+        apply_balance_changes(
+            {pk: amount for pk, amount in credits.items() if str(pk) > sender_id}
+        )
+    )
+    balances[sender_wallet.pk] = Wallet.objects.values_list("balance", flat=True).get(
+        pk=sender_wallet.pk
+    )
+    return balances
+
+
+def process_chunk(sender_wallet, hold, wallets, chunk, start):
+    results = []
+    payable = []
+    for offset, row in enumerate(chunk):
+        index = start + offset
+        try:
+            data, recipient_wallet = validate_row(sender_wallet, wallets, row)
+        except ValidationError as e:
+            results.append(row_result(index, row, "failed", error=error_message(e)))
+            continue
+        payable.append((index, row, data, recipient_wallet))
+
+    available = available_funds(sender_wallet, hold) if payable else 0
+    paid = []
+    for index, row, data, recipient_wallet in payable:
+        if available < data["amount"]:
+            results.append(
+                row_result(index, row, "failed", error="Insufficient funds.")
+            )
+            continue
+        available -= data["amount"]
+        paid.append((index, row, data, recipient_wallet))
+
+    if not paid:
+        return sorted(results, key=lambda r: r["row"])
+
+    total = sum(data["amount"] for _, _, data, _ in paid)
+    credits = defaultdict(Decimal)
+    for _, _, data, recipient_wallet in paid:
+        credits[recipient_wallet.pk] += data["amount"]
+    try:
+        with transaction.atomic():
+            balances = pay_chunk(sender_wallet, hold, total, credits)
+    except InsufficientFunds:
+        results += [
+            row_result(index, row, "failed", error="Insufficient funds.")
+            for index, row, _, _ in paid
+        ]
+        return sorted(results, key=lambda r: r["row"])
+    sender_balance = balances[sender_wallet.pk]
+
+    # Rebuild each row's balance from the balances after the chunk; the
+    # updated rows stay locked until commit, so nothing else moved them
+    balances = {pk: balance - credits[pk] for pk, balance in balances.items()}
+    balances[sender_wallet.pk] += total
+
+    entries = []
+    notifications = []
+    for index, row, data, recipient_wallet in paid:
+        amount = data["amount"]
+        balances[sender_wallet.pk] -= amount
+        balances[recipient_wallet.pk] += amount
+
+        debit = TransactionHistory(
+            wallet_id=sender_wallet.pk,
+            amount=amount,
+            type="debit",
+            sender_id=sender_wallet.user_id,
+            receiver_id=recipient_wallet.user_id,
+            sender_name=sender_wallet.user.display_name,
+            receiver_name=recipient_wallet.user.display_name,
+            narration=data["narration"],
+            balance_after_transaction=balances[sender_wallet.pk],
+        )
+        credit = TransactionHistory(
+            wallet_id=recipient_wallet.pk,
+            amount=amount,
+            type="credit",
+            sender_id=sender_wallet.user_id,
+            receiver_id=recipient_wallet.user_id,
+            sender_name=sender_wallet.user.display_name,
+            receiver_name=recipient_wallet.user.display_name,
+            narration=data["narration"],
+            balance_after_transaction=balances[recipient_wallet.pk],
+        )
+        entries += [debit, credit]
+        notifications.append(
+            notification(
+                "transaction",
+                [sender_wallet.user.email, recipient_wallet.user.email],
+                amount=str(amount),
+                transaction_id=debit.transaction_id,
+            )
+        )
+        results.append(
+            row_result(
+                index,
+                row,
+                "succeeded",
+                amount=str(amount),
+                transaction_id=debit.transaction_id,
+            )
+        )
+
+    TransactionHistory.objects.bulk_create(entries)
+
+    sender_wallet.balance = sender_balance
+    if notifications:
+        notify_many(notifications)
+    return sorted(results, key=lambda r: r["row"])
+
+
+def row_result(index, row, status, **extra):
+    return {
+        "row": index + 1,
+        "recipient": row.get("recipient"),
+        "amount": str(row.get("amount")),
+        "status": status,
+        **extra,
+    }
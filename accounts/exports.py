@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.db.models import Q
+
+from .utils.ids import id_generated_at
+
+EXPORT_FIELDS = [
+    "transaction_id",
+    "session_id",
+    "created_at",
+    "type",
+    "amount",
+    "balance_after_transaction",
+    "sender_name",
+    "receiver_name",
+    "narration",
+]
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def resume_after(queryset, transaction_id):
+    """
+    Rows after the one with ``transaction_id`` in export order, or None if the
+    cursor is not one of the queryset's rows.
+    """
+    lookup = queryset.filter(transaction_id=transaction_id)
+    position = None
+    generated_at = id_generated_at(transaction_id)
+    if generated_at is not None:
+        # Rows are saved just after their id is generated; bounding the
+        # lookup by that time lets it read one monthly partition
+        position = (
+            lookup.filter(
+                created_at__gte=generated_at - timedelta(minutes=5),
+                created_at__lt=generated_at + timedelta(days=1),
+            )
+            .values_list("created_at", "pk")
+            .first()
+        )
+    if position is None:
+        position = lookup.values_list("created_at", "pk").first()
+    if position is None:
+        return None
+    created_at, pk = position
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+    )
+
+
+def export_rows(queryset, chunk_size):
+    """
+    Yield export rows oldest first, as dicts, through a server-side cursor so
+    only one chunk of rows is held in memory at a time.
+    """
+    return (
+        queryset.order_by("created_at", "pk")
+        .values(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def archived_export_rows(rows):
+    """Export rows, as dicts, for TransactionHistory instances."""
+    return ({field: getattr(row, field) for field in EXPORT_FIELDS} for row in rows)
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(rows, chunk_size, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([format_value(row[field]) for field in EXPORT_FIELDS])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(
+            json.dumps(
+                {
+                    field: (None if row[field] is None else format_value(row[field]))
+                    for field in EXPORT_FIELDS
+                }
+            )
+        )
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
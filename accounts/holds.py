@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .ledger import InsufficientFunds
+from .models import TransactionHistory, Wallet, WalletHold
+
+
+def place_hold(wallet_id, amount, reference, narration="", expires_in=None):
+    """
+    Reserve ``amount`` of the wallet's available balance and return the hold.
+    The reservation is one conditional update, so it never waits on a lock
+    held across other work and cannot overcommit the wallet. Raises
+    ``InsufficientFunds`` if less than ``amount`` is available.
+    """
+    now = timezone.now()
+    expires_in = expires_in or settings.WALLET_HOLD_TIMEOUT
+    with transaction.atomic():
+        reserved = Wallet.objects.filter(
+            pk=wallet_id, balance__gte=F("reserved") + amount
+        ).update(reserved=F("reserved") + amount, updated_at=now)
+        if not reserved:
+            raise InsufficientFunds(wallet_id)
+        return WalletHold.objects.create(
+            wallet_id=wallet_id,
+            amount=amount,
+            reference=reference,
+            narration=narration,
+            expires_at=now + expires_in,
+        )
+
+
+def draw_hold(hold, amount):
+    """
+    Debit ``amount`` from the wallet out of an active hold, keeping the rest
+    reserved. Returns False, changing nothing, if the hold is no longer
+    active or has less than ``amount`` left. Must run inside
+    ``transaction.atomic()``.
+    """
+    now = timezone.now()
+    drawn = WalletHold.objects.filter(
+        pk=hold.pk, status="active", amount__gte=F("captured_amount") + amount
+    ).update(captured_amount=F("captured_amount") + amount, updated_at=now)
+    if not drawn:
+        return False
+    Wallet.objects.filter(pk=hold.wallet_id).update(
+        balance=F("balance") - amount, reserved=F("reserved") - amount, updated_at=now
+    )
+    hold.captured_amount += amount
+    return True
+
+
+def settle_hold(hold, status):
+    """Close an active hold, returning whatever is left of it to the wallet."""
+    now = timezone.now()
+    with transaction.atomic():
+        hold = (
+            WalletHold.objects.filter(pk=hold.pk, status="active")
+            .select_for_update()
+            .first()
+        )
+        if hold is None:
+            return None
+        hold.status = status
+        hold.save(update_fields=["status", "updated_at"])
+        Wallet.objects.filter(pk=hold.wallet_id).update(
+            reserved=F("reserved") - hold.remaining, updated_at=now
+        )
+    return hold
+
+
+def capture_hold(hold, amount=None):
+    """
+    Debit ``amount`` (by default all that is left) from an active hold,
+    record it in the wallet's history and release any remainder. Returns
+    the history row, or None if the hold was already settled.
+    """
+    with transaction.atomic():
+        amount = hold.remaining if amount is None else amount
+        if not draw_hold(hold, amount):
+            return None
+        settle_hold(hold, "captured")
+        balance = Wallet.objects.values_list("balance", flat=True).get(
+            pk=hold.wallet_id
+        )
+        return TransactionHistory.objects.create(
+            wallet_id=hold.wallet_id,
+            amount=amount,
+            type="debit",
+            narration=hold.narration,
+            balance_after_transaction=balance,
+        )
+
+
+def release_hold(hold):
+    """Return an active hold's remaining funds to the wallet."""
+    return settle_hold(hold, "released")
+
+
+def release_expired_holds(batch_size=None):
+    """
+    Release every active hold past its expiry, a batch at a time: the batch's
+    holds are claimed with ``SKIP LOCKED`` and each wallet's reservation is
+    reduced by one update. The released funds of card authorizations are
+    taken back off the card's daily spend in the same transaction. Returns
+    the number of holds released.
+    """
+    # cards builds on accounts, so it is imported here rather than at the top
+    from cards.authorization import HOLD_REFERENCE, refund_spend
+
+    card_prefix = HOLD_REFERENCE.split("{}")[0]
+    batch_size = batch_size or settings.WALLET_HOLD_SWEEP_BATCH_SIZE
+    released = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                WalletHold.objects.select_for_update(skip_locked=True)
+                .filter(status="active", expires_at__lte=now)
+                .order_by("expires_at")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                return released
+            holds = WalletHold.objects.filter(pk__in=ids)
+            totals = holds.values("wallet_id").annotate(
+                remaining=Sum(F("amount") - F("captured_amount"))
+            )
+            for row in sorted(totals, key=lambda row: str(row["wallet_id"])):
+                Wallet.objects.filter(pk=row["wallet_id"]).update(
+                    reserved=F("reserved") - row["remaining"], updated_at=now
+                )
+            card_holds = list(
+                holds.filter(reference__startswith=card_prefix).values_list(
+                    "reference", "amount", "captured_amount"
+                )
+            )
+            holds.update(status="expired", updated_at=now)
+            for reference, amount, captured_amount in card_holds:
+                card_id, authorization_id = reference[len(card_prefix) :].split(":")
+                refund_spend(card_id, authorization_id, amount - captured_amount)
+        released += len(ids)
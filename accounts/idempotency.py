@@ -0,0 +1,209 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+METRICS = ("hits", "misses", "waits", "conflicts", "mismatches")
+POLL_INTERVAL = 0.1
+
+
+def record_metric(name):
+    cache_key = f"idempotency:metrics:{name}"
+    if not cache.add(cache_key, 1, timeout=None):
+        try:
+            cache.incr(cache_key)
+        except ValueError:
+            cache.set(cache_key, 1, timeout=None)
+
+
+def get_metrics():
+    values = cache.get_many([f"idempotency:metrics:{name}" for name in METRICS])
+    return {name: values.get(f"idempotency:metrics:{name}", 0) for name in METRICS}
+
+
+def request_hash(request):
+    payload = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f"{request.path}:{payload}".encode()).hexdigest()
+
+
+def replay(stored):
+    response = Response(data=stored["body"], status=stored["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make an ``APIView`` handler safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key claims it in ``IdempotencyKey`` and runs the
+    view; its response is stored in the database, in the same transaction as
+    the view's writes, and then in the cache. Retries get
+    the stored response back without running the view again, concurrent
+    duplicates wait for the first request to finish, and reusing a key with
+    a different body is rejected. Requests without the header run as before.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"message": "Idempotency-Key must be at most 255 characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cache_key = f"idempotency:{request.user.pk}:{key}"
+        body_hash = request_hash(request)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay_or_reject(stored, body_hash)
+
+        record = claim(request, key, body_hash)
+        if record is not None:
+            record_metric("misses")
+            return run_and_store(
+                view_method, self, request, record, cache_key, args, kwargs
+            )
+
+        stored = wait_for_result(request.user, key, cache_key)
+        if stored is None:
+            record_metric("conflicts")
+            return Response(
+                {"message": "A request with this Idempotency-Key is in progress"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return replay_or_reject(stored, body_hash)
+
+    return wrapper
+
+
+def replay_or_reject(stored, body_hash):
+    if stored["hash"] != body_hash:
+        record_metric("mismatches")
+        return Response(
+            {"message": "Idempotency-Key was already used with a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    record_metric("hits")
+    return replay(stored)
+
+
+def claim(request, key, body_hash):
+    """Return a new processing record, or None if another request owns the key."""
+    now = timezone.now()
+    # Expired keys and abandoned claims can be taken over
+    IdempotencyKey.objects.filter(
+        user=request.user, key=key, expires_at__lte=now
+    ).delete()
+    IdempotencyKey.objects.filter(
+        user=request.user,
+        key=key,
+        status="processing",
+        updated_at__lte=now - settings.IDEMPOTENCY_PROCESSING_TIMEOUT,
+    ).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=request.user,
+                key=key,
+                endpoint=request.path,
+                request_hash=body_hash,
+                expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+            )
+    except IntegrityError:
+        return None
+
+
+def run_and_store(view_method, view, request, record, cache_key, args, kwargs):
+    """
+    Run the view and store its response in one transaction, so a committed
+    money movement always has its stored response. The claim stays locked
+    while the view runs: a retry that finds it past the processing timeout
+    waits for this transaction instead of taking the key over, and only
+    takes over claims whose request died with nothing committed.
+    """
+    try:
+        with transaction.atomic():
+            claimed = (
+                IdempotencyKey.objects.select_for_update()
+                .filter(pk=record.pk, status="processing")
+                .first()
+            )
+            if claimed is None:
+                # Taken over as abandoned before this request got to run
+                record_metric("conflicts")
+                return Response(
+                    {"message": "A request with this Idempotency-Key is in progress"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code >= 500:
+                # Server errors are not replayed so the client can retry for
+                # real; whatever the view wrote is rolled back with the claim
+                transaction.set_rollback(True)
+            else:
+                body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+                claimed.status = "completed"
+                claimed.response_status = response.status_code
+                claimed.response_body = body
+                claimed.save(
+                    update_fields=[
+                        "status",
+                        "response_status",
+                        "response_body",
+                        "updated_at",
+                    ]
+                )
+    except Exception:
+        record.delete()
+        raise
+
+    if response.status_code >= 500:
+        record.delete()
+        return response
+
+    stored = {"status": response.status_code, "body": body, "hash": record.request_hash}
+    ttl = (record.expires_at - timezone.now()).total_seconds()
+    cache.set(cache_key, stored, timeout=max(int(ttl), 1))
+    return response
+
+
+def wait_for_result(user, key, cache_key):
+    """Wait for the request owning ``key`` to finish and return its result."""
+    record_metric("waits")
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return stored
+        record = (
+            IdempotencyKey.objects.filter(user=user, key=key)
+            .only("status", "response_status", "response_body", "request_hash")
+            .first()
+        )
+        if record is None:
+            # The first request failed and released the key
+            return None
+        if record.status == "completed":
+            return {
+                "status": record.response_status,
+                "body": record.response_body,
+                "hash": record.request_hash,
+            }
+        time.sleep(POLL_INTERVAL)
+    return None
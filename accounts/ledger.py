@@ -0,0 +1,33 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Wallet
+
+
+class InsufficientFunds(Exception):
+    """Raised when a conditional debit finds less than the requested amount."""
+
+    def __init__(self, wallet_id):
+        self.wallet_id = wallet_id
+        super().__init__("Insufficient funds.")
+
+
+def apply_balance_changes(changes):
+    """
+    Apply ``{wallet_id: delta}`` balance changes with single-statement updates.
+
+    Debits only match while ``balance - reserved >= amount``, so concurrent
+    transfers can never overdraw a wallet, spend funds held for a card
+    authorization or pending payment, or lose an update. Wallets are updated in a
+    fixed order to keep row locks from deadlocking. Must run inside
+    ``transaction.atomic()``; returns the new balances keyed by wallet id.
+    """
+    now = timezone.now()
+    for wallet_id in sorted(changes, key=str):
+        delta = changes[wallet_id]
+        wallets = Wallet.objects.filter(pk=wallet_id)
+        if delta < 0:
+            wallets = wallets.filter(balance__gte=F("reserved") - delta)
+        if not wallets.update(balance=F("balance") + delta, updated_at=now):
+            raise InsufficientFunds(wallet_id)
+    return dict(Wallet.objects.filter(pk__in=changes).values_list("pk", "balance"))
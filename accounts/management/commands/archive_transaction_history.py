@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from accounts.archive import archive_cold_history
+from .send_monthly_statements import month_bounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transaction history older than HISTORY_ARCHIVE_AFTER_MONTHS "
+        "into compressed archive segments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before", help="YYYY-MM; archive the months before this one"
+        )
+        parser.add_argument(
+            "--segment-wallets",
+            type=int,
+            help="Wallets per segment (HISTORY_ARCHIVE_SEGMENT_WALLETS)",
+        )
+
+    def handle(self, *args, **options):
+        before = month_bounds(options["before"])[0] if options["before"] else None
+        archived = archive_cold_history(before, options["segment_wallets"])
+        for month, segments, rows in archived:
+            self.stdout.write(f"{month:%Y-%m}: {rows} rows in {segments} segments")
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {sum(rows for _, _, rows in archived)} rows")
+        )
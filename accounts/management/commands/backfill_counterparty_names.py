@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from accounts.models import TransactionHistory
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate the sender_name/receiver_name snapshots on transaction history "
+        "rows written before they existed, in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer")
+
+        pending = (
+            TransactionHistory.objects.filter(
+                Q(sender__isnull=False, sender_name__isnull=True)
+                | Q(receiver__isnull=False, receiver_name__isnull=True)
+            )
+            .select_related("sender", "receiver")
+            .only(
+                "pk",
+                "sender_name",
+                "receiver_name",
+                "sender__first_name",
+                "sender__last_name",
+                "sender__email",
+                "receiver__first_name",
+                "receiver__last_name",
+                "receiver__email",
+            )
+            .order_by("pk")
+        )
+
+        updated = 0
+        last_pk = None
+        while True:
+            batch_qs = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            for row in batch:
+                if row.sender is not None and row.sender_name is None:
+                    row.sender_name = row.sender.display_name
+                if row.receiver is not None and row.receiver_name is None:
+                    row.receiver_name = row.receiver.display_name
+            TransactionHistory.objects.bulk_update(
+                batch, ["sender_name", "receiver_name"]
+            )
+
+            updated += len(batch)
+            self.stdout.write(
+                f"Processed batch ending at {last_pk} ({updated} updated)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled names on {updated} rows"))
@@ -0,0 +1,188 @@
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from django.utils import timezone
+
+from accounts.models import TransactionHistory, Wallet
+from accounts.serializers import TransactionHistoryFilterSerializer
+from users.models import User
+
+BENCH_EMAIL_DOMAIN = "@history-bench.invalid"
+WORDS = [
+    "rent",
+    "salary",
+    "groceries",
+    "school",
+    "fees",
+    "fuel",
+    "airtime",
+    "data",
+    "refund",
+    "loan",
+    "repayment",
+    "gift",
+    "dinner",
+    "transport",
+    "electricity",
+    "church",
+    "savings",
+    "contribution",
+]
+FIRST_NAMES = ["Ada", "Bola", "Chidi", "Dayo", "Emeka", "Funmi", "Ife", "Kemi"]
+LAST_NAMES = ["Okafor", "Adeyemi", "Bello", "Eze", "Ogunleye", "Nwosu", "Musa"]
+
+QUERIES = {
+    "newest page": "",
+    "date range": "start_date={month_ago}&end_date={week_ago}",
+    "type + amount range": "type=debit&min_amount=5000&max_amount=20000",
+    "counterparty": "counterparty=okafor",
+    "narration search": "search=electricity",
+    "all filters": (
+        "start_date={year_ago}&type=credit&min_amount=1000"
+        "&counterparty=ada&search=salary"
+    ),
+}
+
+
+@contextmanager
+def explicit_created_at():
+    """Let bulk_create keep the synthetic timestamps instead of now()."""
+    field = TransactionHistory._meta.get_field("created_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a synthetic transaction history table and time the filtered "
+        "history queries against one heavy wallet. The synthetic rows are "
+        "deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000)
+        parser.add_argument("--wallets", type=int, default=100)
+        parser.add_argument(
+            "--target-share",
+            type=float,
+            default=0.1,
+            help="Share of the rows that belong to the queried wallet",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the synthetic rows"
+        )
+
+    def handle(self, *args, **options):
+        wallets = self.create_wallets(options["wallets"])
+        try:
+            self.fill(wallets, options)
+            self.benchmark(wallets[0].user, options["repeat"], options["page_size"])
+        finally:
+            if not options["keep"]:
+                TransactionHistory.objects.filter(wallet__in=wallets).delete()
+                User.objects.filter(pk__in=[w.user_id for w in wallets]).delete()
+
+    def create_wallets(self, count):
+        run = uuid.uuid4().hex[:8]
+        wallets = []
+        for i in range(count):
+            user = User(
+                email=f"bench-{run}-{i}{BENCH_EMAIL_DOMAIN}",
+                first_name=random.choice(FIRST_NAMES),
+                last_name=random.choice(LAST_NAMES),
+                phone_number=f"+{run[:6]}{i:05d}",
+                nin=uuid.uuid4().hex,
+                bvn=uuid.uuid4().hex,
+                account_number=User.objects.generate_account_number(),
+            )
+            user.save()
+            wallets.append(
+                Wallet.objects.create(
+                    user=user, account_number=user.account_number, bvn=user.bvn
+                )
+            )
+        return wallets
+
+    def fill(self, wallets, options):
+        total, batch_size = options["rows"], options["batch_size"]
+        target, others = wallets[0], wallets[1:] or wallets
+        now = timezone.now()
+        started = time.perf_counter()
+
+        with explicit_created_at():
+            for offset in range(0, total, batch_size):
+                rows = []
+                for _ in range(min(batch_size, total - offset)):
+                    wallet = (
+                        target
+                        if random.random() < options["target_share"]
+                        else random.choice(others)
+                    )
+                    counterparty = random.choice(wallets)
+                    debit = random.random() < 0.5
+                    sender, receiver = (
+                        (wallet, counterparty) if debit else (counterparty, wallet)
+                    )
+                    rows.append(
+                        TransactionHistory(
+                            wallet=wallet,
+                            amount=Decimal(random.randint(101, 50000)),
+                            type="debit" if debit else "credit",
+                            sender_id=sender.user_id,
+                            receiver_id=receiver.user_id,
+                            sender_name=sender.user.display_name,
+                            receiver_name=receiver.user.display_name,
+                            narration=" ".join(random.sample(WORDS, 3)),
+                            created_at=now
+                            - timedelta(seconds=random.randint(0, 3 * 365 * 86400)),
+                            balance_after_transaction=Decimal("0.00"),
+                        )
+                    )
+                TransactionHistory.objects.bulk_create(rows)
+                self.stdout.write(f"Inserted {offset + len(rows)}/{total} rows")
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE accounts_transactionhistory")
+        self.stdout.write(f"Filled in {time.perf_counter() - started:.1f}s")
+
+    def benchmark(self, user, repeat, page_size):
+        today = timezone.localdate()
+        dates = {
+            "week_ago": today - timedelta(days=7),
+            "month_ago": today - timedelta(days=30),
+            "year_ago": today - timedelta(days=365),
+        }
+        for label, template in QUERIES.items():
+            params = QueryDict(template.format(**dates))
+            filters = TransactionHistoryFilterSerializer(data=params)
+            filters.is_valid(raise_exception=True)
+            queryset = filters.filter_queryset(
+                TransactionHistory.objects.for_user(user)
+            ).order_by("-created_at", "-pk")[:page_size]
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{label}: {len(rows)} rows, "
+                f"p50 {statistics.median(timings):.1f}ms, p95 {p95:.1f}ms"
+            )
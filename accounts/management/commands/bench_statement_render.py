@@ -0,0 +1,95 @@
+import multiprocessing
+import random
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+MODES = {
+    "cold": "new renderer per PDF (previous behaviour, minus the CDN fetch)",
+    "warm": "shared warm renderer",
+}
+
+
+def synthetic_statement(rows):
+    """An unsaved user and ``rows`` unsaved transactions to render."""
+    from accounts.models import TransactionHistory
+    from users.models import User
+
+    user = User(
+        first_name="Bench",
+        last_name="Merchant",
+        email="bench@statement.invalid",
+        account_number="0000000000",
+    )
+    now = timezone.now()
+    balance = Decimal("1000000.00")
+    transactions = []
+    for i in range(rows):
+        amount = Decimal(random.randint(101, 50000))
+        debit = random.random() < 0.5
+        balance += -amount if debit else amount
+        transactions.append(
+            TransactionHistory(
+                amount=amount,
+                type="debit" if debit else "credit",
+                sender_name="Bench Merchant" if debit else f"Customer {i}",
+                receiver_name=f"Supplier {i}" if debit else "Bench Merchant",
+                narration=f"Invoice {i}",
+                balance_after_transaction=balance,
+                created_at=now - timedelta(minutes=i),
+            )
+        )
+    return user, transactions
+
+
+def run_mode(mode, rows, renders):
+    """Render ``renders`` statements in this process; return timing and peak RSS."""
+    from accounts import rendering
+    from accounts.statements import render_statement
+
+    user, transactions = synthetic_statement(rows)
+    today = timezone.localdate()
+    if mode == "warm":
+        rendering.get_renderer().warm()
+    started = time.perf_counter()
+    for _ in range(renders):
+        if mode == "cold":
+            rendering._renderer = None
+        render_statement(user, transactions, today - timedelta(days=30), today)
+    elapsed = time.perf_counter() - started
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure statement PDFs per minute and peak RSS with a cold renderer "
+        "per PDF and with the shared warm renderer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--renders", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, renders = options["rows"], options["renders"]
+        for mode, description in MODES.items():
+            # A fresh process per mode so peak RSS is not shared
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            ) as pool:
+                elapsed, peak_rss_kb = pool.submit(
+                    run_mode, mode, rows, renders
+                ).result()
+            self.stdout.write(
+                f"{mode} ({description}): {renders} x {rows}-row PDFs in "
+                f"{elapsed:.1f}s, {renders * 60 / elapsed:.2f} PDFs/min, "
+                f"peak RSS {peak_rss_kb / 1024:.0f} MiB"
+            )
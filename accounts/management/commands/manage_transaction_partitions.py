@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.partitions import attached_partitions, is_partitioned, maintain_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly TransactionHistory partitions and detach "
+        "old ones (PostgreSQL only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            help="Months to create past this one (TRANSACTION_PARTITION_MONTHS_AHEAD)",
+        )
+        parser.add_argument(
+            "--retain-months",
+            type=int,
+            help=(
+                "Detach partitions older than this many months; 0 keeps all "
+                "(TRANSACTION_PARTITION_RETAIN_MONTHS)"
+            ),
+        )
+        parser.add_argument(
+            "--concurrently",
+            action="store_true",
+            help="Detach without blocking queries on the table (slower)",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write("TransactionHistory is only partitioned on PostgreSQL")
+            return
+
+        created, detached = maintain_partitions(
+            months_ahead=options["months_ahead"],
+            retain_months=options["retain_months"],
+            concurrently=options["concurrently"],
+        )
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        for name in detached:
+            self.stdout.write(f"Detached {name}")
+        with connection.cursor() as cursor:
+            partitions = attached_partitions(cursor)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(partitions)} partitions attached"
+                + (f", {partitions[0]} to {partitions[-1]}" if partitions else "")
+            )
+        )
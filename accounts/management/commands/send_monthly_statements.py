@@ -0,0 +1,82 @@
+import calendar
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.statement_runs import (
+    plan_statement_run,
+    previous_month,
+    run_progress,
+    run_statement_chunks,
+)
+from accounts.tasks import process_statement_run
+
+
+def month_bounds(value):
+    try:
+        year, month = (int(part) for part in value.split("-"))
+        return date(year, month, 1), date(
+            year, month, calendar.monthrange(year, month)[1]
+        )
+    except ValueError:
+        raise CommandError(f"Expected a month as YYYY-MM, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and email every wallet's statement for a month. Re-running "
+        "resumes the month's run from its last finished chunk; several "
+        "copies can run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="YYYY-MM, defaults to last month")
+        parser.add_argument(
+            "--chunk-size", type=int, help="Wallets per chunk for a new run"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Queue this many Celery workers instead of processing here",
+        )
+        parser.add_argument(
+            "--status", action="store_true", help="Only report the run's progress"
+        )
+
+    def handle(self, *args, **options):
+        period = month_bounds(options["month"]) if options["month"] else None
+        run = plan_statement_run(
+            *(period or previous_month()), chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(
+            f"Statement run {run.pk} for {run.period_start} to {run.period_end}: "
+            f"{run.total_wallets} wallets in {run.total_chunks} chunks"
+        )
+
+        if options["workers"]:
+            for _ in range(options["workers"]):
+                process_statement_run.delay(str(run.pk))
+            self.stdout.write(f"Queued {options['workers']} workers")
+        elif not options["status"]:
+
+            def report(chunk, sent):
+                if sent is None:
+                    self.stdout.write(f"Chunk {chunk.pk} was taken over, skipped")
+                else:
+                    self.stdout.write(f"Chunk {chunk.pk}: sent {sent} statements")
+
+            sent = run_statement_chunks(run, on_chunk=report)
+            self.stdout.write(f"Sent {sent} statements from this process")
+
+        progress = run_progress(run)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{progress['status']}: {progress['chunks_completed']}/"
+                f"{progress['total_chunks']} chunks, "
+                f"{progress['statements_sent']}/{progress['total_wallets']} "
+                f"statements in {progress['elapsed_seconds']}s, "
+                f"{progress['statements_per_minute']} statements/min, "
+                f"{progress['seconds_per_statement']}s per statement per worker"
+            )
+        )
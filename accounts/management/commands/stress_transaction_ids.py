@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.utils.ids import configured_node_id, transaction_id_generator
+
+
+def generate_ids(args):
+    count, threads = args
+    per_thread = count // threads
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        batches = list(
+            pool.map(
+                lambda _: [
+                    transaction_id_generator.next_str() for _ in range(per_thread)
+                ],
+                range(threads),
+            )
+        )
+    ordered = all(batch == sorted(batch) for batch in batches)
+    return [tx_id for batch in batches for tx_id in batch], ordered
+
+
+class Command(BaseCommand):
+    help = "Generate transaction ids across processes and threads and check uniqueness"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--count", type=int, default=100000, help="Ids per process")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        threads = options["threads"]
+        count = options["count"]
+        if configured_node_id() is not None:
+            raise CommandError(
+                "TRANSACTION_ID_NODE_ID pins one node id for every forked process; "
+                "unset it and set REDIS_URL so each process leases its own"
+            )
+
+        started = time.perf_counter()
+        # fork so every child starts from the parent's generator state, as
+        # gunicorn and celery workers do
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            results = pool.map(generate_ids, [(count, threads)] * processes)
+        elapsed = time.perf_counter() - started
+
+        ids = [tx_id for process_ids, _ in results for tx_id in process_ids]
+        duplicates = len(ids) - len(set(ids))
+        unordered = sum(not ordered for _, ordered in results)
+        self.stdout.write(
+            f"{len(ids)} ids from {processes} processes x {threads} threads "
+            f"in {elapsed:.2f}s ({len(ids) / elapsed:,.0f}/s): "
+            f"{duplicates} duplicates, {unordered} processes out of order"
+        )
+        if duplicates or unordered:
+            raise CommandError(
+                "Transaction id generator produced duplicate or unordered ids"
+            )
+        self.stdout.write(self.style.SUCCESS("All ids unique and time-ordered"))
@@ -0,0 +1,138 @@
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q, Sum
+
+from accounts.models import TransactionHistory, Wallet
+from accounts.serializers import SendMoneySerializer
+from notifications.models import OutboxMessage
+from users.models import User
+
+STARTING_BALANCE = Decimal("10000.00")
+STRESS_EMAIL_DOMAIN = "@lumipay.invalid"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent transfers between throwaway wallets and verify that no "
+        "money is created or lost. "
+        "The wallets are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallets", type=int, default=10)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--transfers", type=int, default=100, help="Transfers per thread"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the wallets for inspection"
+        )
+
+    def handle(self, *args, **options):
+        users = self.create_wallets(options["wallets"])
+        try:
+            self.run(users, options["threads"], options["transfers"])
+        finally:
+            if not options["keep"]:
+                User.objects.filter(pk__in=[u.pk for u in users]).delete()
+                # Drop the queued alerts for the throwaway addresses
+                OutboxMessage.objects.filter(
+                    status="pending", args__0__endswith=STRESS_EMAIL_DOMAIN
+                ).delete()
+
+    def create_wallets(self, count):
+        run = uuid.uuid4().hex[:8]
+        users = []
+        for i in range(count):
+            user = User(
+                email=f"stress-{run}-{i}{STRESS_EMAIL_DOMAIN}",
+                first_name="Stress",
+                last_name=str(i),
+                phone_number=f"+{run[:6]}{i:05d}",
+                nin=uuid.uuid4().hex,
+                bvn=uuid.uuid4().hex,
+                account_number=User.objects.generate_account_number(),
+            )
+            user.save()
+            Wallet.objects.create(
+                user=user,
+                account_number=user.account_number,
+                balance=STARTING_BALANCE,
+                bvn=user.bvn,
+            )
+            users.append(user)
+        return users
+
+    def run(self, users, threads, transfers):
+        wallets = Wallet.objects.filter(user__in=users)
+        expected_total = STARTING_BALANCE * len(users)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = sum(
+                pool.map(
+                    lambda _: self.transfer_loop(users, transfers), range(threads)
+                ),
+                Counter(),
+            )
+        elapsed = time.perf_counter() - started
+
+        total = wallets.aggregate(total=Sum("balance"))["total"]
+        overdrawn = wallets.filter(balance__lt=0).count()
+        mismatched = self.reconcile(wallets)
+
+        self.stdout.write(
+            f"{sum(outcomes.values())} transfers in {elapsed:.2f}s: "
+            + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+        )
+        self.stdout.write(
+            f"Total balance {total} (expected {expected_total}), "
+            f"{overdrawn} overdrawn wallets, {mismatched} wallets not matching history"
+        )
+        if total != expected_total or overdrawn or mismatched:
+            raise CommandError("Money was created or lost under concurrency")
+        self.stdout.write(self.style.SUCCESS("No money created or lost"))
+
+    def transfer_loop(self, users, transfers):
+        outcomes = Counter()
+        try:
+            for _ in range(transfers):
+                sender, recipient = random.sample(users, 2)
+                serializer = SendMoneySerializer(
+                    data={
+                        "amount": str(random.randint(101, 3000)),
+                        "recipient": recipient.account_number,
+                    },
+                    context={"request": SimpleNamespace(user=sender)},
+                )
+                try:
+                    if serializer.is_valid():
+                        serializer.save()
+                        outcomes["ok"] += 1
+                    else:
+                        outcomes["rejected"] += 1
+                except Exception as e:
+                    outcomes[type(e).__name__] += 1
+        finally:
+            connection.close()
+        return outcomes
+
+    def reconcile(self, wallets):
+        """Count wallets whose balance differs from start + credits - debits."""
+        mismatched = 0
+        for wallet in wallets:
+            sums = TransactionHistory.objects.filter(wallet=wallet).aggregate(
+                credits=Sum("amount", filter=Q(type="credit"), default=0),
+                debits=Sum("amount", filter=Q(type="debit"), default=0),
+            )
+            if STARTING_BALANCE + sums["credits"] - sums["debits"] != wallet.balance:
+                mismatched += 1
+        return mismatched
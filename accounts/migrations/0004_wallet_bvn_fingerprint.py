@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_transactionhistory_narration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="bvn_fingerprint",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+    ]
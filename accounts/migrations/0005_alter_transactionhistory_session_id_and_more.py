@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:00
+
+import accounts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_wallet_bvn_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transactionhistory",
+            name="session_id",
+            field=models.CharField(
+                default=accounts.models.random_session_id, max_length=20, unique=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transactionhistory",
+            name="transaction_id",
+            field=models.CharField(
+                default=accounts.models.random_transaction_id,
+                max_length=20,
+                unique=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0007_idempotencykey"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transactionhistory",
+            name="receiver_name",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="transactionhistory",
+            name="sender_name",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="transactionhistory",
+            index=models.Index(
+                fields=["wallet", "-created_at", "-id"], name="txn_wallet_created_idx"
+            ),
+        ),
+    ]
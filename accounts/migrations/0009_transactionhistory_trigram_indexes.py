@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Trigram indexes serve the icontains filters on narration and counterparty
+# names. They need pg_trgm and are skipped on other databases, where those
+# filters scan the rows of one wallet.
+TRIGRAM_INDEXES = {
+    "txn_narration_trgm_idx": "narration",
+    "txn_sender_name_trgm_idx": "sender_name",
+    "txn_receiver_name_trgm_idx": "receiver_name",
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON accounts_transactionhistory USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0008_transactionhistory_counterparty_names"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0010_statements"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatementRun",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("period_end", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("processing", "Processing"),
+                            ("completed", "Completed"),
+                        ],
+                        default="processing",
+                        max_length=10,
+                    ),
+                ),
+                ("total_chunks", models.PositiveIntegerField(default=0)),
+                ("total_wallets", models.PositiveIntegerField(default=0)),
+                ("statements_sent", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("period_start", "period_end"),
+                        name="unique_statement_run",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="StatementRunChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_wallet_id", models.UUIDField()),
+                ("last_wallet_id", models.UUIDField()),
+                ("wallet_count", models.PositiveIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("completed", "Completed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("claimed_at", models.DateTimeField(blank=True, null=True)),
+                ("statements_sent", models.PositiveIntegerField(default=0)),
+                ("duration", models.FloatField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="accounts.statementrun",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["run", "status"], name="statement_chunk_status_idx"
+                    )
+                ],
+            },
+        ),
+    ]
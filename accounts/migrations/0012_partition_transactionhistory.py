@@ -0,0 +1,131 @@
+from django.db import migrations
+from django.utils import timezone
+
+from accounts.partitions import (
+    PARTITIONED_TABLE,
+    add_months,
+    month_start,
+    partition_ddl,
+)
+
+# PostgreSQL only: rebuild accounts_transactionhistory as a table range
+# partitioned by month on created_at. A partitioned table's primary key and
+# unique constraints must include the partition key, so they become
+# (id, created_at), (transaction_id, created_at) and (session_id, created_at).
+# The database then no longer keeps transaction and session ids unique on
+# their own: they are time-ordered snowflake ids, unique by construction, and
+# TransactionHistory checks new ones on insert (check_transaction_ids). The
+# model keeps unique=True so other databases still enforce it. Every other
+# index and foreign key is recreated as it was.
+#
+# The rows are copied under an exclusive lock: run this in a maintenance
+# window on a large table.
+TABLE = PARTITIONED_TABLE
+NEW_TABLE = f"{TABLE}_rebuild"
+MONTHS_AHEAD = 3
+
+
+def table_layout(cursor):
+    """Primary key, unique constraints, other indexes and foreign keys of TABLE."""
+    cursor.execute(
+        """
+        SELECT con.conname, con.contype,
+               array_agg(att.attname ORDER BY cols.ordinality),
+               pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS cols(attnum, ordinality)
+        JOIN pg_attribute att
+          ON att.attrelid = con.conrelid AND att.attnum = cols.attnum
+        WHERE con.conrelid = %s::regclass AND con.contype IN ('p', 'u', 'f')
+        GROUP BY con.oid, con.conname, con.contype
+        """,
+        [TABLE],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(idx.indexrelid)
+        FROM pg_index idx
+        WHERE idx.indrelid = %s::regclass
+          AND NOT idx.indisunique AND NOT idx.indisprimary
+        """,
+        [TABLE],
+    )
+    # An index on a partitioned table is reported as "ON ONLY <table>"
+    indexes = [row[0].replace(" ON ONLY ", " ON ") for row in cursor.fetchall()]
+    return constraints, indexes
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [TABLE])
+    return cursor.fetchone()[0] == "p"
+
+
+def rebuild(cursor, partitioned):
+    constraints, indexes = table_layout(cursor)
+    if partitioned:
+        cursor.execute(
+            f"CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS "
+            f"INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"SELECT min(created_at), max(created_at) FROM {TABLE}")
+        oldest, newest = cursor.fetchone()
+        month = month_start(timezone.localtime(oldest or timezone.now()))
+        last = max(
+            add_months(month_start(timezone.localdate()), MONTHS_AHEAD),
+            month_start(timezone.localtime(newest or timezone.now())),
+        )
+        while month <= last:
+            cursor.execute(partition_ddl(month, table=NEW_TABLE))
+            month = add_months(month, 1)
+    else:
+        cursor.execute(
+            f"CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS "
+            f"INCLUDING CONSTRAINTS)"
+        )
+
+    cursor.execute(f"INSERT INTO {NEW_TABLE} SELECT * FROM {TABLE}")
+    cursor.execute(f"DROP TABLE {TABLE}")
+    cursor.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}")
+
+    for name, kind, columns, definition in constraints:
+        if kind == "f":
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+            continue
+        columns = [column for column in columns if column != "created_at"]
+        if partitioned:
+            columns.append("created_at")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} "
+            f"{'PRIMARY KEY' if kind == 'p' else 'UNIQUE'} ({', '.join(columns)})"
+        )
+    for definition in indexes:
+        cursor.execute(definition)
+    cursor.execute(f"ANALYZE {TABLE}")
+
+
+def partition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            rebuild(cursor, partitioned=True)
+
+
+def unpartition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            rebuild(cursor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0011_statement_runs"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:35
+
+import accounts.models
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0012_partition_transactionhistory"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedSegment",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("first_wallet_id", models.UUIDField()),
+                ("last_wallet_id", models.UUIDField()),
+                (
+                    "file",
+                    models.FileField(
+                        storage=accounts.models.history_archive_storage,
+                        upload_to="segments/",
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("row_count", models.PositiveIntegerField(default=0)),
+                ("sha256", models.CharField(max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["first_wallet_id", "last_wallet_id"],
+                        name="archived_segment_wallets_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+from django.utils import timezone
+
+from accounts.partitions import (
+    DEFAULT_PARTITION,
+    PARTITIONED_TABLE,
+    create_partitions,
+    default_partition_ddl,
+    month_start,
+)
+
+# PostgreSQL only: give the partitioned accounts_transactionhistory a DEFAULT
+# partition, so a row dated in a month without a partition is still stored
+# instead of failing the insert. Reversing moves any rows it holds into
+# monthly partitions first.
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE oid = %s::regclass", [PARTITIONED_TABLE]
+    )
+    return cursor.fetchone()[0] == "p"
+
+
+def add_default_partition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            cursor.execute(default_partition_ddl())
+
+
+def remove_default_partition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        cursor.execute(
+            f"SELECT min(created_at), max(created_at) FROM {DEFAULT_PARTITION}"
+        )
+        oldest, newest = cursor.fetchone()
+        if oldest is not None:
+            create_partitions(
+                month_start(timezone.localtime(oldest)),
+                month_start(timezone.localtime(newest)),
+                cursor,
+            )
+        cursor.execute(f"DROP TABLE {DEFAULT_PARTITION}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0014_wallet_holds"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_default_partition, remove_default_partition),
+    ]
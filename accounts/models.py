@@ -1,22 +1,22 @@
-from django.db import models
+from datetime import timedelta
+from django.db import IntegrityError, connections, models, router
 from django.conf import settings
-import uuid, random, string
+from django.core.files.storage import storages
+import uuid
+from .partitions import is_partitioned
+from .utils.ids import ID_LENGTH, id_generated_at, transaction_id_generator
 
+# Allowance for clock differences between the processes generating ids
+ID_CLOCK_SKEW = timedelta(minutes=5)
 
+
+# Kept under their original names because migrations reference them as defaults
 def random_transaction_id():
-    while True:
-        transaction_id = "".join(random.choices(string.digits, k=12))
-        if not TransactionHistory.objects.filter(
-            transaction_id=transaction_id
-        ).exists():
-            return transaction_id
+    return transaction_id_generator.next_str()
 
 
 def random_session_id():
-    while True:
-        session_id = "".join(random.choices(string.digits, k=12))
-        if not TransactionHistory.objects.filter(session_id=session_id).exists():
-            return session_id
+    return transaction_id_generator.next_str()
 
 
 class Wallet(models.Model):
@@ -24,13 +24,111 @@ class Wallet(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     account_number = models.CharField(max_length=10, unique=True)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=100000.00)
+    # Sum of the wallet's active holds; debits may only spend balance - reserved
+    reserved = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     bvn = models.CharField(max_length=128, unique=True)
+    bvn_fingerprint = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.email} - {self.account_number}"
 
+    @property
+    def available_balance(self):
+        return self.balance - self.reserved
+
+
+class WalletHold(models.Model):
+    """
+    Funds reserved on a wallet for a card authorization or pending payment.
+    The hold is captured (debited) or released later; holds still active at
+    ``expires_at`` are released by the sweeper.
+    """
+
+    STATUS_CHOICES = [
+        ("active", "Active"),
+        ("captured", "Captured"),
+        ("released", "Released"),
+        ("expired", "Expired"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="holds")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Drawn from the hold so far; the rest stays reserved while it is active
+    captured_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="active")
+    reference = models.CharField(max_length=64, unique=True)
+    narration = models.CharField(max_length=255, blank=True, default="")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The sweeper's scan for active holds past their expiry
+            models.Index(
+                fields=["expires_at"],
+                name="wallet_hold_active_expiry_idx",
+                condition=models.Q(status="active"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.account_number} - {self.amount} ({self.status})"
+
+    @property
+    def remaining(self):
+        return self.amount - self.captured_amount
+
+
+def check_transaction_ids(rows, using):
+    """
+    Check the ids of TransactionHistory ``rows`` about to be inserted: raise
+    ValueError for one that is not a snowflake id and IntegrityError for one
+    already in use.
+
+    On PostgreSQL the unique constraints include created_at (see
+    accounts.partitions) and would accept a reused id with another timestamp,
+    so existing rows are looked up here. A row is stored after its ids were
+    generated, so only rows created since the oldest id are read: the latest
+    partitions rather than the whole table. Ids from the generator never
+    collide; this catches ids copied or supplied from elsewhere, not two
+    concurrent inserts of the same one.
+    """
+    transaction_ids = [row.transaction_id for row in rows]
+    session_ids = [row.session_id for row in rows]
+    for value in transaction_ids + session_ids:
+        if id_generated_at(value) is None:
+            raise ValueError(f"{value!r} is not a snowflake id")
+    if len(set(transaction_ids)) < len(rows) or len(set(session_ids)) < len(rows):
+        raise IntegrityError("Duplicate transaction or session id")
+    if not rows or not is_partitioned(connections[using]):
+        return
+    since = min(map(id_generated_at, transaction_ids + session_ids)) - ID_CLOCK_SKEW
+    reused = TransactionHistory.objects.using(using).filter(
+        models.Q(transaction_id__in=transaction_ids)
+        | models.Q(session_id__in=session_ids),
+        created_at__gte=since,
+    )
+    if reused.exists():
+        raise IntegrityError("Transaction or session id already in use")
+
+
+class TransactionHistoryQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Rows of ``user``'s wallet, filtered on ``wallet_id`` without a join."""
+        wallet_id = Wallet.objects.filter(user=user).values("pk")[:1]
+        return self.filter(wallet_id=models.Subquery(wallet_id))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        check_transaction_ids(objs, self.db)
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class TransactionHistory(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -40,9 +138,11 @@ class TransactionHistory(models.Model):
         max_length=10, choices=[("credit", "Credit"), ("debit", "Debit")]
     )
     transaction_id = models.CharField(
-        max_length=12, unique=True, default=random_transaction_id
+        max_length=ID_LENGTH, unique=True, default=random_transaction_id
+    )
+    session_id = models.CharField(
+        max_length=ID_LENGTH, unique=True, default=random_session_id
     )
-    session_id = models.CharField(max_length=12, unique=True, default=random_session_id)
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=True,
@@ -57,6 +157,9 @@ class TransactionHistory(models.Model):
         related_name="received_transactions",
         on_delete=models.SET_NULL,
     )
+    # Counterparty display names as they were when the transaction was made
+    sender_name = models.CharField(max_length=255, null=True, blank=True)
+    receiver_name = models.CharField(max_length=255, null=True, blank=True)
     narration = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -64,5 +167,255 @@ class TransactionHistory(models.Model):
         max_digits=12, decimal_places=2, null=True, blank=True
     )
 
+    objects = TransactionHistoryQuerySet.as_manager()
+
+    # On PostgreSQL the table is range partitioned by month on created_at
+    # (see accounts.partitions); filter on created_at where possible so
+    # queries read only the partitions they need.
+    class Meta:
+        indexes = [
+            # History pages: one wallet, newest first, keyset on (created_at, id)
+            models.Index(
+                fields=["wallet", "-created_at", "-id"],
+                name="txn_wallet_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.wallet.user.email} - {self.amount} ({self.type})"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            using = kwargs.get("using") or router.db_for_write(
+                type(self), instance=self
+            )
+            check_transaction_ids([self], using)
+        super().save(*args, **kwargs)
+
+
+class BulkTransfer(models.Model):
+    """A batch of transfers from one wallet, e.g. a payroll upload."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="bulk_transfers"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    rows = models.JSONField(default=list)
+    results = models.JSONField(default=list)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Reserves the batch total; each chunk draws its debits from it
+    hold = models.OneToOneField(
+        WalletHold, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.wallet.account_number} - {self.total_rows} rows ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a money-moving request, replayed on client retries."""
+
+    STATUS_CHOICES = [("processing", "Processing"), ("completed", "Completed")]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="processing"
+    )
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.key} - {self.endpoint} ({self.status})"
+
+
+class StatementArtifact(models.Model):
+    """
+    A rendered statement PDF. It is reused for any request with the same
+    wallet, period and newest transaction, so new activity in the period
+    produces a fresh artifact.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="statement_artifacts"
+    )
+    period_start = models.DateField()
+    period_end = models.DateField()
+    last_transaction_id = models.CharField(max_length=ID_LENGTH, blank=True)
+    file = models.FileField(upload_to="statements/%Y/%m/")
+    size = models.PositiveIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wallet", "period_start", "period_end", "last_transaction_id"],
+                name="unique_statement_artifact",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.account_number} - {self.period_start} to {self.period_end}"
+
+
+class StatementJob(models.Model):
+    """A request to generate a statement, processed by a Celery worker."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="statement_jobs"
+    )
+    period_start = models.DateField()
+    period_end = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    artifact = models.ForeignKey(
+        StatementArtifact,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="jobs",
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.wallet.account_number} - {self.period_start} to {self.period_end} ({self.status})"
+
+
+class StatementRun(models.Model):
+    """
+    The month-end mailing of every wallet's statement for one period. Wallets
+    are split into id-ordered chunks that workers claim independently.
+    """
+
+    STATUS_CHOICES = [
+        ("processing", "Processing"),
+        ("completed", "Completed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="processing"
+    )
+    total_chunks = models.PositiveIntegerField(default=0)
+    total_wallets = models.PositiveIntegerField(default=0)
+    statements_sent = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period_start", "period_end"], name="unique_statement_run"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.period_start} to {self.period_end} ({self.status})"
+
+
+class StatementRunChunk(models.Model):
+    """An id range of wallets in a ``StatementRun``; the run's checkpoint."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("completed", "Completed"),
+    ]
+
+    run = models.ForeignKey(
+        StatementRun, on_delete=models.CASCADE, related_name="chunks"
+    )
+    first_wallet_id = models.UUIDField()
+    last_wallet_id = models.UUIDField()
+    wallet_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    statements_sent = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["run", "status"], name="statement_chunk_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.run} - {self.first_wallet_id}..{self.last_wallet_id}"
+
+
+def history_archive_storage():
+    return storages["history_archive"]
+
+
+class ArchivedSegment(models.Model):
+    """
+    An immutable, compressed file of the transaction history rows of one
+    month for an id range of wallets, moved out of TransactionHistory by
+    accounts.archive. Its rows are read back transparently.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    month = models.DateField()
+    first_wallet_id = models.UUIDField()
+    last_wallet_id = models.UUIDField()
+    file = models.FileField(storage=history_archive_storage, upload_to="segments/")
+    size = models.PositiveBigIntegerField(default=0)
+    row_count = models.PositiveIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["first_wallet_id", "last_wallet_id"],
+                name="archived_segment_wallets_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.first_wallet_id}..{self.last_wallet_id}"
@@ -0,0 +1,158 @@
+import base64
+import binascii
+import json
+import uuid
+from itertools import islice
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 3  # Number of items per page
+    page_size_query_param = "page_size"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(created_at, id)``, newest first.
+
+    Each page is an indexed range scan from the cursor position, so it costs
+    the same at any depth, and rows inserted while a client pages do not
+    shift or repeat later pages. Clients follow the ``next``/``previous``
+    links; ``page_size`` is capped at ``max_page_size``. ``include_total=true``
+    adds a total that is exact up to ``max_total_count`` and a lower bound
+    beyond it.
+
+    Set ``archive`` to an ``accounts.archive.ArchivedHistory`` to continue
+    past the oldest live row into the wallet's archived rows.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    max_total_count = 1000
+    invalid_cursor_message = "Invalid cursor"
+    archive = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            position, reverse = None, False
+        else:
+            position, reverse = cursor
+        self.total = self.get_total(queryset, request)
+
+        if position is not None:
+            created_at, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+        ordering = ("created_at", "pk") if reverse else ("-created_at", "-pk")
+        if reverse:
+            # Archived rows are older than every live row, so come first
+            rows = self.archived_rows(position, reverse, page_size + 1)
+            rows += queryset.order_by(*ordering)[: page_size + 1 - len(rows)]
+        else:
+            rows = list(queryset.order_by(*ordering)[: page_size + 1])
+            if len(rows) <= page_size:
+                before = (rows[-1].created_at, rows[-1].pk) if rows else position
+                rows += self.archived_rows(before, reverse, page_size + 1 - len(rows))
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def archived_rows(self, position, reverse, limit):
+        if self.archive is None or limit <= 0:
+            return []
+        if reverse:
+            rows = self.archive.oldest_first(after=position)
+        else:
+            rows = self.archive.newest_first(before=position)
+        return list(islice(rows, limit))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_total(self, queryset, request):
+        if request.query_params.get("include_total", "").lower() not in ("1", "true"):
+            return None
+        # Counting a capped slice keeps the cost bounded on long histories
+        count = queryset[: self.max_total_count + 1].count()
+        if self.archive is not None and count <= self.max_total_count:
+            count += self.archive.count(self.max_total_count + 1 - count)
+        return {
+            "count": min(count, self.max_total_count),
+            "exact": count <= self.max_total_count,
+        }
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(data["c"])
+            pk = uuid.UUID(data["i"])
+            reverse = bool(data.get("r"))
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (created_at, pk), reverse
+
+    def encode_cursor(self, row, reverse=False):
+        data = {"c": row.created_at.isoformat(), "i": str(row.pk)}
+        if reverse:
+            data["r"] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_pagination_info(self):
+        info = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "page_size": len(self.page),
+        }
+        if self.total is not None:
+            info["total"] = self.total
+        return info
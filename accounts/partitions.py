@@ -0,0 +1,180 @@
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+# TransactionHistory is range partitioned by month on created_at on
+# PostgreSQL (migration 0012). Other databases keep a single table and the
+# functions here do nothing there.
+#
+# A partitioned table's primary key and unique constraints must include the
+# partition key, so on PostgreSQL they are (id, created_at),
+# (transaction_id, created_at) and (session_id, created_at): the database no
+# longer keeps transaction and session ids unique on their own.
+# TransactionHistory.save() and bulk_create() check new ids instead (see
+# accounts.models.check_transaction_ids).
+PARTITIONED_TABLE = "accounts_transactionhistory"
+# Takes rows no monthly partition covers, so an insert never fails for want
+# of a partition; create_partitions() moves them out when their month is added
+DEFAULT_PARTITION = f"{PARTITIONED_TABLE}_default"
+
+
+def is_partitioned(using=connection):
+    return using.vendor == "postgresql"
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITIONED_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def month_starts_at(month):
+    """Start of ``month`` in the current time zone."""
+    return timezone.make_aware(datetime(month.year, month.month, 1))
+
+
+def month_bound(month):
+    """Start of ``month`` in the current time zone, as a SQL literal."""
+    return month_starts_at(month).isoformat()
+
+
+def partition_ddl(month, table=PARTITIONED_TABLE):
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month_bound(month)}') "
+        f"TO ('{month_bound(add_months(month, 1))}')"
+    )
+
+
+def default_partition_ddl(table=PARTITIONED_TABLE):
+    return (
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"
+    )
+
+
+def attached_partitions(cursor):
+    """Names of the attached partitions, monthly ones oldest first."""
+    cursor.execute(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        ORDER BY child.relname
+        """,
+        [PARTITIONED_TABLE],
+    )
+    return [name for (name,) in cursor.fetchall()]
+
+
+def default_partition_has_rows(month, cursor):
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+        f"WHERE created_at >= %s AND created_at < %s)",
+        [month_starts_at(month), month_starts_at(add_months(month, 1))],
+    )
+    return cursor.fetchone()[0]
+
+
+def move_out_of_default(month, cursor):
+    """
+    Create the partition of ``month`` and move its rows out of the default
+    partition, which PostgreSQL will not do itself. Detaching locks the parent
+    table, so writers wait for the move rather than fail.
+    """
+    bounds = [month_starts_at(month), month_starts_at(add_months(month, 1))]
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"
+        )
+        cursor.execute(partition_ddl(month))
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {PARTITIONED_TABLE} SELECT * FROM moved
+            """,
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} "
+            f"ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+        )
+
+
+def create_partitions(first_month, last_month, cursor):
+    """Create the partitions for every month in the range; return new names."""
+    existing = set(attached_partitions(cursor))
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if partition_name(month) not in existing:
+            if DEFAULT_PARTITION in existing and default_partition_has_rows(
+                month, cursor
+            ):
+                move_out_of_default(month, cursor)
+            else:
+                cursor.execute(partition_ddl(month))
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(before_month, cursor, concurrently=False):
+    """
+    Detach the partitions of months before ``before_month``. Detached
+    partitions stay as standalone tables until they are archived or dropped.
+    Returns their names.
+    """
+    cutoff = partition_name(month_start(before_month))
+    detached = []
+    for name in attached_partitions(cursor):
+        # Names sort by month; anything else, like the default partition, is
+        # not a monthly partition
+        if not name.startswith(f"{PARTITIONED_TABLE}_y") or name >= cutoff:
+            continue
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}"
+            + (" CONCURRENTLY" if concurrently else "")
+        )
+        detached.append(name)
+    return detached
+
+
+def maintain_partitions(months_ahead=None, retain_months=None, concurrently=False):
+    """
+    Create partitions from this month to ``months_ahead`` months ahead and,
+    when ``retain_months`` is set, detach those older than that many months.
+    Returns the created and detached partition names.
+    """
+    if not is_partitioned():
+        return [], []
+    if months_ahead is None:
+        months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD
+    if retain_months is None:
+        retain_months = settings.TRANSACTION_PARTITION_RETAIN_MONTHS
+
+    this_month = month_start(timezone.localdate())
+    with connection.cursor() as cursor:
+        created = create_partitions(
+            this_month, add_months(this_month, months_ahead), cursor
+        )
+        detached = []
+        if retain_months:
+            detached = detach_partitions(
+                add_months(this_month, -retain_months), cursor, concurrently
+            )
+    return created, detached
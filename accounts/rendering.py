@@ -0,0 +1,277 @@
+import io
+import logging
+import mimetypes
+import os
+import re
+import threading
+
+import pydyf
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+logger = logging.getLogger(__name__)
+
+# Base URL of statement documents. The .invalid domain never resolves, so a
+# URL the fetcher does not recognise can never reach the network.
+ASSET_BASE_URL = "https://statement-assets.invalid"
+STATEMENT_STYLESHEETS = [
+    "accounts/vendor/fontawesome/css/all.min.css",
+    "accounts/css/statement.css",
+]
+
+
+def static_file_path(url):
+    """Local path of a static asset URL under ASSET_BASE_URL, or None."""
+    prefix = ASSET_BASE_URL + settings.STATIC_URL
+    if not url.startswith(prefix):
+        return None
+    relative_path = url[len(prefix) :].split("?", 1)[0].split("#", 1)[0]
+    try:
+        path = finders.find(relative_path)
+    except SuspiciousFileOperation:
+        return None
+    if path is None and settings.STATIC_ROOT:
+        # Collected assets when the app directories are not shipped
+        try:
+            candidate = safe_join(settings.STATIC_ROOT, relative_path)
+        except SuspiciousFileOperation:
+            return None
+        if os.path.isfile(candidate):
+            path = candidate
+    return path
+
+
+def local_url_fetcher(url, *args, **kwargs):
+    """
+    WeasyPrint ``url_fetcher`` that serves static assets from disk and refuses
+    every other URL, so a render never waits on the network.
+    """
+    if url.startswith("data:"):
+        return default_url_fetcher(url)
+    path = static_file_path(url)
+    if path is None:
+        raise ValueError(f"Statements may only load local static assets: {url}")
+    with open(path, "rb") as handle:
+        data = handle.read()
+    return {
+        "string": data,
+        "mime_type": mimetypes.guess_type(path)[0],
+        "redirected_url": url,
+        "filename": os.path.basename(path),
+    }
+
+
+# Reserved object numbers in a sectioned PDF, matching pydyf's layout
+PAGES_NUMBER, INFO_NUMBER, CATALOG_NUMBER = 1, 2, 3
+REFERENCE = re.compile(rb"(\d+) 0 R")
+
+
+def rewrite_references(value, remap, seen):
+    """Rewrite the indirect references inside a pydyf value, in place."""
+    if isinstance(value, bytes):
+        return REFERENCE.sub(remap, value)
+    if isinstance(value, str):
+        return REFERENCE.sub(remap, value.encode()).decode()
+    if isinstance(value, pydyf.String) or id(value) in seen:
+        return value
+    if isinstance(value, (dict, list, pydyf.Stream)):
+        seen.add(id(value))
+    if isinstance(value, pydyf.Stream):
+        # Content streams address resources by name; only the dictionary
+        # holds references
+        rewrite_references(value.extra, remap, seen)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = rewrite_references(item, remap, seen)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            value[index] = rewrite_references(item, remap, seen)
+    return value
+
+
+class SectionedPDFWriter:
+    """
+    Assemble one PDF from separately rendered WeasyPrint documents.
+
+    ``add_section`` is a WeasyPrint ``finisher``: it renumbers the section's
+    pydyf objects after those already written, points its pages at the shared
+    page tree and writes them to ``output`` straight away, so only one section
+    is ever held in memory. ``close`` writes the page tree, catalog and
+    cross-reference table. The outline and metadata of the first section are
+    kept.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.next_number = CATALOG_NUMBER + 1
+        self.kids = []
+        self.catalog = pydyf.Dictionary({"Type": "/Catalog"})
+        self.info = pydyf.Dictionary()
+        self.write_line(b"%PDF-1.7")
+        self.write_line(b"%\xf0\x9f\x96\xa4")
+
+    def write_line(self, content):
+        self.output.write(content + b"\n")
+        self.position += len(content) + 1
+
+    def write_object(self, object_):
+        self.offsets[object_.number] = self.position
+        self.write_line(object_.indirect)
+
+    def add_section(self, document, pdf):
+        mapping = {
+            pdf.pages.number: PAGES_NUMBER,
+            pdf.info.number: INFO_NUMBER,
+            pdf.catalog.number: CATALOG_NUMBER,
+        }
+        objects = [
+            object_
+            for object_ in pdf.objects
+            if object_.free != "f" and object_.number not in mapping
+        ]
+        for object_ in objects:
+            mapping[object_.number] = self.next_number
+            self.next_number += 1
+
+        def remap(match):
+            return b"%d 0 R" % mapping[int(match.group(1))]
+
+        seen = set()
+        for object_ in objects:
+            rewrite_references(object_, remap, seen)
+        first_section = not self.kids
+        self.kids.extend(mapping[number] for number in pdf.pages["Kids"][::3])
+        for object_ in objects:
+            object_.number = mapping[object_.number]
+            self.write_object(object_)
+
+        if first_section:
+            for key, value in pdf.catalog.items():
+                if key not in ("Type", "Pages"):
+                    self.catalog[key] = rewrite_references(value, remap, seen)
+            self.info.update(pdf.info)
+
+        # Leave WeasyPrint only the empty document skeleton to serialize
+        del pdf.objects[CATALOG_NUMBER + 1 :]
+        pdf.pages["Kids"] = pydyf.Array()
+
+    def close(self):
+        pages = pydyf.Dictionary(
+            {
+                "Type": "/Pages",
+                "Kids": pydyf.Array(b"%d 0 R" % number for number in self.kids),
+                "Count": len(self.kids),
+            }
+        )
+        self.catalog["Pages"] = b"%d 0 R" % PAGES_NUMBER
+        for number, object_ in (
+            (PAGES_NUMBER, pages),
+            (INFO_NUMBER, self.info),
+            (CATALOG_NUMBER, self.catalog),
+        ):
+            object_.number = number
+            self.write_object(object_)
+
+        xref_position = self.position
+        self.write_line(b"xref")
+        self.write_line(b"0 %d" % self.next_number)
+        self.write_line(b"0000000000 65535 f ")
+        for number in range(1, self.next_number):
+            self.write_line(b"%010d 00000 n " % self.offsets[number])
+        self.write_line(b"trailer")
+        self.write_line(
+            b"<</Size %d /Root %d 0 R /Info %d 0 R>>"
+            % (self.next_number, CATALOG_NUMBER, INFO_NUMBER)
+        )
+        self.write_line(b"startxref")
+        self.write_line(b"%d" % xref_position)
+        self.write_line(b"%%EOF")
+
+
+class StatementRenderer:
+    """
+    Renders statement HTML to PDF with warm state: the stylesheets are parsed
+    and their fonts loaded once, and fetched assets and images stay cached in
+    memory for the life of the process.
+    """
+
+    def __init__(self):
+        self.font_config = FontConfiguration()
+        self.fetched = {}
+        self.image_cache = {}
+        self.stylesheets = [
+            CSS(
+                url=ASSET_BASE_URL + static(path),
+                url_fetcher=self.fetch,
+                font_config=self.font_config,
+            )
+            for path in STATEMENT_STYLESHEETS
+        ]
+
+    def fetch(self, url, *args, **kwargs):
+        if url not in self.fetched:
+            self.fetched[url] = local_url_fetcher(url)
+        return dict(self.fetched[url])
+
+    def render(self, html_string):
+        return HTML(
+            string=html_string, base_url=ASSET_BASE_URL + "/", url_fetcher=self.fetch
+        ).write_pdf(
+            stylesheets=self.stylesheets,
+            font_config=self.font_config,
+            cache=self.image_cache,
+        )
+
+    def render_sections(self, html_sections, output):
+        """
+        Render each HTML string as its own document and write them to
+        ``output`` as one PDF. Memory is bounded by the largest section.
+        """
+        writer = SectionedPDFWriter(output)
+        for html_string in html_sections:
+            HTML(
+                string=html_string,
+                base_url=ASSET_BASE_URL + "/",
+                url_fetcher=self.fetch,
+            ).write_pdf(
+                io.BytesIO(),
+                stylesheets=self.stylesheets,
+                font_config=self.font_config,
+                cache=self.image_cache,
+                finisher=writer.add_section,
+            )
+        writer.close()
+
+    def warm(self):
+        """Render a one-line document so fonts and layout code are loaded."""
+        self.render('<p><i class="fas fa-file-invoice-dollar"></i> Warm</p>')
+
+
+_renderer = None
+_renderer_pid = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """The process-wide renderer, created on first use in each process."""
+    global _renderer, _renderer_pid
+    with _renderer_lock:
+        if _renderer is None or _renderer_pid != os.getpid():
+            _renderer = StatementRenderer()
+            _renderer_pid = os.getpid()
+        return _renderer
+
+
+def warm_renderer():
+    try:
+        get_renderer().warm()
+    except Exception:
+        # A cold renderer still works; don't keep the worker from starting
+        logger.exception("Could not warm the statement renderer")
@@ -1,13 +1,47 @@
+import csv
+import io
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from users.models import User
-from .models import Wallet, TransactionHistory
-from lumipay.tasks import send_transaction_email
+from .models import Wallet, TransactionHistory, BulkTransfer, StatementJob
+from .ledger import InsufficientFunds, apply_balance_changes
+from users.utils.account_numbers import is_valid_account_number
+from notifications.service import notify
+
+
+def validate_account_number_format(value):
+    # Reject malformed numbers before they reach the database
+    if len(value) != 10 or not value.isdigit():
+        raise ValidationError("Account number must be 10 digits.")
+    if settings.ACCOUNT_NUMBER_CHECK_DIGIT_REQUIRED and not is_valid_account_number(
+        value
+    ):
+        raise ValidationError("Invalid account number.")
+    return value
+
+
+def check_transfer(sender_wallet, recipient_wallet, amount):
+    """Transfer rules shared by single and bulk transfers."""
+    if recipient_wallet is None:
+        raise ValidationError("Recipient wallet not found.")
+
+    if amount <= 100:
+        raise ValidationError("Amount must be greater than 100.")
+
+    if sender_wallet == recipient_wallet:
+        raise ValidationError("You cannot send money to yourself.")
 
 
 class SendMoneySerializer(serializers.ModelSerializer):
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal("0.01")
+    )
     recipient = serializers.CharField(max_length=10)  # account number of recipient
     narration = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
 
@@ -24,6 +58,9 @@ class SendMoneySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["transaction_id", "session_id", "created_at", "type"]
 
+    def validate_recipient(self, value):
+        return validate_account_number_format(value)
+
     def validate(self, data):
         request = self.context.get("request")
         sender = request.user
@@ -31,27 +68,25 @@ class SendMoneySerializer(serializers.ModelSerializer):
         amount = data.get("amount")
         narration = data.get("narration")
 
-        # 1. Get sender’s wallet
-        try:
-            sender_wallet = Wallet.objects.get(user=sender)
-        except Wallet.DoesNotExist:
-            raise ValidationError("Sender wallet not found.")
-
-        # 2. Get recipient’s wallet
-        try:
-            recipient_wallet = Wallet.objects.get(account_number=recipient_account)
-        except Wallet.DoesNotExist:
-            raise ValidationError("Recipient wallet not found.")
+        # 1. Get sender’s and recipient’s wallets (with users) in one query
+        wallets = Wallet.objects.select_related("user").filter(
+            Q(user=sender) | Q(account_number=recipient_account)
+        )
+        sender_wallet = recipient_wallet = None
+        for wallet in wallets:
+            if wallet.user_id == sender.pk:
+                sender_wallet = wallet
+            if wallet.account_number == recipient_account:
+                recipient_wallet = wallet
 
-        if amount <= 100:
-            raise ValidationError("Amount must be greater than 100.")
+        if sender_wallet is None:
+            raise ValidationError("Sender wallet not found.")
 
-        # 3. Self-transfer check
-        if sender_wallet == recipient_wallet:
-            raise ValidationError("You cannot send money to yourself.")
+        # 2. Recipient, amount and self-transfer checks
+        check_transfer(sender_wallet, recipient_wallet, amount)
 
-        # 4. Balance check
-        if sender_wallet.balance < amount:
+        # 3. Balance check
+        if sender_wallet.available_balance < amount:
             raise ValidationError("Insufficient funds.")
 
         # attach to validated data
@@ -66,53 +101,129 @@ class SendMoneySerializer(serializers.ModelSerializer):
         narration = validated_data["narration"]
 
         with transaction.atomic():
-            # 1. Update balances
-            sender_wallet.balance -= amount
-            sender_wallet.save()
-            recipient_wallet.balance += amount
-            recipient_wallet.save()
+            # 1. Update balances with conditional single-statement updates
+            try:
+                balances = apply_balance_changes(
+                    {sender_wallet.pk: -amount, recipient_wallet.pk: amount}
+                )
+            except InsufficientFunds:
+                raise ValidationError("Insufficient funds.")
+            sender_wallet.balance = balances[sender_wallet.pk]
+            recipient_wallet.balance = balances[recipient_wallet.pk]
 
             sender_user = sender_wallet.user
-            receiver_user = User.objects.get(
-                account_number=recipient_wallet.account_number
-            )
+            receiver_user = recipient_wallet.user
 
-            # 2. Record both transactions
-            debit_txn = TransactionHistory.objects.create(
-                wallet=sender_wallet,
-                amount=amount,
-                type="debit",
-                sender=sender_user,
-                receiver=receiver_user,
-                narration=narration,
-                balance_after_transaction=sender_wallet.balance,
+            # 2. Record both transactions in one insert
+            debit_txn, _ = TransactionHistory.objects.bulk_create(
+                [
+                    TransactionHistory(
+                        wallet=sender_wallet,
+                        amount=amount,
+                        type="debit",
+                        sender=sender_user,
+                        receiver=receiver_user,
+                        sender_name=sender_user.display_name,
+                        receiver_name=receiver_user.display_name,
+                        narration=narration,
+                        balance_after_transaction=sender_wallet.balance,
+                    ),
+                    TransactionHistory(
+                        wallet=recipient_wallet,
+                        amount=amount,
+                        type="credit",
+                        sender=sender_user,
+                        receiver=receiver_user,
+                        sender_name=sender_user.display_name,
+                        receiver_name=receiver_user.display_name,
+                        narration=narration,
+                        balance_after_transaction=recipient_wallet.balance,
+                    ),
+                ]
             )
 
-            TransactionHistory.objects.create(
-                wallet=recipient_wallet,
-                amount=amount,
-                type="credit",
-                sender=sender_user,
-                receiver=receiver_user,
-                narration=narration,
-                balance_after_transaction=sender_wallet.balance,
-            )
-            # Update user balance
-            sender_wallet.user.balance = sender_wallet.balance
-            sender_wallet.user.save()
-            recipient_wallet.user.balance = recipient_wallet.balance
-            recipient_wallet.user.save()
-
-            send_transaction_email.delay(
-                sender_wallet.user.email,
-                recipient_wallet.user.email,
-                str(amount),
-                debit_txn.transaction_id,
+            notify(
+                "transaction",
+                [sender_wallet.user.email, recipient_wallet.user.email],
+                amount=str(amount),
+                transaction_id=debit_txn.transaction_id,
             )
 
         return debit_txn
 
 
+# Bulk transfer serializers
+class BulkTransferSerializer(serializers.Serializer):
+    """Accepts either a JSON list of transfers or a CSV upload."""
+
+    transfers = serializers.ListField(
+        child=serializers.DictField(), required=False, allow_empty=False
+    )
+    file = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        transfers = attrs.get("transfers")
+        upload = attrs.get("file")
+        if bool(transfers) == bool(upload):
+            raise ValidationError("Provide either a transfers list or a CSV file.")
+
+        if upload:
+            try:
+                text = upload.read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                raise ValidationError("CSV file must be UTF-8 encoded.")
+            reader = csv.DictReader(io.StringIO(text))
+            if not {"recipient", "amount"} <= set(reader.fieldnames or []):
+                raise ValidationError(
+                    "CSV file must have recipient, amount and narration columns."
+                )
+            transfers = list(reader)
+
+        if not transfers:
+            raise ValidationError("No transfers found.")
+        if len(transfers) > settings.BULK_TRANSFER_MAX_ROWS:
+            raise ValidationError(
+                f"A bulk transfer can have at most {settings.BULK_TRANSFER_MAX_ROWS} rows."
+            )
+
+        # Rows are validated one by one when the batch runs, so a bad row is
+        # reported in the results instead of rejecting the whole upload
+        attrs["rows"] = [
+            {
+                "recipient": str(row.get("recipient") or "").strip(),
+                "amount": str(row.get("amount") or "").strip(),
+                "narration": str(row.get("narration") or "").strip(),
+            }
+            for row in transfers
+        ]
+        return attrs
+
+
+class BulkTransferStatusSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BulkTransfer
+        fields = [
+            "id",
+            "status",
+            "total_rows",
+            "processed_rows",
+            "progress",
+            "succeeded",
+            "failed",
+            "total_amount",
+            "results",
+            "created_at",
+            "updated_at",
+        ]
+
+    def get_progress(self, obj):
+        if not obj.total_rows:
+            return 100
+        return round(obj.processed_rows * 100 / obj.total_rows)
+
+
 # Get Transaction History
 class TransactionHistorySerializer(serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
@@ -138,28 +249,161 @@ class TransactionHistorySerializer(serializers.ModelSerializer):
         return "₦{:,.2f}".format(obj.balance_after_transaction)
 
     def get_sender_name(self, obj):
-        sender = obj.sender
-        if not sender:
-            return None
-        # Prefer full name, else username or email
-        return (
-            f"{sender.first_name} {sender.last_name}".strip()
-            or sender.username
-            or sender.email
-        )
+        # Names are snapshotted at write time; rows not yet covered by
+        # backfill_counterparty_names fall back to the user
+        if obj.sender_name is not None or not obj.sender_id:
+            return obj.sender_name
+        return obj.sender.display_name
 
     def get_receiver_name(self, obj):
-        receiver = obj.receiver
-        if not receiver:
-            return None
-        return (
-            f"{receiver.first_name} {receiver.last_name}".strip()
-            or receiver.username
-            or receiver.email
+        if obj.receiver_name is not None or not obj.receiver_id:
+            return obj.receiver_name
+        return obj.receiver.display_name
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class TransactionHistoryFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the transaction history endpoint."""
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    type = serializers.ChoiceField(choices=["credit", "debit"], required=False)
+    min_amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    max_amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=False
+    )
+    counterparty = serializers.CharField(max_length=100, required=False)
+    search = serializers.CharField(max_length=100, required=False)
+
+    def validate(self, attrs):
+        start, end = attrs.get("start_date"), attrs.get("end_date")
+        if start and end and start > end:
+            raise ValidationError("start_date must be on or before end_date")
+        low, high = attrs.get("min_amount"), attrs.get("max_amount")
+        if low is not None and high is not None and low > high:
+            raise ValidationError("min_amount must not exceed max_amount")
+        return attrs
+
+    def filter_queryset(self, queryset):
+        """
+        Apply the validated filters. Dates and amounts narrow the
+        (wallet, created_at) index range; the text filters are ``icontains``,
+        which PostgreSQL serves from the trigram indexes.
+        """
+        data = self.validated_data
+        # Compare created_at with datetimes, not its date, so the index is used
+        if "start_date" in data:
+            queryset = queryset.filter(
+                created_at__gte=start_of_day(data["start_date"])
+            )
+        if "end_date" in data:
+            queryset = queryset.filter(
+                created_at__lt=start_of_day(data["end_date"] + timedelta(days=1))
+            )
+        if "type" in data:
+            queryset = queryset.filter(type=data["type"])
+        if "min_amount" in data:
+            queryset = queryset.filter(amount__gte=data["min_amount"])
+        if "max_amount" in data:
+            queryset = queryset.filter(amount__lte=data["max_amount"])
+        if "counterparty" in data:
+            # The counterparty is the receiver of a debit and the sender of a credit
+            name = data["counterparty"]
+            queryset = queryset.filter(
+                Q(type="debit", receiver_name__icontains=name)
+                | Q(type="credit", sender_name__icontains=name)
+            )
+        if "search" in data:
+            queryset = queryset.filter(narration__icontains=data["search"])
+        return queryset
+
+    def filters_rows(self):
+        """Whether a filter other than the dates applies."""
+        return bool(set(self.validated_data) - {"start_date", "end_date"})
+
+    def created_at_range(self):
+        """``(start, end)`` datetimes the dates allow; either may be None."""
+        data = self.validated_data
+        start = start_of_day(data["start_date"]) if "start_date" in data else None
+        end = (
+            start_of_day(data["end_date"] + timedelta(days=1))
+            if "end_date" in data
+            else None
         )
+        return start, end
+
+    def matches(self, txn):
+        """``filter_queryset`` for a single row, e.g. one read from the archive."""
+        data = self.validated_data
+        start, end = self.created_at_range()
+        if start is not None and txn.created_at < start:
+            return False
+        if end is not None and txn.created_at >= end:
+            return False
+        if "type" in data and txn.type != data["type"]:
+            return False
+        if "min_amount" in data and txn.amount < data["min_amount"]:
+            return False
+        if "max_amount" in data and txn.amount > data["max_amount"]:
+            return False
+        if "counterparty" in data:
+            name = txn.receiver_name if txn.type == "debit" else txn.sender_name
+            if data["counterparty"].lower() not in (name or "").lower():
+                return False
+        if "search" in data:
+            if data["search"].lower() not in (txn.narration or "").lower():
+                return False
+        return True
+
+
+class StatementRequestSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField(required=False)
 
+    def validate(self, attrs):
+        today = timezone.localdate()
+        attrs.setdefault("end_date", today)
+        if attrs["start_date"] > attrs["end_date"]:
+            raise ValidationError("start_date must be on or before end_date")
+        if attrs["end_date"] > today:
+            raise ValidationError("end_date cannot be in the future")
+        return attrs
+
+
+class StatementJobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StatementJob
+        fields = [
+            "id",
+            "url",
+            "status",
+            "period_start",
+            "period_end",
+            "download_url",
+            "error",
+            "created_at",
+            "updated_at",
+        ]
 
+    def get_url(self, obj):
+        request = self.context.get("request")
+        url = reverse("statement_job_detail", kwargs={"id": obj.id})
+        return request.build_absolute_uri(url) if request else url
 
+    def get_download_url(self, obj):
+        if obj.status != "completed" or obj.artifact_id is None:
+            return None
+        request = self.context.get("request")
+        url = reverse("statement_job_download", kwargs={"id": obj.id})
+        return request.build_absolute_uri(url) if request else url
 
 
 # Top up wallet serializer
@@ -176,6 +420,10 @@ class TopUpWalletSerializer(serializers.ModelSerializer):
         if value <= 99:
             raise serializers.ValidationError("You must deposit at least ₦100")
         return value
+
+    def validate_account_number(self, value):
+        return validate_account_number_format(value)
+
     def create(self, validated_data):
         account_number = validated_data.pop('account_number')
         amount = validated_data.pop('amount')
@@ -183,8 +431,8 @@ class TopUpWalletSerializer(serializers.ModelSerializer):
         try:
             wallet = Wallet.objects.get(account_number=account_number)
             with transaction.atomic():
-                wallet.balance += amount
-                wallet.save()
+                balances = apply_balance_changes({wallet.pk: amount})
+                wallet.balance = balances[wallet.pk]
                 return wallet
         except Wallet.DoesNotExist:
             raise serializers.ValidationError({"account_number": "Wallet not found"})
@@ -0,0 +1,259 @@
+import time
+from datetime import timedelta
+from itertools import chain, groupby, islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from notifications.service import notification, notify_many
+from .archive import overlapping_segments, segment_rows
+from .models import (
+    StatementArtifact,
+    StatementRun,
+    StatementRunChunk,
+    TransactionHistory,
+    Wallet,
+)
+from .statements import period_bounds, save_statement
+
+
+def previous_month(today=None):
+    """First and last day of the month before ``today``."""
+    today = today or timezone.localdate()
+    period_end = today.replace(day=1) - timedelta(days=1)
+    return period_end.replace(day=1), period_end
+
+
+def plan_statement_run(period_start, period_end, chunk_size=None):
+    """
+    Return the run for the period, creating it and its wallet chunks on first
+    call. Chunks cover wallets opened before the period ended, in id order.
+    """
+    chunk_size = chunk_size or settings.STATEMENT_RUN_CHUNK_SIZE
+    with transaction.atomic():
+        run, created = StatementRun.objects.get_or_create(
+            period_start=period_start, period_end=period_end
+        )
+        if not created:
+            return run
+
+        _, end = period_bounds(period_start, period_end)
+        wallet_ids = (
+            Wallet.objects.filter(created_at__lt=end)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+        chunks = []
+        while ids := list(islice(wallet_ids, chunk_size)):
+            chunks.append(
+                StatementRunChunk(
+                    run=run,
+                    first_wallet_id=ids[0],
+                    last_wallet_id=ids[-1],
+                    wallet_count=len(ids),
+                )
+            )
+        StatementRunChunk.objects.bulk_create(chunks)
+        run.total_chunks = len(chunks)
+        run.total_wallets = sum(chunk.wallet_count for chunk in chunks)
+        if not chunks:
+            run.status = "completed"
+            run.completed_at = timezone.now()
+        run.save()
+    return run
+
+
+def claim_chunk(run):
+    """
+    Claim the run's next pending chunk, or one whose worker stopped before
+    finishing it. Rows are claimed with ``SKIP LOCKED`` so any number of
+    workers can share a run.
+    """
+    now = timezone.now()
+    stale = now - settings.STATEMENT_RUN_CHUNK_LEASE
+    with transaction.atomic():
+        chunk = (
+            StatementRunChunk.objects.select_for_update(skip_locked=True)
+            .filter(run=run)
+            .filter(Q(status="pending") | Q(status="processing", claimed_at__lt=stale))
+            .order_by("first_wallet_id")
+            .first()
+        )
+        if chunk is not None:
+            chunk.status = "processing"
+            chunk.claimed_at = now
+            chunk.save(update_fields=["status", "claimed_at"])
+    return chunk
+
+
+def chunk_statements(chunk):
+    """
+    Render the statement of every wallet in ``chunk``, one wallet at a time.
+    The chunk's transactions for the period are streamed through a single
+    server-side cursor ordered by wallet, and each wallet's archived rows are
+    read from only the segment blocks holding them, so memory is bounded by
+    one statement section rather than the chunk. Returns ``(wallet,
+    artifact)`` pairs in wallet order.
+    """
+    run = chunk.run
+    start, end = period_bounds(run.period_start, run.period_end)
+    in_chunk = Q(wallet_id__gte=chunk.first_wallet_id) & Q(
+        wallet_id__lte=chunk.last_wallet_id
+    )
+    wallets = (
+        Wallet.objects.select_related("user")
+        .filter(
+            pk__gte=chunk.first_wallet_id,
+            pk__lte=chunk.last_wallet_id,
+            created_at__lt=end,
+        )
+        .order_by("pk")
+    )
+    live = groupby(
+        TransactionHistory.objects.filter(
+            in_chunk, created_at__gte=start, created_at__lt=end
+        )
+        .order_by("wallet_id", "-created_at", "-pk")
+        .iterator(chunk_size=settings.STATEMENT_SECTION_ROWS),
+        key=attrgetter("wallet_id"),
+    )
+    segments = list(
+        overlapping_segments(
+            chunk.first_wallet_id, chunk.last_wallet_id, start, end
+        ).order_by("-month")
+    )
+
+    # Statements rendered by an earlier attempt at this chunk are reused
+    artifacts = {}
+    for artifact in StatementArtifact.objects.filter(
+        in_chunk, period_start=run.period_start, period_end=run.period_end
+    ):
+        if artifact.expires_at > timezone.now():
+            artifacts[(artifact.wallet_id, artifact.last_transaction_id)] = artifact
+        else:
+            # It would block the insert of the fresh one
+            artifact.file.delete(save=False)
+            artifact.delete()
+
+    results = []
+    group = next(live, None)
+    for wallet in wallets:
+        while group is not None and group[0] < wallet.pk:
+            group = next(live, None)
+        live_rows = ()
+        if group is not None and group[0] == wallet.pk:
+            live_rows = group[1]
+        # Archived rows are older than every live row of their wallet
+        archived = (
+            row
+            for segment in segments
+            if segment.first_wallet_id <= wallet.pk <= segment.last_wallet_id
+            for row in segment_rows(segment, wallet.pk, wallet.pk, start, end)
+        )
+        rows = chain(live_rows, archived)
+
+        newest = next(rows, None)
+        last_transaction_id = newest.transaction_id if newest else ""
+        artifact = artifacts.get((wallet.pk, last_transaction_id))
+        if artifact is None:
+            artifact = save_statement(
+                wallet,
+                chain([newest], rows) if newest else rows,
+                run.period_start,
+                run.period_end,
+                last_transaction_id,
+            )
+        results.append((wallet, artifact))
+    return results
+
+
+def process_chunk(chunk):
+    """
+    Render and mail the chunk's statements. The emails are queued in the
+    same transaction that checkpoints the chunk, so a chunk is mailed once
+    even if it is retried or reclaimed. Returns the number sent, or None if
+    another worker took the chunk over.
+    """
+    started = time.perf_counter()
+    results = chunk_statements(chunk)
+    run = chunk.run
+    notifications = [
+        notification(
+            "statement",
+            [wallet.user.email],
+            name=wallet.user.display_name,
+            account_number=wallet.account_number,
+            period_start=run.period_start.strftime("%d %b %Y"),
+            period_end=run.period_end.strftime("%d %b %Y"),
+            attachments=[artifact.file.name],
+        )
+        for wallet, artifact in results
+    ]
+
+    with transaction.atomic():
+        claimed = StatementRunChunk.objects.filter(
+            pk=chunk.pk, status="processing", claimed_at=chunk.claimed_at
+        ).update(
+            status="completed",
+            statements_sent=len(notifications),
+            duration=time.perf_counter() - started,
+            completed_at=timezone.now(),
+        )
+        if not claimed:
+            return None
+        batch_size = settings.STATEMENT_MAIL_BATCH_SIZE
+        for offset in range(0, len(notifications), batch_size):
+            notify_many(notifications[offset : offset + batch_size])
+        StatementRun.objects.filter(pk=run.pk).update(
+            statements_sent=F("statements_sent") + len(notifications),
+            updated_at=timezone.now(),
+        )
+    return len(notifications)
+
+
+def run_statement_chunks(run, on_chunk=None):
+    """
+    Process chunks of ``run`` until none are left to claim, calling
+    ``on_chunk(chunk, sent)`` after each. Returns the number of statements
+    this worker sent.
+    """
+    sent = 0
+    while (chunk := claim_chunk(run)) is not None:
+        chunk_sent = process_chunk(chunk)
+        sent += chunk_sent or 0
+        if on_chunk is not None:
+            on_chunk(chunk, chunk_sent)
+
+    if not run.chunks.exclude(status="completed").exists():
+        StatementRun.objects.filter(pk=run.pk, status="processing").update(
+            status="completed", completed_at=timezone.now()
+        )
+    return sent
+
+
+def run_progress(run):
+    """Completion and throughput figures for ``run``."""
+    run.refresh_from_db()
+    done = run.chunks.filter(status="completed").aggregate(
+        chunks=Count("pk"), statements=Sum("statements_sent"), busy=Sum("duration")
+    )
+    finished = run.completed_at or timezone.now()
+    elapsed = (finished - run.created_at).total_seconds()
+    statements = done["statements"] or 0
+    return {
+        "status": run.status,
+        "chunks_completed": done["chunks"] or 0,
+        "total_chunks": run.total_chunks,
+        "statements_sent": statements,
+        "total_wallets": run.total_wallets,
+        "elapsed_seconds": round(elapsed, 1),
+        "statements_per_minute": round(statements * 60 / elapsed, 1) if elapsed else 0,
+        # Per worker, excluding time spent waiting for a chunk
+        "seconds_per_statement": (
+            round(done["busy"] / statements, 3) if statements else None
+        ),
+    }
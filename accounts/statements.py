@@ -0,0 +1,218 @@
+import io
+import tempfile
+from datetime import datetime, time, timedelta
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .archive import ArchivedHistory
+from .models import StatementArtifact, StatementJob, TransactionHistory
+from .rendering import get_renderer
+
+
+def period_bounds(period_start, period_end):
+    """Aware datetimes covering the whole of both days."""
+    start = timezone.make_aware(datetime.combine(period_start, time.min))
+    end = timezone.make_aware(
+        datetime.combine(period_end + timedelta(days=1), time.min)
+    )
+    return start, end
+
+
+def statement_transactions(wallet, period_start, period_end):
+    start, end = period_bounds(period_start, period_end)
+    return TransactionHistory.objects.filter(
+        wallet_id=wallet.pk, created_at__gte=start, created_at__lt=end
+    ).order_by("-created_at", "-pk")
+
+
+def statement_sections(user, transactions, period_start, period_end):
+    """
+    Yield the statement as HTML sections of at most STATEMENT_SECTION_ROWS
+    rows. Only the first carries the header and only the last the footer.
+    A queryset is read through a server-side cursor.
+    """
+    section_rows = settings.STATEMENT_SECTION_ROWS
+    if hasattr(transactions, "iterator"):
+        rows = transactions.iterator(chunk_size=section_rows)
+    else:
+        rows = iter(transactions)
+    context = {
+        "user": user,
+        "period_start": period_start,
+        "period_end": period_end,
+        "date": datetime.now(),
+        "preloaded_stylesheets": True,
+    }
+
+    section = list(islice(rows, section_rows))
+    continuation = False
+    while True:
+        next_section = list(islice(rows, section_rows))
+        yield render_to_string(
+            "accounts/statement.html",
+            {
+                **context,
+                "transactions": section,
+                "continuation": continuation,
+                "more_sections": bool(next_section),
+            },
+        )
+        if not next_section:
+            return
+        section, continuation = next_section, True
+
+
+def write_statement(user, transactions, period_start, period_end, output):
+    """Render the statement PDF section by section into ``output``."""
+    get_renderer().render_sections(
+        statement_sections(user, transactions, period_start, period_end), output
+    )
+
+
+def render_statement(user, transactions, period_start, period_end):
+    output = io.BytesIO()
+    write_statement(user, transactions, period_start, period_end, output)
+    return output.getvalue()
+
+
+def find_artifact(wallet, period_start, period_end, last_transaction_id):
+    return StatementArtifact.objects.filter(
+        wallet=wallet,
+        period_start=period_start,
+        period_end=period_end,
+        last_transaction_id=last_transaction_id,
+        expires_at__gt=timezone.now(),
+    ).first()
+
+
+def newest_transaction_id(transactions, archive):
+    """The id an artifact of these rows is keyed by; "" for an empty period."""
+    last_transaction_id = transactions.values_list("transaction_id", flat=True).first()
+    if last_transaction_id is None:
+        # Archived rows are older than every live row of the wallet
+        newest_archived = next(archive.newest_first(), None)
+        last_transaction_id = newest_archived.transaction_id if newest_archived else ""
+    return last_transaction_id
+
+
+def cached_statement(wallet, period_start, period_end):
+    """
+    The unexpired artifact matching the period's newest transaction, or None.
+    Never renders.
+    """
+    start, end = period_bounds(period_start, period_end)
+    last_transaction_id = newest_transaction_id(
+        statement_transactions(wallet, period_start, period_end),
+        ArchivedHistory(wallet.pk, start=start, end=end),
+    )
+    return find_artifact(wallet, period_start, period_end, last_transaction_id)
+
+
+def build_statement(wallet, period_start, period_end):
+    """
+    Return the statement artifact for the period, rendering it only if no
+    unexpired artifact matches the period's newest transaction.
+    """
+    start, end = period_bounds(period_start, period_end)
+    transactions = statement_transactions(wallet, period_start, period_end)
+    archive = ArchivedHistory(wallet.pk, start=start, end=end)
+    last_transaction_id = newest_transaction_id(transactions, archive)
+    artifact = find_artifact(wallet, period_start, period_end, last_transaction_id)
+    if artifact is not None:
+        return artifact
+
+    # An expired artifact for the same key would block the insert
+    for expired in StatementArtifact.objects.filter(
+        wallet=wallet,
+        period_start=period_start,
+        period_end=period_end,
+        last_transaction_id=last_transaction_id,
+    ):
+        expired.file.delete(save=False)
+        expired.delete()
+
+    return save_statement(
+        wallet,
+        chain(
+            transactions.iterator(chunk_size=settings.STATEMENT_SECTION_ROWS),
+            archive.newest_first(),
+        ),
+        period_start,
+        period_end,
+        last_transaction_id,
+    )
+
+
+def save_statement(wallet, transactions, period_start, period_end, last_transaction_id):
+    """
+    Render ``transactions``, an iterable read once, and store them as a new
+    statement artifact.
+    """
+    artifact = StatementArtifact(
+        wallet=wallet,
+        period_start=period_start,
+        period_end=period_end,
+        last_transaction_id=last_transaction_id,
+        expires_at=timezone.now() + settings.STATEMENT_ARTIFACT_TTL,
+    )
+
+    def counted(rows):
+        # Count while rendering rather than with a query per source
+        for row in rows:
+            artifact.transaction_count += 1
+            yield row
+
+    # Spool to disk rather than memory; large statements run to many MB
+    with tempfile.TemporaryFile() as pdf:
+        write_statement(
+            wallet.user, counted(transactions), period_start, period_end, pdf
+        )
+        artifact.size = pdf.tell()
+        pdf.seek(0)
+        artifact.file.save(
+            f"statement_{wallet.account_number}_{period_start}_{period_end}.pdf",
+            File(pdf),
+            save=False,
+        )
+    try:
+        artifact.save()
+    except IntegrityError:
+        # Another worker stored the same statement first
+        artifact.file.delete(save=False)
+        return find_artifact(wallet, period_start, period_end, last_transaction_id)
+    return artifact
+
+
+def run_statement_job(job):
+    job.status = "processing"
+    job.save(update_fields=["status", "updated_at"])
+    try:
+        job.artifact = build_statement(job.wallet, job.period_start, job.period_end)
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        job.save(update_fields=["status", "error", "updated_at"])
+        raise
+    job.status = "completed"
+    job.save(update_fields=["status", "artifact", "updated_at"])
+    return job
+
+
+def purge_expired_artifacts():
+    """Delete expired artifacts and their files; return how many were removed."""
+    expired = StatementArtifact.objects.filter(expires_at__lte=timezone.now())
+    count = 0
+    for artifact in expired.iterator():
+        artifact.file.delete(save=False)
+        artifact.delete()
+        count += 1
+    # Jobs older than any artifact they could point at are no longer useful
+    StatementJob.objects.filter(
+        created_at__lte=timezone.now() - settings.STATEMENT_ARTIFACT_TTL,
+        status__in=["completed", "failed"],
+    ).delete()
+    return count
@@ -0,0 +1,96 @@
+from celery import shared_task
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import archive_cold_history
+from .bulk import run_bulk_transfer
+from .holds import release_expired_holds
+from .models import BulkTransfer, IdempotencyKey, StatementJob, StatementRun
+from .partitions import maintain_partitions
+from .rendering import warm_renderer
+from .statement_runs import (
+    plan_statement_run,
+    previous_month,
+    run_progress,
+    run_statement_chunks,
+)
+from .statements import purge_expired_artifacts, run_statement_job
+
+
+@shared_task
+def process_bulk_transfer(bulk_transfer_id):
+    bulk = BulkTransfer.objects.get(pk=bulk_transfer_id)
+    if bulk.status == "completed":
+        return f"Bulk transfer {bulk_transfer_id} already completed"
+    try:
+        run_bulk_transfer(bulk)
+    except Exception:
+        BulkTransfer.objects.filter(pk=bulk_transfer_id).update(status="failed")
+        raise
+    return f"Bulk transfer {bulk_transfer_id}: {bulk.succeeded} succeeded, {bulk.failed} failed"
+
+
+@shared_task
+def purge_expired_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return f"Purged {deleted} expired idempotency keys"
+
+
+@shared_task
+def release_expired_wallet_holds():
+    released = release_expired_holds()
+    return f"Released {released} expired wallet holds"
+
+
+@shared_task
+def maintain_transaction_partitions():
+    created, detached = maintain_partitions()
+    return f"Created {len(created)} transaction partitions, detached {len(detached)}"
+
+
+@shared_task
+def archive_cold_transaction_history():
+    archived = archive_cold_history()
+    return f"Archived {sum(rows for _, _, rows in archived)} transaction rows"
+
+
+@shared_task
+def generate_statement(statement_job_id):
+    job = StatementJob.objects.select_related("wallet__user").get(pk=statement_job_id)
+    if job.status == "completed":
+        return f"Statement job {statement_job_id} already completed"
+    run_statement_job(job)
+    return f"Statement job {statement_job_id} completed"
+
+
+@shared_task
+def purge_expired_statements():
+    return f"Purged {purge_expired_artifacts()} expired statements"
+
+
+@shared_task
+def send_monthly_statements():
+    """Plan last month's statement run and start workers on it."""
+    run = plan_statement_run(*previous_month())
+    for _ in range(settings.STATEMENT_RUN_WORKERS):
+        process_statement_run.delay(str(run.pk))
+    return f"Statement run {run.pk}: {run.total_wallets} wallets"
+
+
+@shared_task
+def process_statement_run(statement_run_id):
+    run = StatementRun.objects.get(pk=statement_run_id)
+    sent = run_statement_chunks(run)
+    progress = run_progress(run)
+    return (
+        f"Statement run {statement_run_id}: sent {sent} here, "
+        f"{progress['statements_sent']}/{progress['total_wallets']} overall "
+        f"({progress['statements_per_minute']} per minute)"
+    )
+
+
+@worker_process_init.connect
+def warm_statement_renderer(**kwargs):
+    if settings.STATEMENT_RENDERER_PRELOAD:
+        warm_renderer()
@@ -1,3 +1,1608 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from operator import attrgetter
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pydyf
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q, Sum
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from notifications.models import OutboxMessage
+from users.models import User
+from .archive import (
+    ARCHIVE_FIELDS,
+    ArchivedHistory,
+    archive_cold_history,
+    segment_index,
+)
+from .bulk import create_bulk_transfer, run_bulk_transfer
+from .exports import EXPORT_FIELDS
+from .idempotency import claim, run_and_store
+from .ledger import InsufficientFunds, apply_balance_changes
+from .models import (
+    ArchivedSegment,
+    BulkTransfer,
+    IdempotencyKey,
+    StatementArtifact,
+    StatementJob,
+    StatementRunChunk,
+    TransactionHistory,
+    Wallet,
+)
+from .pagination import KeysetPagination
+from .partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    attached_partitions,
+    create_partitions,
+    detach_partitions,
+    month_start,
+    month_starts_at,
+    partition_ddl,
+    partition_name,
+)
+from .rendering import ASSET_BASE_URL, SectionedPDFWriter, local_url_fetcher
+from .serializers import SendMoneySerializer, TransactionHistoryFilterSerializer
+from .statement_runs import (
+    chunk_statements,
+    claim_chunk,
+    plan_statement_run,
+    previous_month,
+    process_chunk,
+    run_statement_chunks,
+)
+from .statements import (
+    build_statement,
+    cached_statement,
+    period_bounds,
+    purge_expired_artifacts,
+    render_statement,
+    save_statement,
+)
+from .tasks import generate_statement, process_bulk_transfer
+from .utils.ids import (
+    MAX_NODE_ID,
+    NODE_LEASE_KEY,
+    SEQUENCE_BITS,
+    NodeIdUnavailable,
+    NodeLease,
+    SnowflakeGenerator,
+    process_lease,
+)
+
+
+def make_wallet(balance=Decimal("10000.00")):
+    user = User.objects.create(
+        email=f"{uuid.uuid4().hex[:12]}@example.com",
+        first_name="Ada",
+        last_name="Obi",
+        phone_number=f"+234{uuid.uuid4().int % 10**10:010d}",
+        nin=uuid.uuid4().hex,
+        bvn=uuid.uuid4().hex,
+        account_number=User.objects.generate_account_number(),
+    )
+    return Wallet.objects.create(
+        user=user, account_number=user.account_number, bvn=user.bvn, balance=balance
+    )
+
+
+def send_money(sender_wallet, recipient_wallet, amount):
+    serializer = SendMoneySerializer(
+        data={"amount": str(amount), "recipient": recipient_wallet.account_number},
+        context={"request": SimpleNamespace(user=sender_wallet.user)},
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def generate_ids(node_id, count=20000):
+    generator = SnowflakeGenerator(node_id=node_id)
+    return [generator.next_str() for _ in range(count)]
+
+
+class SnowflakeGeneratorTests(SimpleTestCase):
+    def test_ids_are_unique_and_ordered_across_threads(self):
+        generator = SnowflakeGenerator(node_id=7)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            batches = list(
+                pool.map(
+                    lambda _: [generator.next_str() for _ in range(5000)], range(8)
+                )
+            )
+        ids = [tx_id for batch in batches for tx_id in batch]
+        self.assertEqual(len(ids), len(set(ids)))
+        for batch in batches:
+            self.assertEqual(batch, sorted(batch))
+        self.assertTrue(all(len(tx_id) == 20 for tx_id in ids))
+
+    def test_ids_are_unique_across_processes_with_distinct_nodes(self):
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            batches = pool.map(generate_ids, range(4))
+        ids = [tx_id for batch in batches for tx_id in batch]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_node_id_is_embedded(self):
+        tx_id = int(SnowflakeGenerator(node_id=513).next_str())
+        self.assertEqual((tx_id >> SEQUENCE_BITS) & MAX_NODE_ID, 513)
+
+    @override_settings(TRANSACTION_ID_NODE_ID="5000")
+    def test_out_of_range_node_id_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SnowflakeGenerator().next_id()
+
+    @override_settings(
+        TRANSACTION_ID_NODE_ID=None,
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        },
+    )
+    def test_process_local_cache_cannot_lease(self):
+        with self.assertRaises(ImproperlyConfigured):
+            process_lease()
+
+
+class NodeLeaseTests(SimpleTestCase):
+    def setUp(self):
+        # Room for a lease key per node id
+        self.cache = LocMemCache(
+            "node-lease-tests", {"OPTIONS": {"MAX_ENTRIES": MAX_NODE_ID + 100}}
+        )
+        self.cache.clear()
+
+    def test_leases_get_distinct_node_ids(self):
+        first, second = NodeLease(self.cache, 60), NodeLease(self.cache, 60)
+        self.assertNotEqual(first.current(), second.current())
+
+    def test_released_node_id_can_be_leased_again(self):
+        lease = NodeLease(self.cache, 60)
+        node_id = lease.current()
+        lease.release()
+        self.assertIsNone(self.cache.get(NODE_LEASE_KEY.format(node_id)))
+
+    def test_lost_lease_is_replaced_before_the_next_id(self):
+        lease = NodeLease(self.cache, 60)
+        node_id = lease.current()
+        # The key expired and another process leased the same node id
+        self.cache.set(NODE_LEASE_KEY.format(node_id), "other", 60)
+        lease.renew_at = 0
+        self.assertNotEqual(lease.current(), node_id)
+
+    def test_renewal_keeps_the_node_id(self):
+        lease = NodeLease(self.cache, 60)
+        node_id = lease.current()
+        lease.renew_at = 0
+        self.assertEqual(lease.current(), node_id)
+
+    def test_no_free_node_id_fails(self):
+        for node_id in range(MAX_NODE_ID + 1):
+            self.cache.set(NODE_LEASE_KEY.format(node_id), "taken", 60)
+        with self.assertRaises(NodeIdUnavailable):
+            NodeLease(self.cache, 60).current()
+
+
+class ApplyBalanceChangesTests(TestCase):
+    def setUp(self):
+        self.sender = make_wallet(Decimal("1000.00"))
+        self.recipient = make_wallet(Decimal("0.00"))
+
+    def test_moves_money_and_returns_new_balances(self):
+        with transaction.atomic():
+            balances = apply_balance_changes(
+                {self.sender.pk: Decimal("-400"), self.recipient.pk: Decimal("400")}
+            )
+        self.assertEqual(balances[self.sender.pk], Decimal("600.00"))
+        self.assertEqual(balances[self.recipient.pk], Decimal("400.00"))
+
+    def test_overdraft_changes_nothing(self):
+        with self.assertRaises(InsufficientFunds):
+            with transaction.atomic():
+                apply_balance_changes(
+                    {self.sender.pk: Decimal("-1000.01"), self.recipient.pk: 1}
+                )
+        self.sender.refresh_from_db()
+        self.recipient.refresh_from_db()
+        self.assertEqual(self.sender.balance, Decimal("1000.00"))
+        self.assertEqual(self.recipient.balance, Decimal("0.00"))
+
+    def test_reserved_funds_cannot_be_debited(self):
+        Wallet.objects.filter(pk=self.sender.pk).update(reserved=Decimal("800"))
+        with self.assertRaises(InsufficientFunds):
+            with transaction.atomic():
+                apply_balance_changes({self.sender.pk: Decimal("-300")})
+        with transaction.atomic():
+            apply_balance_changes({self.sender.pk: Decimal("-200")})
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, Decimal("800.00"))
+
+
+class ConcurrentTransferTests(TransactionTestCase):
+    """Concurrent transfers between a few wallets neither create nor lose money."""
+
+    wallets = 5
+    threads = 6
+    transfers = 30
+    starting_balance = Decimal("2000.00")
+
+    def transfer_loop(self, wallets):
+        completed = 0
+        try:
+            for _ in range(self.transfers):
+                sender, recipient = random.sample(wallets, 2)
+                try:
+                    send_money(sender, recipient, random.randint(101, 900))
+                except Exception as e:
+                    # Declined for funds, or on SQLite a writer lock timeout;
+                    # either way the transfer must have been rolled back
+                    if not isinstance(e, (DatabaseError, ValidationError)):
+                        raise
+                else:
+                    completed += 1
+        finally:
+            connection.close()
+        return completed
+
+    def test_no_money_created_or_lost(self):
+        wallets = [make_wallet(self.starting_balance) for _ in range(self.wallets)]
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            completed = sum(
+                pool.map(lambda _: self.transfer_loop(wallets), range(self.threads))
+            )
+
+        self.assertGreater(completed, 0)
+        rows = Wallet.objects.filter(pk__in=[wallet.pk for wallet in wallets])
+        self.assertEqual(
+            rows.aggregate(total=Sum("balance"))["total"],
+            self.starting_balance * self.wallets,
+        )
+        self.assertFalse(rows.filter(balance__lt=0).exists())
+        self.assertEqual(
+            TransactionHistory.objects.filter(type="debit").count(), completed
+        )
+        for wallet in rows:
+            sums = TransactionHistory.objects.filter(wallet=wallet).aggregate(
+                credits=Sum("amount", filter=Q(type="credit"), default=0),
+                debits=Sum("amount", filter=Q(type="debit"), default=0),
+            )
+            self.assertEqual(
+                self.starting_balance + sums["credits"] - sums["debits"],
+                wallet.balance,
+            )
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class SendMoneyQueryTests(TestCase):
+    """
+    The send_money path runs a fixed number of queries. A transfer reads both
+    wallets with their users in one query, then in a savepoint makes two
+    conditional balance updates, reads the balances back, inserts both
+    history rows at once and queues the alert in the outbox.
+    """
+
+    def setUp(self):
+        self.sender = make_wallet(Decimal("5000.00"))
+        self.recipient = make_wallet(Decimal("0.00"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+        self.url = reverse("send_money")
+
+    def send(self, amount, recipient):
+        return self.client.post(
+            self.url, {"amount": amount, "recipient": recipient}, format="json"
+        )
+
+    def test_successful_transfer(self):
+        with self.assertNumQueries(8):
+            response = self.send("500", self.recipient.account_number)
+        self.assertEqual(response.status_code, 201)
+        self.sender.refresh_from_db()
+        self.recipient.refresh_from_db()
+        self.assertEqual(self.sender.balance, Decimal("4500.00"))
+        self.assertEqual(self.recipient.balance, Decimal("500.00"))
+
+    def test_insufficient_funds(self):
+        with self.assertNumQueries(1):
+            response = self.send("5000.01", self.recipient.account_number)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TransactionHistory.objects.exists())
+
+    def test_unknown_recipient(self):
+        unknown = User.objects.generate_account_number()
+        with self.assertNumQueries(1):
+            response = self.send("500", unknown)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TransactionHistory.objects.exists())
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class CounterpartyNameTests(TestCase):
+    """History rows carry name snapshots, so listing them never loads users."""
+
+    def setUp(self):
+        self.sender = make_wallet(Decimal("5000.00"))
+        self.recipients = [make_wallet(Decimal("0.00")) for _ in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+
+    def list_history(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("transaction_history"))
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"], len(queries)
+
+    def test_history_list_has_no_per_row_user_lookups(self):
+        send_money(self.sender, self.recipients[0], "200")
+        _, baseline = self.list_history()
+        for recipient in self.recipients[1:]:
+            send_money(self.sender, recipient, "200")
+
+        rows, queries = self.list_history()
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(queries, baseline)
+        self.assertEqual(
+            [row["receiver_name"] for row in rows],
+            [wallet.user.display_name for wallet in reversed(self.recipients)],
+        )
+
+    def test_backfill_snapshots_names_on_older_rows(self):
+        for recipient in self.recipients:
+            send_money(self.sender, recipient, "200")
+        rows, baseline = self.list_history()
+        TransactionHistory.objects.update(sender_name=None, receiver_name=None)
+        # Rows without snapshots fall back to a user lookup per name
+        self.assertEqual(self.list_history(), (rows, baseline + 10))
+
+        out = io.StringIO()
+        call_command("backfill_counterparty_names", batch_size=3, stdout=out)
+        self.assertIn("Backfilled names on 10 rows", out.getvalue())
+        self.assertFalse(
+            TransactionHistory.objects.filter(
+                Q(sender_name__isnull=True) | Q(receiver_name__isnull=True)
+            ).exists()
+        )
+        self.assertEqual(self.list_history(), (rows, baseline))
+
+        call_command("backfill_counterparty_names", stdout=out)
+        self.assertIn("Backfilled names on 0 rows", out.getvalue())
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class IdempotentSendMoneyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = make_wallet(Decimal("5000.00"))
+        self.recipient = make_wallet(Decimal("0.00"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+        self.url = reverse("send_money")
+
+    def send(self, key, amount="500"):
+        return self.client.post(
+            self.url,
+            {"amount": amount, "recipient": self.recipient.account_number},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def assert_balance(self, wallet, balance):
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal(balance))
+
+    def test_retry_is_replayed_without_a_second_debit(self):
+        first = self.send("key-1")
+        cache.clear()
+        retry = self.send("key-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assert_balance(self.sender, "4500.00")
+
+    def test_different_body_with_the_same_key_is_rejected(self):
+        self.send("key-1")
+        self.assertEqual(self.send("key-1", amount="600").status_code, 422)
+        self.assert_balance(self.sender, "4500.00")
+
+    def test_failure_to_store_the_response_rolls_back_the_transfer(self):
+        with mock.patch.object(
+            IdempotencyKey, "save", side_effect=DatabaseError("lost connection")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.send("key-1")
+        self.assert_balance(self.sender, "5000.00")
+        self.assertFalse(TransactionHistory.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_claim_taken_over_before_running_is_not_executed(self):
+        request = SimpleNamespace(user=self.sender.user, path=self.url)
+        record = claim(request, "key-1", "hash")
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        view = mock.Mock()
+        response = run_and_store(view, None, request, record, "cache-key", (), {})
+        self.assertEqual(response.status_code, 409)
+        view.assert_not_called()
+
+    def test_server_error_releases_the_key(self):
+        request = SimpleNamespace(user=self.sender.user, path=self.url)
+        record = claim(request, "key-1", "hash")
+
+        def failing_view(view, request):
+            make_wallet()
+            return Response(status=500)
+
+        wallets = Wallet.objects.count()
+        response = run_and_store(
+            failing_view, None, request, record, "cache-key", (), {}
+        )
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Wallet.objects.count(), wallets)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class TransactionIdCheckTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet()
+
+    def entry(self, **fields):
+        return TransactionHistory(
+            wallet=self.wallet, amount=Decimal("150.00"), type="credit", **fields
+        )
+
+    def test_ids_must_be_snowflake_ids(self):
+        with self.assertRaises(ValueError):
+            self.entry(transaction_id="TXN1").save()
+        with self.assertRaises(ValueError):
+            TransactionHistory.objects.bulk_create(
+                [self.entry(), self.entry(session_id="SES1")]
+            )
+        self.assertFalse(TransactionHistory.objects.exists())
+
+    def test_ids_are_unique_within_a_batch(self):
+        first = self.entry()
+        with self.assertRaises(IntegrityError):
+            TransactionHistory.objects.bulk_create(
+                [first, self.entry(transaction_id=first.transaction_id)]
+            )
+        self.assertFalse(TransactionHistory.objects.exists())
+
+    @mock.patch("accounts.models.is_partitioned", return_value=True)
+    def test_reused_ids_are_rejected_when_partitioned(self, _):
+        existing = self.entry()
+        existing.save()
+        # Another timestamp would satisfy the (id, created_at) constraints
+        TransactionHistory.objects.filter(pk=existing.pk).update(
+            created_at=timezone.now() + timedelta(hours=1)
+        )
+        with self.assertRaisesMessage(IntegrityError, "already in use"):
+            self.entry(transaction_id=existing.transaction_id).save()
+        with self.assertRaisesMessage(IntegrityError, "already in use"):
+            TransactionHistory.objects.bulk_create(
+                [self.entry(session_id=existing.session_id)]
+            )
+
+        # Updates keep their ids and are not checked
+        existing.narration = "rent"
+        existing.save()
+        self.entry().save()
+        self.assertEqual(TransactionHistory.objects.count(), 2)
+
+
+class PartitionNamingTests(SimpleTestCase):
+    def test_months_wrap_across_years(self):
+        self.assertEqual(add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+
+    def test_partition_covers_one_month(self):
+        month = date(2026, 12, 1)
+        self.assertEqual(partition_name(month), "accounts_transactionhistory_y2026m12")
+        ddl = partition_ddl(month)
+        self.assertIn(f"FROM ('{month_starts_at(month).isoformat()}')", ddl)
+        self.assertIn(f"TO ('{month_starts_at(date(2027, 1, 1)).isoformat()}')", ddl)
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "TransactionHistory is only partitioned on PostgreSQL",
+)
+class PartitionMaintenanceTests(TestCase):
+    def setUp(self):
+        # Far enough ahead that no partition covers it yet
+        self.month = add_months(month_start(timezone.localdate()), 60)
+        self.wallet = make_wallet()
+
+    def count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_rows_of_a_new_month_move_out_of_the_default_partition(self):
+        row = TransactionHistory.objects.create(
+            wallet=self.wallet, amount=Decimal("150.00"), type="credit"
+        )
+        TransactionHistory.objects.filter(pk=row.pk).update(
+            created_at=month_starts_at(self.month) + timedelta(days=14)
+        )
+        self.assertEqual(self.count(DEFAULT_PARTITION), 1)
+
+        with connection.cursor() as cursor:
+            created = create_partitions(self.month, self.month, cursor)
+            attached = attached_partitions(cursor)
+        self.assertEqual(created, [partition_name(self.month)])
+        self.assertIn(DEFAULT_PARTITION, attached)
+        self.assertEqual(self.count(DEFAULT_PARTITION), 0)
+        self.assertEqual(self.count(partition_name(self.month)), 1)
+        self.assertTrue(TransactionHistory.objects.filter(pk=row.pk).exists())
+
+    def test_detach_keeps_the_default_and_newer_partitions(self):
+        old = date(1990, 1, 1)
+        with connection.cursor() as cursor:
+            create_partitions(old, add_months(old, 1), cursor)
+            detached = detach_partitions(add_months(old, 1), cursor)
+            attached = attached_partitions(cursor)
+        self.assertEqual(detached, [partition_name(old)])
+        self.assertNotIn(partition_name(old), attached)
+        self.assertIn(partition_name(add_months(old, 1)), attached)
+        self.assertIn(DEFAULT_PARTITION, attached)
+        # Detached partitions stay as standalone tables
+        self.assertEqual(self.count(partition_name(old)), 0)
+
+
+class HistoryArchiveTests(TestCase):
+    """History read back from archived segments in a local directory."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        storage_patch = mock.patch.object(
+            ArchivedSegment._meta.get_field("file"),
+            "storage",
+            FileSystemStorage(location=self.root),
+        )
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        segment_index.cache_clear()
+        self.addCleanup(segment_index.cache_clear)
+
+        self.wallet = make_wallet()
+        self.other = make_wallet()
+        self.client = APIClient()
+        self.client.force_authenticate(self.wallet.user)
+
+        self.old_month = add_months(month_start(timezone.localdate()), -14)
+        old = timezone.make_aware(datetime.combine(self.old_month, time(12)))
+        now = timezone.now()
+        # Old rows across the month, two of them created at the same moment
+        for offset in (0, 1, 1, 5, 9, 20):
+            self.add_row(self.wallet, old + timedelta(days=offset))
+        self.add_row(self.other, old)
+        for offset in (1, 2, 3):
+            self.add_row(self.wallet, now - timedelta(hours=offset))
+
+    def add_row(self, wallet, created_at):
+        row = TransactionHistory.objects.create(
+            wallet=wallet,
+            amount=Decimal("150.00"),
+            type="credit",
+            narration=f"at {created_at:%Y-%m-%d %H:%M}",
+            balance_after_transaction=wallet.balance,
+        )
+        TransactionHistory.objects.filter(pk=row.pk).update(created_at=created_at)
+
+    def history(self, wallet):
+        return list(
+            TransactionHistory.objects.filter(wallet=wallet)
+            .order_by("-created_at", "-pk")
+            .values_list("transaction_id", flat=True)
+        )
+
+    def keyset_pages(self, **params):
+        ids = []
+        response = self.client.get(reverse("transaction_history"), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row["transaction_id"] for row in response.data["data"]]
+            next_link = response.data["pagination"]["next"]
+            if next_link is None:
+                return ids, response
+            response = self.client.get(next_link)
+
+    def test_old_months_move_to_segment_files(self):
+        archived = archive_cold_history(segment_wallets=1)
+        self.assertEqual(archived, [(self.old_month, 2, 7)])
+        self.assertEqual(TransactionHistory.objects.count(), 3)
+        segment = ArchivedSegment.objects.get(first_wallet_id=self.wallet.pk)
+        self.assertEqual(segment.row_count, 6)
+        self.assertTrue(os.path.exists(os.path.join(self.root, segment.file.name)))
+
+    def test_archived_rows_read_back_unchanged(self):
+        before = list(
+            TransactionHistory.objects.filter(wallet=self.wallet)
+            .order_by("-created_at", "-pk")
+            .values_list(*ARCHIVE_FIELDS)
+        )[3:]
+        archive_cold_history()
+        rows = ArchivedHistory(wallet_id=self.wallet.pk).newest_first()
+        self.assertEqual(
+            [tuple(getattr(row, f) for f in ARCHIVE_FIELDS) for row in rows], before
+        )
+
+    def test_whole_months_are_counted_from_segment_indexes(self):
+        archive_cold_history(segment_wallets=2)
+        last_day = add_months(self.old_month, 1) - timedelta(days=1)
+        dates = TransactionHistoryFilterSerializer(
+            data={"start_date": self.old_month, "end_date": last_day}
+        )
+        dates.is_valid(raise_exception=True)
+        with mock.patch("accounts.archive.segment_rows") as segment_rows:
+            self.assertEqual(ArchivedHistory(wallet_id=self.wallet.pk).count(), 6)
+            self.assertEqual(ArchivedHistory(wallet_id=self.wallet.pk).count(4), 4)
+            self.assertEqual(ArchivedHistory(wallet_id=self.other.pk).count(), 1)
+            self.assertEqual(
+                ArchivedHistory(wallet_id=self.wallet.pk, filters=dates).count(), 6
+            )
+        segment_rows.assert_not_called()
+
+        # Part of a month, or a filter on more than dates, reads the rows
+        start = timezone.make_aware(datetime.combine(self.old_month, time(12)))
+        partial = ArchivedHistory(wallet_id=self.wallet.pk, start=start + timedelta(3))
+        self.assertEqual(partial.count(), 3)
+        debits = TransactionHistoryFilterSerializer(data={"type": "debit"})
+        debits.is_valid(raise_exception=True)
+        self.assertEqual(
+            ArchivedHistory(wallet_id=self.wallet.pk, filters=debits).count(), 0
+        )
+
+    def test_keyset_pages_continue_into_the_archive(self):
+        expected = self.history(self.wallet)
+        archive_cold_history()
+        ids, last = self.keyset_pages(page_size=2, include_total="true")
+        self.assertEqual(ids, expected)
+        self.assertEqual(last.data["pagination"]["total"], {"count": 9, "exact": True})
+
+        # Paging back from the oldest row crosses from the archive to live rows
+        ids = [row["transaction_id"] for row in last.data["data"]]
+        response = last
+        while response.data["pagination"]["previous"]:
+            response = self.client.get(response.data["pagination"]["previous"])
+            ids = [row["transaction_id"] for row in response.data["data"]] + ids
+        self.assertEqual(ids, expected)
+
+    def test_keyset_total_counts_archived_rows_up_to_the_cap(self):
+        archive_cold_history()
+        with mock.patch.object(KeysetPagination, "max_total_count", 5):
+            response = self.client.get(
+                reverse("transaction_history"), {"include_total": "true"}
+            )
+        self.assertEqual(
+            response.data["pagination"]["total"], {"count": 5, "exact": False}
+        )
+
+    def test_export_streams_and_resumes_across_the_archive(self):
+        expected = self.history(self.wallet)[::-1]
+        archive_cold_history()
+        url = reverse("export_transactions")
+
+        response = self.client.get(url, {"file_format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["transaction_id"] for row in rows], expected)
+
+        # From an archived row, then from the last archived row into live ones
+        for received in (2, 6):
+            response = self.client.get(
+                url, {"file_format": "ndjson", "cursor": expected[received - 1]}
+            )
+            self.assertEqual(response.status_code, 200)
+            rows = [
+                json.loads(line)
+                for line in b"".join(response.streaming_content).splitlines()
+            ]
+            self.assertEqual(
+                [row["transaction_id"] for row in rows], expected[received:]
+            )
+
+    def test_numbered_pages_merge_live_and_archived_rows(self):
+        expected = self.history(self.wallet)
+        archive_cold_history()
+        ids = []
+        for page in range(1, 4):
+            response = self.client.get(reverse("transaction_history"), {"page": page})
+            self.assertEqual(response.status_code, 200)
+            ids += [row["transaction_id"] for row in response.data["results"]["data"]]
+        self.assertEqual(ids, expected)
+        pagination = response.data["results"]["pagination"]
+        self.assertEqual((pagination["count"], pagination["pages"]), (9, 3))
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet()
+        self.client = APIClient()
+        self.client.force_authenticate(self.wallet.user)
+
+    def add_rows(self, count, created_at=None):
+        TransactionHistory.objects.bulk_create(
+            TransactionHistory(
+                wallet=self.wallet,
+                amount=Decimal("10.00"),
+                type="credit",
+                narration=f"row {n}",
+                balance_after_transaction=self.wallet.balance,
+            )
+            for n in range(count)
+        )
+        if created_at is not None:
+            TransactionHistory.objects.update(created_at=created_at)
+
+    def history(self):
+        return list(
+            TransactionHistory.objects.order_by("-created_at", "-pk").values_list(
+                "transaction_id", flat=True
+            )
+        )
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or reverse("transaction_history"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def ids(self, response):
+        return [row["transaction_id"] for row in response.data["data"]]
+
+    def test_rows_sharing_created_at_page_without_gaps_or_repeats(self):
+        self.add_rows(7, created_at=timezone.now() - timedelta(hours=1))
+        expected = self.history()
+
+        response = self.get(page_size=2)
+        ids = self.ids(response)
+        while response.data["pagination"]["next"]:
+            response = self.get(response.data["pagination"]["next"])
+            ids += self.ids(response)
+        self.assertEqual(ids, expected)
+
+        ids = self.ids(response)
+        while response.data["pagination"]["previous"]:
+            response = self.get(response.data["pagination"]["previous"])
+            ids = self.ids(response) + ids
+        self.assertEqual(ids, expected)
+
+    def test_rows_added_while_paging_do_not_shift_later_pages(self):
+        self.add_rows(4, created_at=timezone.now() - timedelta(hours=1))
+        expected = self.history()
+        first = self.get(page_size=2)
+        self.add_rows(3)
+
+        second = self.get(first.data["pagination"]["next"])
+        self.assertEqual(self.ids(first) + self.ids(second), expected)
+        self.assertIsNone(second.data["pagination"]["next"])
+
+    def test_total_is_exact_up_to_the_cap(self):
+        self.add_rows(1000)
+        response = self.get(page_size=5, include_total="true")
+        self.assertEqual(
+            response.data["pagination"]["total"], {"count": 1000, "exact": True}
+        )
+        self.assertEqual(response.data["pagination"]["page_size"], 5)
+
+        self.add_rows(1)
+        response = self.get(page_size=5, include_total="true")
+        self.assertEqual(
+            response.data["pagination"]["total"], {"count": 1000, "exact": False}
+        )
+        self.assertNotIn("total", self.get().data["pagination"])
+
+    def test_page_size_is_capped(self):
+        self.add_rows(KeysetPagination.max_page_size + 1)
+        response = self.get(page_size=1000)
+        self.assertEqual(len(response.data["data"]), KeysetPagination.max_page_size)
+        self.assertIsNotNone(response.data["pagination"]["next"])
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ("not-a-cursor", "eyJjIjogIm5vdyJ9"):
+            response = self.client.get(
+                reverse("transaction_history"), {"cursor": cursor}
+            )
+            self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class TransactionHistoryFilterTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet()
+        self.day = timezone.localdate() - timedelta(days=10)
+        rows = [
+            # (day offset, hh:mm, type, amount, counterparty, narration)
+            (0, "00:00", "credit", "150.00", "Ada Obi", "Salary October"),
+            (0, "23:59", "debit", "2000.00", "Chidi Eze", "Rent"),
+            (1, "00:00", "debit", "500.00", "Bola Ade", "rent top-up"),
+            (2, "12:00", "credit", "75.50", "Chidi Eze", None),
+        ]
+        for offset, at, kind, amount, name, narration in rows:
+            hour, minute = map(int, at.split(":"))
+            created_at = timezone.make_aware(
+                datetime.combine(self.day + timedelta(days=offset), time(hour, minute))
+            )
+            row = TransactionHistory.objects.create(
+                wallet=self.wallet,
+                amount=Decimal(amount),
+                type=kind,
+                narration=narration,
+                sender_name=name if kind == "credit" else "Wallet Owner",
+                receiver_name=name if kind == "debit" else "Wallet Owner",
+                balance_after_transaction=self.wallet.balance,
+            )
+            TransactionHistory.objects.filter(pk=row.pk).update(created_at=created_at)
+        self.rows = list(TransactionHistory.objects.order_by("created_at"))
+
+    def filters(self, **params):
+        serializer = TransactionHistoryFilterSerializer(data=params)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer
+
+    def test_filters_select_the_same_rows_in_sql_and_in_python(self):
+        day = self.day.isoformat()
+        next_day = (self.day + timedelta(days=1)).isoformat()
+        cases = [
+            ({}, [0, 1, 2, 3]),
+            ({"start_date": day, "end_date": day}, [0, 1]),
+            ({"start_date": next_day}, [2, 3]),
+            ({"end_date": next_day}, [0, 1, 2]),
+            ({"type": "debit"}, [1, 2]),
+            ({"min_amount": "150", "max_amount": "500"}, [0, 2]),
+            ({"counterparty": "chidi"}, [1, 3]),
+            ({"counterparty": "owner"}, []),
+            ({"search": "RENT"}, [1, 2]),
+            ({"search": "rent", "type": "debit", "end_date": day}, [1]),
+        ]
+        queryset = TransactionHistory.objects.filter(wallet=self.wallet)
+        for params, expected in cases:
+            with self.subTest(**params):
+                filters = self.filters(**params)
+                expected = [self.rows[n].pk for n in expected]
+                self.assertEqual(
+                    list(
+                        filters.filter_queryset(queryset)
+                        .order_by("created_at")
+                        .values_list("pk", flat=True)
+                    ),
+                    expected,
+                )
+                self.assertEqual(
+                    [row.pk for row in self.rows if filters.matches(row)], expected
+                )
+
+    def test_created_at_range_covers_whole_days(self):
+        self.assertEqual(self.filters().created_at_range(), (None, None))
+        start, end = self.filters(
+            start_date=self.day.isoformat(), end_date=self.day.isoformat()
+        ).created_at_range()
+        self.assertEqual(start, self.rows[0].created_at)
+        self.assertEqual(end, self.rows[2].created_at)
+        self.assertEqual(end - start, timedelta(days=1))
+
+    def test_invalid_filters_are_rejected(self):
+        day = self.day.isoformat()
+        earlier = (self.day - timedelta(days=1)).isoformat()
+        cases = [
+            {"start_date": day, "end_date": earlier},
+            {"min_amount": "500", "max_amount": "100"},
+            {"start_date": "18/10/2026"},
+            {"type": "refund"},
+            {"min_amount": "ten"},
+            {"search": "x" * 101},
+        ]
+        for params in cases:
+            with self.subTest(**params):
+                serializer = TransactionHistoryFilterSerializer(data=params)
+                self.assertFalse(serializer.is_valid())
+
+        client = APIClient()
+        client.force_authenticate(self.wallet.user)
+        response = client.get(
+            reverse("transaction_history"), {"start_date": day, "end_date": earlier}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["message"], "Validation error")
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"], TRANSACTION_EXPORT_CHUNK_SIZE=2)
+class ExportTransactionsTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet()
+        self.client = APIClient()
+        self.client.force_authenticate(self.wallet.user)
+        start = timezone.now() - timedelta(days=3)
+        # Five rows, the middle two created at the same moment
+        for offset in (0, 1, 1, 2, 3):
+            self.add_row(self.wallet, start + timedelta(hours=offset))
+        self.add_row(make_wallet(), start)
+        self.ids = list(
+            TransactionHistory.objects.filter(wallet=self.wallet)
+            .order_by("created_at", "pk")
+            .values_list("transaction_id", flat=True)
+        )
+
+    def add_row(self, wallet, created_at):
+        row = TransactionHistory.objects.create(
+            wallet=wallet,
+            amount=Decimal("150.00"),
+            type="credit",
+            sender_name="Ada, Obi",
+            balance_after_transaction=wallet.balance,
+        )
+        TransactionHistory.objects.filter(pk=row.pk).update(created_at=created_at)
+
+    def export(self, headers=None, **params):
+        response = self.client.get(
+            reverse("export_transactions"), params, headers=headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, list(response.streaming_content)
+
+    def csv_rows(self, body):
+        return list(csv.reader(io.StringIO(body.decode())))
+
+    def test_csv_streams_every_row_in_chunks(self):
+        response, chunks = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(self.wallet.account_number, response["Content-Disposition"])
+        self.assertGreater(len(chunks), 2)
+
+        header, *rows = self.csv_rows(b"".join(chunks))
+        self.assertEqual(header, EXPORT_FIELDS)
+        self.assertEqual([row[0] for row in rows], self.ids)
+        self.assertEqual(rows[0][EXPORT_FIELDS.index("sender_name")], "Ada, Obi")
+        self.assertEqual(rows[0][EXPORT_FIELDS.index("narration")], "")
+
+    def test_ndjson_streams_one_object_per_line(self):
+        response, chunks = self.export(file_format="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([row["transaction_id"] for row in rows], self.ids)
+        self.assertEqual(set(rows[0]), set(EXPORT_FIELDS))
+        self.assertEqual(rows[0]["amount"], "150.00")
+        self.assertIsNone(rows[0]["narration"])
+
+    def test_gzip_is_streamed_when_accepted(self):
+        _, plain = self.export()
+        response, chunks = self.export(headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(b"".join(chunks)), b"".join(plain))
+
+    def test_resume_skips_exactly_the_rows_already_exported(self):
+        _, chunks = self.export()
+        full = self.csv_rows(b"".join(chunks))
+        for received in range(1, len(self.ids)):
+            with self.subTest(received=received):
+                _, chunks = self.export(cursor=self.ids[received - 1])
+                # No header on a resumed CSV download
+                rest = self.csv_rows(b"".join(chunks))
+                self.assertEqual(full[: received + 1] + rest, full)
+
+        _, chunks = self.export(file_format="ndjson", cursor=self.ids[2])
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([row["transaction_id"] for row in rows], self.ids[3:])
+
+        _, chunks = self.export(cursor=self.ids[-1])
+        self.assertEqual(b"".join(chunks), b"")
+
+    def test_invalid_requests_are_rejected(self):
+        other = TransactionHistory.objects.exclude(wallet=self.wallet).get()
+        for params in (
+            {"file_format": "xlsx"},
+            {"cursor": "unknown"},
+            {"cursor": other.transaction_id},
+            {"type": "refund"},
+        ):
+            with self.subTest(**params):
+                response = self.client.get(reverse("export_transactions"), params)
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class StatementDownloadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        storage_patch = mock.patch.object(
+            StatementArtifact._meta.get_field("file"),
+            "storage",
+            FileSystemStorage(location=self.root),
+        )
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.wallet = make_wallet()
+        self.recipient = make_wallet(Decimal("0.00"))
+        send_money(self.wallet, self.recipient, "500")
+        self.client = APIClient()
+        self.client.force_authenticate(self.wallet.user)
+        self.period = (timezone.localdate(self.wallet.created_at), timezone.localdate())
+
+    def download(self):
+        with mock.patch("accounts.views.generate_statement.delay") as delay:
+            response = self.client.get(reverse("download_statement"))
+        return response, delay
+
+    def test_cache_miss_queues_one_job_instead_of_rendering(self):
+        response, delay = self.download()
+        self.assertEqual(response.status_code, 202)
+        job = StatementJob.objects.get()
+        delay.assert_called_once_with(str(job.id))
+        data = response.data["data"]
+        self.assertEqual((data["id"], data["status"]), (str(job.id), "pending"))
+        self.assertIsNone(data["download_url"])
+        detail = reverse("statement_job_detail", kwargs={"id": job.id})
+        self.assertEqual(response["Location"], data["url"])
+        self.assertTrue(data["url"].endswith(detail))
+        self.assertFalse(StatementArtifact.objects.exists())
+
+        # Asking again while the job is queued does not queue another
+        response, delay = self.download()
+        self.assertEqual(response.data["data"]["id"], str(job.id))
+        delay.assert_not_called()
+
+    def test_rendered_statement_is_served_from_the_cache(self):
+        _, delay = self.download()
+        generate_statement(delay.call_args.args[0])
+        job = StatementJob.objects.select_related("artifact").get()
+        self.assertEqual(job.status, "completed")
+
+        response, delay = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF-"))
+        delay.assert_not_called()
+        self.assertEqual(StatementJob.objects.count(), 1)
+
+    def test_artifacts_are_reused_until_a_new_transaction(self):
+        first = build_statement(self.wallet, *self.period)
+        newest = TransactionHistory.objects.filter(wallet=self.wallet).get()
+        self.assertEqual(first.last_transaction_id, newest.transaction_id)
+        self.assertEqual(build_statement(self.wallet, *self.period), first)
+        self.assertEqual(cached_statement(self.wallet, *self.period), first)
+
+        send_money(self.wallet, self.recipient, "200")
+        self.assertIsNone(cached_statement(self.wallet, *self.period))
+        response, delay = self.download()
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once()
+
+        second = build_statement(self.wallet, *self.period)
+        self.assertNotEqual(second, first)
+        self.assertEqual(second.transaction_count, 2)
+        self.assertEqual(cached_statement(self.wallet, *self.period), second)
+
+    def test_purge_removes_expired_artifacts_and_old_jobs(self):
+        expired = build_statement(self.wallet, *self.period)
+        StatementArtifact.objects.filter(pk=expired.pk).update(
+            expires_at=timezone.now()
+        )
+        old_job = StatementJob.objects.create(
+            wallet=self.wallet,
+            period_start=self.period[0],
+            period_end=self.period[1],
+            status="completed",
+            artifact=expired,
+        )
+        StatementJob.objects.filter(pk=old_job.pk).update(
+            created_at=timezone.now() - settings.STATEMENT_ARTIFACT_TTL
+        )
+        send_money(self.wallet, self.recipient, "200")
+        current = build_statement(self.wallet, *self.period)
+        pending = StatementJob.objects.create(
+            wallet=self.wallet, period_start=self.period[0], period_end=self.period[1]
+        )
+
+        self.assertEqual(purge_expired_artifacts(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.root, expired.file.name)))
+        self.assertTrue(os.path.exists(os.path.join(self.root, current.file.name)))
+        self.assertEqual(
+            list(StatementArtifact.objects.values_list("pk", flat=True)), [current.pk]
+        )
+        self.assertEqual(
+            list(StatementJob.objects.values_list("pk", flat=True)), [pending.pk]
+        )
+
+
+class StatementRenderingTests(SimpleTestCase):
+    css = "accounts/css/statement.css"
+
+    def asset_url(self, path):
+        return f"{ASSET_BASE_URL}{settings.STATIC_URL}{path}"
+
+    def test_fetcher_serves_local_static_assets(self):
+        with open(finders.find(self.css), "rb") as handle:
+            expected = handle.read()
+        for url in (self.asset_url(self.css), self.asset_url(self.css) + "?v=2#x"):
+            with self.subTest(url=url):
+                fetched = local_url_fetcher(url)
+                self.assertEqual(fetched["string"], expected)
+                self.assertEqual(fetched["mime_type"], "text/css")
+
+    def refused_urls(self):
+        return [
+            f"https://example.com{settings.STATIC_URL}{self.css}",
+            f"http://localhost{settings.STATIC_URL}{self.css}",
+            f"https://statement-assets.invalid.example.com/static/{self.css}",
+            f"{ASSET_BASE_URL}/media/statements/other.pdf",
+            "file:///etc/passwd",
+            "ftp://example.com/statement.css",
+            self.asset_url("accounts/css/missing.css"),
+            self.asset_url("../secret.txt"),
+            self.asset_url("accounts/../../secret.txt"),
+            self.asset_url("/etc/passwd"),
+        ]
+
+    def test_fetcher_refuses_every_other_url(self):
+        for url in self.refused_urls():
+            with self.subTest(url=url):
+                with self.assertRaises(ValueError):
+                    local_url_fetcher(url)
+
+    def test_collected_assets_cannot_escape_static_root(self):
+        with tempfile.TemporaryDirectory() as directory:
+            static_root = os.path.join(directory, "static")
+            os.makedirs(os.path.join(static_root, "accounts", "css"))
+            with open(os.path.join(static_root, self.css), "w") as handle:
+                handle.write("p {}")
+            with open(os.path.join(directory, "secret.txt"), "w") as handle:
+                handle.write("secret")
+
+            with override_settings(STATICFILES_FINDERS=[], STATIC_ROOT=static_root):
+                self.assertEqual(
+                    local_url_fetcher(self.asset_url(self.css))["string"], b"p {}"
+                )
+                for url in self.refused_urls():
+                    with self.subTest(url=url):
+                        with self.assertRaises(ValueError):
+                            local_url_fetcher(url)
+
+
+def section_pdf(texts, **catalog):
+    """A pydyf document with one page per text, sharing one font object."""
+    pdf = pydyf.PDF()
+    font = pydyf.Dictionary(
+        {"Type": "/Font", "Subtype": "/Type1", "BaseFont": "/Helvetica"}
+    )
+    pdf.add_object(font)
+    for text in texts:
+        content = pydyf.Stream(compress=True)
+        content.begin_text()
+        content.set_font_size("F1", 12)
+        content.set_text_matrix(1, 0, 0, 1, 72, 720)
+        content.show_text_string(text)
+        content.end_text()
+        pdf.add_object(content)
+        resources = pydyf.Dictionary({"Font": pydyf.Dictionary({"F1": font.reference})})
+        pdf.add_page(
+            pydyf.Dictionary(
+                {
+                    "Type": "/Page",
+                    "Parent": pdf.pages.reference,
+                    "MediaBox": pydyf.Array([0, 0, 612, 792]),
+                    "Contents": content.reference,
+                    "Resources": resources,
+                }
+            )
+        )
+    pdf.catalog.update(catalog)
+    pdf.info["Title"] = pydyf.String("Statement")
+    return pdf
+
+
+class SectionedPDFWriterTests(SimpleTestCase):
+    def write(self, sections):
+        output = io.BytesIO()
+        writer = SectionedPDFWriter(output)
+        for texts, catalog in sections:
+            writer.add_section(None, section_pdf(texts, **catalog))
+        writer.close()
+        return output.getvalue()
+
+    def test_sections_join_into_one_valid_pdf(self):
+        data = self.write(
+            [
+                (["one", "two"], {"PageMode": "/UseNone"}),
+                (["three"], {"PageMode": "/FullScreen"}),
+                (["four", "five", "six"], {}),
+            ]
+        )
+        reader = PdfReader(io.BytesIO(data), strict=True)
+        self.assertEqual(len(reader.pages), 6)
+        self.assertEqual(
+            [page.extract_text() for page in reader.pages],
+            ["one", "two", "three", "four", "five", "six"],
+        )
+        # The first section's catalog entries and metadata are kept
+        self.assertEqual(reader.trailer["/Root"]["/PageMode"], "/UseNone")
+        self.assertEqual(reader.metadata.title, "Statement")
+
+        # Objects are numbered 1..n once each, pages 1, info 2, catalog 3,
+        # and every cross-reference offset points at its object
+        offsets = re.findall(rb"(?m)^(\d{10}) 00000 n ", data)
+        self.assertEqual(len(offsets), reader.trailer["/Size"] - 1)
+        self.assertEqual(len(re.findall(rb"(?m)^\d+ 0 obj", data)), len(offsets))
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(data[int(offset) :].startswith(b"%d 0 obj" % number))
+        self.assertEqual(reader.trailer.raw_get("/Root").idnum, 3)
+        self.assertEqual(reader.trailer.raw_get("/Info").idnum, 2)
+        for page in reader.pages:
+            self.assertEqual(page.raw_get("/Parent").idnum, 1)
+            self.assertEqual(page["/Resources"]["/Font"]["/F1"]["/Type"], "/Font")
+
+    def test_each_section_keeps_its_own_objects(self):
+        reader = PdfReader(
+            io.BytesIO(self.write([(["a"], {}), (["b"], {})])), strict=True
+        )
+        fonts = {
+            page["/Resources"]["/Font"].raw_get("/F1").idnum for page in reader.pages
+        }
+        contents = {page.raw_get("/Contents").idnum for page in reader.pages}
+        self.assertEqual((len(fonts), len(contents)), (2, 2))
+
+    def test_rendered_statement_is_a_valid_pdf(self):
+        wallet = SimpleNamespace(
+            user=SimpleNamespace(
+                first_name="Ada", last_name="Obi", account_number="0000014579"
+            )
+        )
+        rows = [
+            SimpleNamespace(
+                transaction_id=f"TXN{n}",
+                created_at=timezone.now(),
+                type="credit",
+                amount=Decimal("150.00"),
+                narration="",
+                sender_name="Bola Ade",
+                receiver_name="Ada Obi",
+                balance_after_transaction=Decimal("150.00"),
+            )
+            for n in range(5)
+        ]
+        day = timezone.localdate()
+        with override_settings(STATEMENT_SECTION_ROWS=2):
+            data = render_statement(wallet.user, rows, day, day)
+        reader = PdfReader(io.BytesIO(data), strict=True)
+        # Three sections of at most two rows, each at least one page
+        self.assertGreaterEqual(len(reader.pages), 3)
+        self.assertEqual(reader.trailer["/Root"]["/Pages"]["/Count"], len(reader.pages))
+
+
+@override_settings(STATEMENT_RUN_CHUNK_SIZE=2)
+class StatementRunTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for model in (StatementArtifact, ArchivedSegment):
+            storage_patch = mock.patch.object(
+                model._meta.get_field("file"),
+                "storage",
+                FileSystemStorage(location=directory.name),
+            )
+            storage_patch.start()
+            self.addCleanup(storage_patch.stop)
+        segment_index.cache_clear()
+        self.addCleanup(segment_index.cache_clear)
+
+        self.period = previous_month()
+        opened = timezone.make_aware(
+            datetime.combine(self.period[0] - timedelta(days=30), time(9))
+        )
+        self.wallets = sorted((make_wallet() for _ in range(3)), key=attrgetter("pk"))
+        Wallet.objects.update(created_at=opened)
+        # The first wallet has three rows in the period, the second one and
+        # the third none; a wallet opened after the period is left out
+        first_day = timezone.make_aware(datetime.combine(self.period[0], time(9)))
+        for wallet, days in zip(self.wallets, ([0, 3, 7], [10], [])):
+            for day in days:
+                self.add_row(wallet, first_day + timedelta(days=day))
+        self.add_row(self.wallets[1], first_day - timedelta(days=1))
+        make_wallet()
+
+    def add_row(self, wallet, created_at):
+        row = TransactionHistory.objects.create(
+            wallet=wallet,
+            amount=Decimal("150.00"),
+            type="credit",
+            balance_after_transaction=wallet.balance,
+        )
+        TransactionHistory.objects.filter(pk=row.pk).update(created_at=created_at)
+
+    def mailed(self):
+        """Account numbers of the queued statement emails, in queue order."""
+        return [
+            item["context"]["account_number"]
+            for message in OutboxMessage.objects.order_by("created_at", "id")
+            for item in message.args[0]
+            if item["kind"] == "statement"
+        ]
+
+    def newest_ids(self):
+        start, end = period_bounds(*self.period)
+        return [
+            TransactionHistory.objects.filter(
+                wallet=wallet, created_at__gte=start, created_at__lt=end
+            )
+            .order_by("-created_at", "-pk")
+            .values_list("transaction_id", flat=True)
+            .first()
+            or ""
+            for wallet in self.wallets
+        ]
+
+    def test_run_renders_and_mails_each_wallet_once(self):
+        run = plan_statement_run(*self.period)
+        self.assertEqual((run.total_chunks, run.total_wallets), (2, 3))
+        self.assertEqual(run_statement_chunks(run), 3)
+        self.assertEqual(
+            self.mailed(), [wallet.account_number for wallet in self.wallets]
+        )
+        artifacts = StatementArtifact.objects.order_by("wallet_id")
+        self.assertEqual(
+            [(a.wallet_id, a.transaction_count) for a in artifacts],
+            [(wallet.pk, count) for wallet, count in zip(self.wallets, (3, 1, 0))],
+        )
+        self.assertEqual([a.last_transaction_id for a in artifacts], self.newest_ids())
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.statements_sent), ("completed", 3))
+
+        # Planning and running the period again mails nothing more
+        self.assertEqual(plan_statement_run(*self.period), run)
+        self.assertEqual(run_statement_chunks(run), 0)
+        self.assertEqual(len(self.mailed()), 3)
+
+    def test_statements_stream_one_wallet_at_a_time(self):
+        run = plan_statement_run(*self.period)
+        chunk = claim_chunk(run)
+        rendered = []
+
+        def save(wallet, transactions, *args):
+            # Rows arrive as a lazy stream, not a list loaded up front
+            self.assertNotIsInstance(transactions, (list, tuple))
+            rendered.append(wallet.pk)
+            return save_statement(wallet, transactions, *args)
+
+        with mock.patch("accounts.statement_runs.save_statement", side_effect=save):
+            # Five reads for the whole chunk, then one insert per statement
+            with self.assertNumQueries(5 + 2):
+                results = chunk_statements(chunk)
+        self.assertEqual(rendered, [wallet.pk for wallet in self.wallets[:2]])
+        self.assertEqual([wallet for wallet, _ in results], self.wallets[:2])
+
+    def test_claims_are_leased(self):
+        run = plan_statement_run(*self.period)
+        first, second = claim_chunk(run), claim_chunk(run)
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual({first.status, second.status}, {"processing"})
+        self.assertIsNone(claim_chunk(run))
+
+        # A chunk whose lease ran out is claimed again
+        StatementRunChunk.objects.filter(pk=first.pk).update(
+            claimed_at=timezone.now() - settings.STATEMENT_RUN_CHUNK_LEASE
+        )
+        reclaimed = claim_chunk(run)
+        self.assertEqual(reclaimed.pk, first.pk)
+        self.assertGreater(reclaimed.claimed_at, first.claimed_at)
+        self.assertIsNone(claim_chunk(run))
+
+    def test_a_crashed_workers_chunk_is_resumed_and_mailed_once(self):
+        run = plan_statement_run(*self.period)
+        crashed = claim_chunk(run)
+        with mock.patch(
+            "accounts.statement_runs.notify_many", side_effect=RuntimeError("killed")
+        ):
+            with self.assertRaises(RuntimeError):
+                process_chunk(crashed)
+        crashed.refresh_from_db()
+        self.assertEqual(crashed.status, "processing")
+        rendered = set(StatementArtifact.objects.values_list("pk", flat=True))
+        self.assertEqual(len(rendered), 2)
+        self.assertEqual(self.mailed(), [])
+
+        StatementRunChunk.objects.filter(pk=crashed.pk).update(
+            claimed_at=timezone.now() - settings.STATEMENT_RUN_CHUNK_LEASE
+        )
+        self.assertEqual(run_statement_chunks(run), 3)
+        # The statements rendered before the crash were reused
+        self.assertEqual(StatementArtifact.objects.count(), 3)
+        self.assertTrue(
+            rendered <= set(StatementArtifact.objects.values_list("pk", flat=True))
+        )
+
+        # The first worker finishing late lost its lease and mails nothing
+        self.assertIsNone(process_chunk(crashed))
+        self.assertEqual(
+            self.mailed(), [wallet.account_number for wallet in self.wallets]
+        )
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.statements_sent), ("completed", 3))
+
+    def test_statements_include_archived_rows(self):
+        old_month = add_months(month_start(timezone.localdate()), -14)
+        Wallet.objects.filter(pk__in=[wallet.pk for wallet in self.wallets]).update(
+            created_at=timezone.make_aware(
+                datetime.combine(old_month - timedelta(days=1), time(9))
+            )
+        )
+        old = timezone.make_aware(datetime.combine(old_month, time(12)))
+        for day in (0, 4):
+            self.add_row(self.wallets[0], old + timedelta(days=day))
+        self.add_row(self.wallets[2], old)
+        self.period = (old_month, timezone.localdate() - timedelta(days=1))
+        newest = self.newest_ids()
+        archive_cold_history(segment_wallets=2)
+        self.assertTrue(ArchivedSegment.objects.exists())
+
+        run = plan_statement_run(*self.period)
+        self.assertEqual(run_statement_chunks(run), 3)
+        artifacts = StatementArtifact.objects.order_by("wallet_id")
+        self.assertEqual(
+            [(a.transaction_count, a.last_transaction_id) for a in artifacts],
+            list(zip((5, 2, 1), newest)),
+        )
+
+
+class BulkTransferHoldTests(TestCase):
+    def setUp(self):
+        self.sender = make_wallet(Decimal("5000.00"))
+        self.recipient = make_wallet(Decimal("0.00"))
+
+    def test_only_rows_that_pass_validation_are_held(self):
+        account = self.recipient.account_number
+        rows = [
+            {"recipient": account, "amount": "500"},
+            {"recipient": account, "amount": "-4000"},
+            {"recipient": account, "amount": "0"},
+            {"recipient": account, "amount": "50"},
+            {"recipient": account, "amount": "abc"},
+            {"recipient": User.objects.generate_account_number(), "amount": "900"},
+            {"recipient": self.sender.account_number, "amount": "900"},
+        ]
+        bulk = create_bulk_transfer(self.sender, rows)
+        self.assertEqual(bulk.hold.amount, Decimal("500.00"))
+
+        run_bulk_transfer(bulk)
+        self.assertEqual((bulk.succeeded, bulk.failed), (1, 6))
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, Decimal("4500.00"))
+        self.assertEqual(self.sender.reserved, Decimal("0.00"))
+
+    def test_negative_rows_cannot_offset_the_total(self):
+        rows = [
+            {"recipient": self.recipient.account_number, "amount": "9000"},
+            {"recipient": self.recipient.account_number, "amount": "-8000"},
+        ]
+        with self.assertRaises(InsufficientFunds):
+            create_bulk_transfer(self.sender, rows)
+
+    def test_non_positive_amount_is_rejected(self):
+        for amount in ("0", "-500"):
+            with self.assertRaises(ValidationError) as raised:
+                send_money(self.sender, self.recipient, amount)
+            self.assertIn("amount", raised.exception.detail)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class BulkTransferViewTests(TestCase):
+    def setUp(self):
+        self.sender = make_wallet(Decimal("5000.00"))
+        self.recipients = [make_wallet(Decimal("0.00")) for _ in range(2)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender.user)
+        first, second = (wallet.account_number for wallet in self.recipients)
+        self.rows = [
+            {"recipient": first, "amount": "500", "narration": "rent"},
+            {"recipient": second, "amount": "250.50", "narration": ""},
+            {"recipient": first, "amount": "50", "narration": "too small"},
+            {"recipient": "123", "amount": "500", "narration": "bad account"},
+            {"recipient": second, "amount": "-10", "narration": "negative"},
+        ]
+
+    def assert_processed(self, data):
+        self.assertEqual(data["status"], "completed")
+        self.assertEqual(data["progress"], 100)
+        self.assertEqual((data["succeeded"], data["failed"]), (2, 3))
+        self.assertEqual(
+            [row["status"] for row in data["results"]],
+            ["succeeded", "succeeded", "failed", "failed", "failed"],
+        )
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, Decimal("4249.50"))
+        self.assertEqual(self.sender.reserved, Decimal("0.00"))
+        balances = Wallet.objects.filter(
+            pk__in=[wallet.pk for wallet in self.recipients]
+        ).values_list("balance", flat=True)
+        self.assertEqual(sorted(balances), [Decimal("250.50"), Decimal("500.00")])
+
+    def test_json_batch_runs_inline(self):
+        response = self.client.post(
+            reverse("bulk_transfer"), {"transfers": self.rows}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assert_processed(response.data["data"])
+
+    def test_csv_batch_runs_inline(self):
+        lines = ["recipient,amount,narration"] + [
+            f"{row['recipient']},{row['amount']},{row['narration']}"
+            for row in self.rows
+        ]
+        upload = SimpleUploadedFile(
+            "transfers.csv", "\n".join(lines).encode(), content_type="text/csv"
+        )
+        response = self.client.post(
+            reverse("bulk_transfer"), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assert_processed(response.data["data"])
+
+    def test_csv_without_the_required_columns_is_rejected(self):
+        upload = SimpleUploadedFile("transfers.csv", b"to,value\n1,2\n")
+        response = self.client.post(
+            reverse("bulk_transfer"), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BulkTransfer.objects.exists())
+
+    @override_settings(BULK_TRANSFER_SYNC_LIMIT=2)
+    def test_large_batch_is_queued_and_polled(self):
+        with mock.patch("accounts.views.process_bulk_transfer.delay") as delay:
+            response = self.client.post(
+                reverse("bulk_transfer"), {"transfers": self.rows}, format="json"
+            )
+        self.assertEqual(response.status_code, 202)
+        bulk_id = response.data["data"]["id"]
+        delay.assert_called_once_with(str(bulk_id))
+        self.assertEqual(response.data["data"]["status"], "pending")
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.reserved, Decimal("750.50"))
+
+        url = reverse("bulk_transfer_detail", args=[bulk_id])
+        self.assertEqual(self.client.get(url).data["data"]["progress"], 0)
+        process_bulk_transfer(str(bulk_id))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assert_processed(response.data["data"])
+
+        # Other users cannot poll the batch
+        self.client.force_authenticate(self.recipients[0].user)
+        self.assertEqual(self.client.get(url).status_code, 404)
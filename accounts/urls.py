@@ -8,6 +8,12 @@ from rest_framework_simplejwt.views import (
 
 urlpatterns = [
     path("send_money/", views.SendMoneyView.as_view(), name="send_money"),
+    path("bulk_transfer/", views.BulkTransferView.as_view(), name="bulk_transfer"),
+    path(
+        "bulk_transfer/<uuid:id>/",
+        views.BulkTransferDetailView.as_view(),
+        name="bulk_transfer_detail",
+    ),
     path(
         "transaction_history/",
         views.TransactionHistoryView.as_view(),
@@ -16,5 +22,26 @@ urlpatterns = [
     path(
         "statement/", views.DownloadStatementView.as_view(), name="download_statement"
     ),
-    path("top_up/", views.TopUpWalletView.as_view(), name="top_up_wallet")
+    path("statement/jobs/", views.StatementJobView.as_view(), name="statement_jobs"),
+    path(
+        "statement/jobs/<uuid:id>/",
+        views.StatementJobDetailView.as_view(),
+        name="statement_job_detail",
+    ),
+    path(
+        "statement/jobs/<uuid:id>/download/",
+        views.StatementJobDownloadView.as_view(),
+        name="statement_job_download",
+    ),
+    path(
+        "transactions/export/",
+        views.ExportTransactionsView.as_view(),
+        name="export_transactions",
+    ),
+    path("top_up/", views.TopUpWalletView.as_view(), name="top_up_wallet"),
+    path(
+        "idempotency/metrics/",
+        views.IdempotencyMetricsView.as_view(),
+        name="idempotency_metrics",
+    ),
 ]
@@ -0,0 +1,190 @@
+import atexit
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Custom epoch (2025-01-01T00:00:00Z) in milliseconds; 41 bits of time after it
+# last until 2094.
+ID_EPOCH_MS = 1735689600000
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ID_LENGTH = 20
+
+NODE_LEASE_KEY = "transaction-id:node:{}"
+
+
+class NodeIdUnavailable(Exception):
+    """Every node id is leased by another process."""
+
+
+class NodeLease:
+    """
+    A node id leased by this process from a cache shared by every process
+    that generates ids: one key per node id, claimed with an atomic ``add``.
+    The lease is renewed at half its timeout while ids are generated; if it
+    was lost meanwhile, a new node id is leased before the next id.
+    """
+
+    def __init__(self, cache, timeout=None):
+        self.cache = cache
+        self.timeout = timeout or settings.TRANSACTION_ID_NODE_LEASE
+        self.token = uuid.uuid4().hex
+        self.node_id = None
+        self.renew_at = 0
+
+    def current(self):
+        """The leased node id, renewing or replacing the lease when due."""
+        now = time.monotonic()
+        if self.node_id is not None and now < self.renew_at:
+            return self.node_id
+        key = NODE_LEASE_KEY.format(self.node_id)
+        if self.node_id is None or self.cache.get(key) != self.token:
+            self.node_id = self.acquire()
+        else:
+            self.cache.touch(key, self.timeout)
+        self.renew_at = now + self.timeout / 2
+        return self.node_id
+
+    def acquire(self):
+        start = random.randrange(MAX_NODE_ID + 1)
+        for offset in range(MAX_NODE_ID + 1):
+            node_id = (start + offset) & MAX_NODE_ID
+            if self.cache.add(NODE_LEASE_KEY.format(node_id), self.token, self.timeout):
+                return node_id
+        raise NodeIdUnavailable(
+            f"All {MAX_NODE_ID + 1} transaction id nodes are leased"
+        )
+
+    def release(self):
+        key = NODE_LEASE_KEY.format(self.node_id)
+        if self.node_id is not None and self.cache.get(key) == self.token:
+            self.cache.delete(key)
+        self.node_id = None
+
+
+def configured_node_id():
+    """TRANSACTION_ID_NODE_ID as an int, or None if it is not set."""
+    value = settings.TRANSACTION_ID_NODE_ID
+    if value in (None, ""):
+        return None
+    try:
+        node_id = int(value)
+    except (TypeError, ValueError):
+        node_id = -1
+    if not 0 <= node_id <= MAX_NODE_ID:
+        raise ImproperlyConfigured(
+            f"TRANSACTION_ID_NODE_ID must be between 0 and {MAX_NODE_ID}"
+        )
+    return node_id
+
+
+def process_lease():
+    """Lease a node id for this process from the default cache."""
+    cache = caches["default"]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        # Each process would lease from its own copy and could pick the same id
+        raise ImproperlyConfigured(
+            "Transaction ids need TRANSACTION_ID_NODE_ID or a cache shared "
+            "by all processes (REDIS_URL) to lease a node id from"
+        )
+    lease = NodeLease(cache)
+    atexit.register(lease.release)
+    return lease
+
+
+class SnowflakeGenerator:
+    """
+    Time-ordered, node-aware 63-bit ids: 41 bits of milliseconds, 10 bits of
+    node id and a 12-bit per-millisecond sequence. Ids are unique without any
+    database round trip and sort by creation time, so index inserts stay
+    roughly sequential.
+    """
+
+    def __init__(self, node_id=None):
+        self._fixed_node_id = node_id
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lease = None
+        self._node_id = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def node_id(self):
+        """
+        This process's node id, leasing one if needed. Call it when a worker
+        starts so a missing node id fails there instead of on a transfer.
+        """
+        with self._lock:
+            return self._resolve_node()
+
+    def _resolve_node(self):
+        if self._pid != os.getpid():
+            # Resolve again after a fork so children never share a node id
+            node_id = self._fixed_node_id
+            if node_id is None:
+                node_id = configured_node_id()
+            self._lease = None if node_id is not None else process_lease()
+            self._node_id = node_id
+            self._pid = os.getpid()
+            self._last_ms = -1
+        if self._lease is not None:
+            self._node_id = self._lease.current()
+        return self._node_id
+
+    def next_id(self):
+        with self._lock:
+            node_id = self._resolve_node()
+            now = self._now_ms()
+            if now < self._last_ms:
+                # Clock moved backwards: wait rather than risk a duplicate
+                now = self._wait_until(self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    now = self._wait_until(self._last_ms + 1)
+            else:
+                self._sequence = 0
+            self._last_ms = now
+
+            return (
+                ((now - ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS))
+                | (node_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def next_str(self):
+        """Return the next id zero-padded to a fixed width so it sorts as text."""
+        return f"{self.next_id():0{ID_LENGTH}d}"
+
+    @staticmethod
+    def _now_ms():
+        return time.time_ns() // 1_000_000
+
+    def _wait_until(self, target_ms):
+        now = self._now_ms()
+        while now < target_ms:
+            time.sleep((target_ms - now) / 1000)
+            now = self._now_ms()
+        return now
+
+
+def id_generated_at(value):
+    """When the snowflake id string ``value`` was generated, or None."""
+    if len(value) != ID_LENGTH or not value.isdigit():
+        return None
+    ms = (int(value) >> (NODE_BITS + SEQUENCE_BITS)) + ID_EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+transaction_id_generator = SnowflakeGenerator()
@@ -1,20 +1,46 @@
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.request import Request
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
-from django.template.loader import render_to_string
-from django.http import HttpResponse
+from rest_framework.exceptions import ValidationError
+import re
+from itertools import chain
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from django.contrib.humanize.templatetags.humanize import intcomma
-from weasyprint import HTML
-from datetime import datetime
-from django.template.loader import render_to_string
 from accounts.models import TransactionHistory
 from users.models import User
-from .serializers import SendMoneySerializer, TransactionHistorySerializer, TopUpWalletSerializer
-from .models import TransactionHistory
+from django.conf import settings
+from .serializers import (
+    SendMoneySerializer,
+    TransactionHistorySerializer,
+    TransactionHistoryFilterSerializer,
+    TopUpWalletSerializer,
+    BulkTransferSerializer,
+    BulkTransferStatusSerializer,
+    StatementRequestSerializer,
+    StatementJobSerializer,
+)
+from .models import TransactionHistory, Wallet, BulkTransfer, StatementJob
+from .bulk import create_bulk_transfer, run_bulk_transfer
+from .ledger import InsufficientFunds
+from .tasks import generate_statement, process_bulk_transfer
+from .statements import cached_statement
+from .idempotency import idempotent, get_metrics
+from .pagination import KeysetPagination, StandardResultsSetPagination
+from .archive import ArchivedHistory, MergedHistory
+from .exports import (
+    CONTENT_TYPES,
+    archived_export_rows,
+    export_rows,
+    resume_after,
+    stream_csv,
+    stream_ndjson,
+)
 # from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 
 
@@ -23,6 +49,7 @@ class SendMoneyView(APIView):
     permission_classes = [IsAuthenticated]
     # throttle_scope = "send_money"
 
+    @idempotent
     def post(self, request: Request):
         amount = request.data.get("amount")
         recipient = request.data.get("recipient")
@@ -57,6 +84,11 @@ class SendMoneyView(APIView):
                 },
                 status=status.HTTP_201_CREATED,
             )
+        except ValidationError as e:
+            return Response(
+                {"message": "Validation error", "errors": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         except Exception as e:
             return Response(
                 {"message": str(e)},
@@ -64,74 +96,335 @@ class SendMoneyView(APIView):
             )
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 3  # Number of items per page
-    page_size_query_param = 'page_size'
+class BulkTransferView(APIView):
+    """
+    Send money to many recipients at once from a JSON list or a CSV upload
+    with recipient, amount and narration columns. Small batches run inline;
+    larger ones run on a worker and are polled through BulkTransferDetailView.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request: Request):
+        serializer = BulkTransferSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            wallet = Wallet.objects.get(user=request.user)
+        except Wallet.DoesNotExist:
+            return Response(
+                {"message": "Sender wallet not found."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rows = serializer.validated_data["rows"]
+        try:
+            bulk = create_bulk_transfer(wallet, rows)
+        except InsufficientFunds:
+            return Response(
+                {"message": "Insufficient funds for the batch total."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if len(rows) <= settings.BULK_TRANSFER_SYNC_LIMIT:
+            run_bulk_transfer(bulk)
+            return Response(
+                {
+                    "message": "Bulk transfer processed",
+                    "data": BulkTransferStatusSerializer(bulk).data,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+
+        process_bulk_transfer.delay(str(bulk.id))
+        return Response(
+            {
+                "message": "Bulk transfer queued",
+                "data": BulkTransferStatusSerializer(bulk).data,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class BulkTransferDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request, id):
+        try:
+            bulk = BulkTransfer.objects.get(id=id, wallet__user=request.user)
+        except BulkTransfer.DoesNotExist:
+            return Response(
+                {"message": "Bulk transfer not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "message": "Bulk transfer fetched successfully",
+                "data": BulkTransferStatusSerializer(bulk).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class TransactionHistoryView(APIView):
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
+    # Kept for clients that still page with ?page=
+    legacy_pagination_class = StandardResultsSetPagination
 
     def get(self, request: Request):
-        transactions = TransactionHistory.objects.filter(wallet__user=request.user).order_by('-created_at')
-        
-        # Set up pagination
+        filters = TransactionHistoryFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(
+                {"message": "Validation error", "data": filters.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        transactions = filters.filter_queryset(
+            TransactionHistory.objects.for_user(request.user)
+        )
+
+        archive = ArchivedHistory(user=request.user, filters=filters)
+
+        if "page" in request.query_params:
+            transactions = transactions.order_by("-created_at", "-pk")
+            return self.get_numbered_page(
+                request, MergedHistory(transactions, archive)
+            )
+
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(transactions, request)
-        
-        if page is not None:
-            serializer = TransactionHistorySerializer(page, many=True)
-            return paginator.get_paginated_response({
-                "message": "Transaction history fetched successfully",
-                "data": serializer.data,
-                "pagination": {
-                    "next": paginator.get_next_link(),
-                    "previous": paginator.get_previous_link(),
-                    "count": paginator.page.paginator.count,
-                    "page": paginator.page.number,
-                    "pages": paginator.page.paginator.num_pages,
-                }
-            })
-            
-        serializer = TransactionHistorySerializer(transactions, many=True)
+        paginator.archive = archive
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionHistorySerializer(page, many=True)
         return Response(
             {
                 "message": "Transaction history fetched successfully",
                 "data": serializer.data,
+                "pagination": paginator.get_pagination_info(),
             },
             status=status.HTTP_200_OK,
         )
 
+    def get_numbered_page(self, request, transactions):
+        paginator = self.legacy_pagination_class()
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionHistorySerializer(page, many=True)
+        return paginator.get_paginated_response({
+            "message": "Transaction history fetched successfully",
+            "data": serializer.data,
+            "pagination": {
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+                "count": paginator.page.paginator.count,
+                "page": paginator.page.number,
+                "pages": paginator.page.paginator.num_pages,
+            }
+        })
+
 
 class DownloadStatementView(APIView):
+    """
+    Full-history statement. Served from the artifact cache when nothing
+    changed; otherwise it is rendered on a worker and the response is a 202
+    with the job to poll, as from StatementJobView.
+    """
+
     # authentication_classes = [SessionAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         user = request.user
-        transactions = TransactionHistory.objects.filter(wallet__user=user).order_by('-created_at')
+        wallet = Wallet.objects.select_related("user").get(user=user)
+        period_start = timezone.localdate(wallet.created_at)
+        period_end = timezone.localdate()
+        artifact = cached_statement(wallet, period_start, period_end)
+        if artifact is not None:
+            return FileResponse(
+                artifact.file.open("rb"),
+                as_attachment=True,
+                filename=f"statement_{user.account_number}.pdf",
+                content_type="application/pdf",
+            )
+
+        # Repeated requests while a render is queued share its job
+        job = StatementJob.objects.filter(
+            wallet=wallet,
+            period_start=period_start,
+            period_end=period_end,
+            status__in=["pending", "processing"],
+        ).first()
+        if job is None:
+            job = StatementJob.objects.create(
+                wallet=wallet, period_start=period_start, period_end=period_end
+            )
+            generate_statement.delay(str(job.id))
+        data = StatementJobSerializer(job, context={"request": request}).data
+        return Response(
+            {"message": "Statement queued", "data": data},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": data["url"]},
+        )
 
-        # Render the statement template
-        html_string = render_to_string(
-            'accounts/statement.html',  # Make sure this template exists
+
+class StatementJobView(APIView):
+    """Queue a statement for a date range; poll StatementJobDetailView for it."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request: Request):
+        serializer = StatementRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "data": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            wallet = Wallet.objects.get(user=request.user)
+        except Wallet.DoesNotExist:
+            return Response(
+                {"message": "Wallet not found."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        job = StatementJob.objects.create(
+            wallet=wallet,
+            period_start=serializer.validated_data["start_date"],
+            period_end=serializer.validated_data["end_date"],
+        )
+        generate_statement.delay(str(job.id))
+        return Response(
             {
-                'user': user,
-                'transactions': transactions,
-                'date': datetime.now(),
-            }
+                "message": "Statement queued",
+                "data": StatementJobSerializer(job, context={"request": request}).data,
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
 
-        # Generate PDF from HTML
-        pdf_file = HTML(string=html_string).write_pdf()
 
-        # Return PDF as response
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="statement_{user.account_number}.pdf"'
+class StatementJobDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request, id):
+        try:
+            job = StatementJob.objects.get(id=id, wallet__user=request.user)
+        except StatementJob.DoesNotExist:
+            return Response(
+                {"message": "Statement job not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "message": "Statement job fetched successfully",
+                "data": StatementJobSerializer(job, context={"request": request}).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class StatementJobDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request, id):
+        job = (
+            StatementJob.objects.select_related("artifact")
+            .filter(id=id, wallet__user=request.user, status="completed")
+            .first()
+        )
+        if job is None or job.artifact is None:
+            return Response(
+                {"message": "Statement not available"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        artifact = job.artifact
+        return FileResponse(
+            artifact.file.open("rb"),
+            as_attachment=True,
+            filename=(
+                f"statement_{request.user.account_number}_"
+                f"{artifact.period_start}_{artifact.period_end}.pdf"
+            ),
+            content_type="application/pdf",
+        )
+
+
+class ExportTransactionsView(APIView):
+    """
+    Stream the user's transaction history as CSV or NDJSON, oldest first.
+
+    Accepts the history filters plus ``file_format`` (csv or ndjson). To
+    resume an interrupted download, pass the last received transaction id as
+    ``cursor``; CSV resumes without repeating the header.
+    """
+
+    permission_classes = [IsAuthenticated]
+    accepts_gzip = re.compile(r"\bgzip\b")
+
+    def get(self, request: Request):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in CONTENT_TYPES:
+            return Response(
+                {"message": "file_format must be csv or ndjson"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        filters = TransactionHistoryFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(
+                {"message": "Validation error", "data": filters.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        transactions = filters.filter_queryset(
+            TransactionHistory.objects.for_user(request.user)
+        )
+
+        # Archived rows are older than every live row, so are streamed first
+        archive = ArchivedHistory(user=request.user, filters=filters)
+        archived = archive.oldest_first()
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            live = resume_after(transactions, cursor)
+            if live is not None:
+                transactions, archived = live, ()
+            else:
+                position = archive.position_of(cursor)
+                if position is None:
+                    return Response(
+                        {"message": "Invalid cursor"},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                archived = archive.oldest_first(after=position)
+
+        chunk_size = settings.TRANSACTION_EXPORT_CHUNK_SIZE
+        rows = chain(
+            archived_export_rows(archived), export_rows(transactions, chunk_size)
+        )
+        if file_format == "csv":
+            content = stream_csv(rows, chunk_size, header=not cursor)
+        else:
+            content = stream_ndjson(rows, chunk_size)
+        content = (chunk.encode() for chunk in content)
+
+        gzip = self.accepts_gzip.search(request.headers.get("Accept-Encoding", ""))
+        if gzip:
+            content = compress_sequence(content)
+        response = StreamingHttpResponse(
+            content, content_type=CONTENT_TYPES[file_format]
+        )
+        if gzip:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions_{request.user.account_number}'
+            f'.{file_format}"'
+        )
         return response
 
 
 class TopUpWalletView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = TopUpWalletSerializer(data=request.data)
         if serializer.is_valid():
@@ -151,3 +444,16 @@ class TopUpWalletView(APIView):
                 "data": serializer.errors,
             }
             return Response(data=response, status=status.HTTP_400_BAD_REQUEST)
+
+
+class IdempotencyMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request):
+        return Response(
+            {
+                "message": "Idempotency metrics fetched successfully",
+                "data": get_metrics(),
+            },
+            status=status.HTTP_200_OK,
+        )
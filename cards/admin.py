@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Card
+from .models import Card, CardDailySpend, CardIssuance, CardTransaction
 
 # Register your models here.
 admin.site.register(Card)
+admin.site.register(CardIssuance)
+admin.site.register(CardTransaction)
+admin.site.register(CardDailySpend)
@@ -0,0 +1,317 @@
+import hashlib
+import hmac
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.holds import capture_hold, place_hold, release_hold
+from accounts.ledger import InsufficientFunds
+from accounts.models import Wallet, WalletHold
+from accounts.utils.ids import id_generated_at, transaction_id_generator
+from notifications.outbox import enqueue
+from users.hashing import verify_secret
+from .journal import record_card_transaction, spent_on
+from .models import Card
+from .tasks import record_card_authorization
+
+# Authorizations run against the cache, not the Card row. Each card has a
+# cached profile (owner, wallet, status, expiry, limit and a PIN verifier)
+# and one spend counter per day, in kobo so it can be changed with atomic
+# INCRBY/DECRBY. Funds are reserved with a hold on the owner's wallet, which
+# is captured or released later. The Card row is brought up to date
+# afterwards by the record_card_authorization task, which also adds the
+# authorization to the card's journal; the task is queued through the
+# outbox in the transaction that places or settles the hold.
+PROFILE_KEY = "card:auth:profile:{}"
+HOLD_REFERENCE = "card:{}:{}"
+SPEND_KEY = "card:auth:spend:{}:{:%Y%m%d}"
+PIN_FAILURES_KEY = "card:auth:pin-failures:{}:{:%Y%m%d}"
+# Day buckets outlive their day so late persists and reads still find them
+DAY_BUCKET_TIMEOUT = int(timedelta(days=2).total_seconds())
+
+DECLINE_REASONS = {
+    "card_not_found": "Card not found",
+    "card_inactive": "Card is not active",
+    "card_expired": "Card has expired",
+    "pin_not_set": "Card PIN has not been set",
+    "pin_tries_exceeded": "Too many incorrect PIN attempts today",
+    "incorrect_pin": "Incorrect PIN",
+    "daily_limit_exceeded": "Daily spending limit exceeded",
+    "insufficient_funds": "Insufficient funds",
+}
+
+
+def to_kobo(amount):
+    return int(Decimal(str(amount)) * 100)
+
+
+def from_kobo(value):
+    return (Decimal(value) / 100).quantize(Decimal("0.01"))
+
+
+def pin_verifier(card_id, pin):
+    # A keyed digest checked in microseconds; the password-grade hash is only
+    # verified on a cache miss. Guessing is bounded by CARD_PIN_MAX_ATTEMPTS.
+    message = f"{card_id}:{pin}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+@dataclass
+class Authorization:
+    card_id: str
+    amount: Decimal
+    approved: bool
+    reason: str = ""
+    authorization_id: str = ""
+    daily_spend: Decimal = None
+    authorized_at: datetime = None
+
+    @property
+    def message(self):
+        if self.approved:
+            return "Authorization approved"
+        return DECLINE_REASONS[self.reason]
+
+
+def load_profile(card_id):
+    """The cached authorization profile of a card, loaded on a miss, or None."""
+    card = (
+        Card.objects.filter(pk=card_id)
+        .only(
+            "user_id",
+            "is_active",
+            "expires_on",
+            "card_number",
+            "pin_hash",
+            "daily_limit",
+        )
+        .first()
+    )
+    if card is None:
+        return None
+    today = timezone.now().date()
+    wallet_id = (
+        Wallet.objects.filter(user_id=card.user_id).values_list("pk", flat=True).first()
+    )
+    profile = {
+        "user_id": str(card.user_id),
+        "wallet_id": str(wallet_id) if wallet_id else None,
+        "last_four": card.card_number[-4:],
+        "is_active": card.is_active,
+        "expires_at": (
+            timezone.make_aware(datetime.combine(card.expires_on, time())).timestamp()
+            if card.expires_on
+            else None
+        ),
+        "pin_hash": card.pin_hash,
+        "pin_verifier": None,
+        "daily_limit": to_kobo(card.daily_limit),
+        # Seed for a spend counter that is missing from the cache
+        "spent_today": to_kobo(spent_on(card_id, today)),
+        "day": today.isoformat(),
+    }
+    cache.set(PROFILE_KEY.format(card_id), profile, settings.CARD_AUTH_PROFILE_TIMEOUT)
+    return profile
+
+
+def forget_card(card_id):
+    """Drop the cached profile so the next authorization reloads the card."""
+    cache.delete(PROFILE_KEY.format(card_id))
+
+
+def forget_cards(card_ids):
+    """``forget_card`` for many cards with one cache call."""
+    cache.delete_many([PROFILE_KEY.format(card_id) for card_id in card_ids])
+
+
+def counter_add(key, delta, seed, timeout):
+    """Atomically add ``delta`` to a counter, seeding it first if missing."""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, seed, timeout=timeout)
+        return cache.incr(key, delta)
+
+
+def check_pin(card_id, profile, pin):
+    if profile["pin_verifier"] is not None:
+        return hmac.compare_digest(profile["pin_verifier"], pin_verifier(card_id, pin))
+    if not profile["pin_hash"] or not verify_secret(str(pin), profile["pin_hash"]):
+        return False
+    profile["pin_verifier"] = pin_verifier(card_id, pin)
+    cache.set(PROFILE_KEY.format(card_id), profile, settings.CARD_AUTH_PROFILE_TIMEOUT)
+    return True
+
+
+def authorize(card_id, amount, pin, user=None, persist=True):
+    """
+    Authorize a card payment of ``amount``: check the card's status, expiry
+    and PIN, count the amount against the daily limit with an atomic counter
+    update and hold it on the owner's wallet. With ``persist``, approved
+    authorizations are persisted to the Card by a background task queued
+    with the hold. ``user``, when given, must own the card.
+    """
+    card_id = str(card_id)
+    amount = Decimal(str(amount))
+    result = Authorization(card_id=card_id, amount=amount, approved=False)
+    now = timezone.now()
+    today = now.date()
+    failures_key = PIN_FAILURES_KEY.format(card_id, today)
+
+    cached = cache.get_many([PROFILE_KEY.format(card_id), failures_key])
+    profile = cached.get(PROFILE_KEY.format(card_id)) or load_profile(card_id)
+    if profile is None or (user is not None and profile["user_id"] != str(user.pk)):
+        result.reason = "card_not_found"
+        return result
+    if not profile["is_active"]:
+        result.reason = "card_inactive"
+        return result
+    if profile["expires_at"] is None or profile["expires_at"] < now.timestamp():
+        result.reason = "card_expired"
+        return result
+    if not profile["pin_hash"]:
+        result.reason = "pin_not_set"
+        return result
+    if cached.get(failures_key, 0) >= settings.CARD_PIN_MAX_ATTEMPTS:
+        result.reason = "pin_tries_exceeded"
+        return result
+    if not check_pin(card_id, profile, pin):
+        counter_add(failures_key, 1, 0, DAY_BUCKET_TIMEOUT)
+        result.reason = "incorrect_pin"
+        return result
+
+    kobo = to_kobo(amount)
+    spend_key = SPEND_KEY.format(card_id, today)
+    # The profile's spend is only a valid seed on the day it was loaded
+    spend_seed = profile["spent_today"] if profile["day"] == today.isoformat() else 0
+
+    spent = counter_add(spend_key, kobo, spend_seed, DAY_BUCKET_TIMEOUT)
+    if spent > profile["daily_limit"]:
+        cache.decr(spend_key, kobo)
+        result.reason = "daily_limit_exceeded"
+        return result
+
+    result.authorization_id = transaction_id_generator.next_str()
+    result.daily_spend = from_kobo(spent)
+    result.authorized_at = now
+    try:
+        if profile["wallet_id"] is None:
+            raise InsufficientFunds(None)
+        with transaction.atomic():
+            place_hold(
+                profile["wallet_id"],
+                amount,
+                reference=HOLD_REFERENCE.format(card_id, result.authorization_id),
+                narration=f"Card payment with card ending {profile['last_four']}",
+                expires_in=settings.CARD_AUTHORIZATION_HOLD_TIMEOUT,
+            )
+            if persist:
+                persist_authorization(result)
+    except InsufficientFunds:
+        cache.decr(spend_key, kobo)
+        return Authorization(
+            card_id=card_id,
+            amount=amount,
+            approved=False,
+            reason="insufficient_funds",
+        )
+
+    result.approved = True
+    return result
+
+
+def persist_authorization(result):
+    """
+    Queue the update of the Card row for an authorization in the outbox of
+    the current transaction, the one placing its hold.
+    """
+    enqueue(
+        record_card_authorization,
+        result.card_id,
+        str(result.amount),
+        result.authorized_at.date().isoformat(),
+        result.authorized_at.isoformat(),
+        authorization_id=result.authorization_id,
+    )
+
+
+def authorization_hold(card_id, authorization_id, user=None):
+    """The hold placed by an authorization of the card, or None."""
+    holds = WalletHold.objects.filter(
+        reference=HOLD_REFERENCE.format(card_id, authorization_id)
+    )
+    if user is not None:
+        holds = holds.filter(wallet__user=user)
+    return holds.first()
+
+
+def refund_spend(card_id, authorization_id, amount):
+    """
+    Take released funds back off the daily spend of the authorization's day.
+    Call it in the transaction that settles the hold: the journal entry and
+    the Card update commit with it, and the cached counter is changed once
+    they have.
+    """
+    authorized_at = id_generated_at(authorization_id)
+    record_card_transaction(
+        card_id,
+        "release",
+        authorization_id,
+        amount,
+        authorized_at.date(),
+        timezone.now(),
+    )
+
+    def refund_counter():
+        try:
+            cache.decr(SPEND_KEY.format(card_id, authorized_at.date()), to_kobo(amount))
+        except ValueError:
+            # The day's counter is gone; the queued task corrects the Card row
+            pass
+
+    transaction.on_commit(refund_counter)
+    enqueue(
+        record_card_authorization,
+        str(card_id),
+        str(-amount),
+        authorized_at.date().isoformat(),
+        authorized_at.isoformat(),
+    )
+
+
+def capture_authorization(hold, card_id, authorization_id, amount=None):
+    """
+    Capture ``amount`` (by default all) of an authorization, debiting the
+    wallet and releasing the rest. Returns the history row, or None if the
+    authorization was already captured, released or expired.
+    """
+    authorized = hold.remaining
+    with transaction.atomic():
+        entry = capture_hold(hold, amount)
+        if entry is not None:
+            record_card_transaction(
+                card_id,
+                "capture",
+                authorization_id,
+                entry.amount,
+                id_generated_at(authorization_id).date(),
+                entry.created_at,
+                transaction_id=entry.transaction_id,
+            )
+            if entry.amount < authorized:
+                refund_spend(card_id, authorization_id, authorized - entry.amount)
+    return entry
+
+
+def release_authorization(hold, card_id, authorization_id):
+    """Release an authorization's hold; returns None if it was already settled."""
+    with transaction.atomic():
+        released = release_hold(hold)
+        if released is not None:
+            refund_spend(card_id, authorization_id, released.remaining)
+    return released
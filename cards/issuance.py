@@ -0,0 +1,232 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from accounts.ledger import InsufficientFunds, apply_balance_changes
+from accounts.models import TransactionHistory, Wallet
+from notifications.service import notify_many
+from users.models import User
+from .email_utils import card_creation_notification
+from .models import (
+    MAX_ACTIVE_CARDS,
+    Card,
+    generate_card_number,
+    new_card_expiry,
+    parse_expiry,
+)
+
+# Attempts at a chunk whose pre-checked card numbers were taken by a card
+# created concurrently; each attempt draws fresh numbers
+CHUNK_ATTEMPTS = 3
+
+
+def generate_card_numbers(card_type, count):
+    """
+    ``count`` distinct new card numbers. Candidates are deduplicated in
+    memory and checked against existing cards through the card number's
+    unique index, one query per round; a round only redraws the few that
+    collided.
+    """
+    numbers = set()
+    while len(numbers) < count:
+        candidates = {
+            generate_card_number(card_type) for _ in range(count - len(numbers))
+        } - numbers
+        taken = set(
+            Card.objects.filter(card_number__in=candidates).values_list(
+                "card_number", flat=True
+            )
+        )
+        numbers |= candidates - taken
+    return list(numbers)
+
+
+def charge_fees(wallets, fee):
+    """
+    Debit ``fee`` from each wallet, respecting holds, and return the new
+    balances of the wallets charged. All wallets are charged with one
+    UPDATE; if one of them can no longer pay, that update is rolled back and
+    each wallet is charged on its own.
+    """
+    ids = [wallet.pk for wallet in wallets]
+    try:
+        with transaction.atomic():
+            charged = Wallet.objects.filter(
+                pk__in=ids, balance__gte=F("reserved") + fee
+            ).update(balance=F("balance") - fee, updated_at=timezone.now())
+            if charged != len(ids):
+                raise InsufficientFunds(None)
+    except InsufficientFunds:
+        ids = []
+        for wallet in wallets:
+            try:
+                with transaction.atomic():
+                    apply_balance_changes({wallet.pk: -fee})
+            except InsufficientFunds:
+                continue
+            ids.append(wallet.pk)
+    return dict(Wallet.objects.filter(pk__in=ids).values_list("pk", "balance"))
+
+
+def result(user, status, **extra):
+    return {"user": user.email, "status": status, **extra}
+
+
+def eligible_users(issuance, user_ids, fee):
+    """
+    Split the chunk's users into those who can get a card and failure
+    results by user id, with the same rules as ``Card.create_card``, using
+    two queries.
+    """
+    users = {
+        str(user.pk): user
+        for user in User.objects.filter(pk__in=user_ids).select_related("wallet")
+    }
+    active = {
+        str(row["user_id"]): row
+        for row in Card.objects.filter(user_id__in=user_ids, is_active=True)
+        .values("user_id")
+        .annotate(
+            total=Count("pk"),
+            same_type=Count("pk", filter=Q(card_type=issuance.card_type)),
+        )
+    }
+
+    eligible, failures = [], {}
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if user is None:
+            failures[user_id] = {
+                "user": user_id,
+                "status": "failed",
+                "error": "User not found",
+            }
+            continue
+        cards = active.get(user_id, {"total": 0, "same_type": 0})
+        wallet = getattr(user, "wallet", None)
+        if wallet is None:
+            error = "Wallet not found"
+        elif cards["same_type"]:
+            error = f"Already has an active {issuance.card_type} card"
+        elif cards["total"] >= MAX_ACTIVE_CARDS:
+            error = f"Maximum limit of {MAX_ACTIVE_CARDS} active cards reached"
+        elif wallet.available_balance < fee:
+            error = "Insufficient balance for card creation fee"
+        else:
+            eligible.append(user)
+            continue
+        failures[user_id] = result(user, "failed", error=error)
+    return eligible, failures
+
+
+def issue_chunk(issuance, user_ids, fee):
+    """
+    Issue cards to the chunk's eligible users: charge their fees, then
+    create the cards and fee entries with one insert each and queue the
+    emails. Must run inside ``transaction.atomic()``; returns the results
+    in the order of ``user_ids``.
+    """
+    eligible, results = eligible_users(issuance, user_ids, fee)
+
+    balances = charge_fees([user.wallet for user in eligible], fee)
+    numbers = iter(generate_card_numbers(issuance.card_type, len(balances)))
+    card_expiry_date = new_card_expiry()
+    narration = f"Card creation fee for new {issuance.card_type} card"
+
+    cards, entries, notifications = [], [], []
+    for user in eligible:
+        wallet = user.wallet
+        if wallet.pk not in balances:
+            results[str(user.pk)] = result(
+                user, "failed", error="Insufficient balance for card creation fee"
+            )
+            continue
+        wallet.balance = balances[wallet.pk]
+        # bulk_create skips save(), so fields it fills in are set here
+        card = Card(
+            user=user,
+            card_type=issuance.card_type,
+            card_number=next(numbers),
+            cvv="".join(random.choices("0123456789", k=3)),
+            card_expiry_date=card_expiry_date,
+            expires_on=parse_expiry(card_expiry_date),
+            # No PIN until the cardholder sets one; authorizations need it
+            pin_hash="",
+        )
+        cards.append(card)
+        entries.append(
+            TransactionHistory(
+                wallet_id=wallet.pk,
+                amount=fee,
+                type="debit",
+                narration=narration,
+                balance_after_transaction=wallet.balance,
+            )
+        )
+        notifications.append(card_creation_notification(user, card))
+        results[str(user.pk)] = result(
+            user,
+            "issued",
+            card_id=str(card.pk),
+            masked_card_number=card.masked_card_number,
+        )
+
+    Card.objects.bulk_create(cards)
+    TransactionHistory.objects.bulk_create(entries)
+    batch_size = settings.CARD_ISSUANCE_MAIL_BATCH_SIZE
+    for offset in range(0, len(notifications), batch_size):
+        notify_many(notifications[offset : offset + batch_size])
+    return [results[user_id] for user_id in user_ids]
+
+
+def run_card_issuance(issuance, chunk_size=None, on_chunk=None):
+    """
+    Issue the cards of a ``CardIssuance`` in chunked transactions, calling
+    ``on_chunk(issuance, results)`` after each. Progress is committed with
+    each chunk, so a retried job resumes after the last finished chunk.
+    """
+    chunk_size = chunk_size or settings.CARD_ISSUANCE_CHUNK_SIZE
+    fee = Decimal(str(settings.CARD_CREATION_FEE))
+    issuance.status = "processing"
+    issuance.save(update_fields=["status", "updated_at"])
+
+    for start in range(issuance.processed_users, len(issuance.user_ids), chunk_size):
+        chunk = issuance.user_ids[start : start + chunk_size]
+        started = time.perf_counter()
+        for attempt in range(CHUNK_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    results = issue_chunk(issuance, chunk, fee)
+                    issued = sum(1 for r in results if r["status"] == "issued")
+                    issuance.results.extend(results)
+                    issuance.processed_users = start + len(chunk)
+                    issuance.issued += issued
+                    issuance.failed += len(results) - issued
+                    issuance.duration += time.perf_counter() - started
+                    issuance.save(
+                        update_fields=[
+                            "results",
+                            "processed_users",
+                            "issued",
+                            "failed",
+                            "duration",
+                            "updated_at",
+                        ]
+                    )
+                break
+            except IntegrityError:
+                # A number checked as free was taken meanwhile
+                issuance.refresh_from_db()
+                if attempt == CHUNK_ATTEMPTS - 1:
+                    raise
+        if on_chunk is not None:
+            on_chunk(issuance, results)
+
+    issuance.status = "completed"
+    issuance.save(update_fields=["status", "updated_at"])
+    return issuance
@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CardDailySpend, CardTransaction
+
+# The rollup total each journal entry type adds to
+ROLLUP_FIELDS = {
+    "authorization": "authorized",
+    "capture": "captured",
+    "release": "released",
+}
+
+
+def record_card_transaction(
+    card_id, type, authorization_id, amount, day, occurred_at, transaction_id=""
+):
+    """
+    Add an entry to the card's journal and its amount to the rollup of
+    ``day``, the day of the authorization. Returns False, changing nothing,
+    if the entry was already recorded.
+    """
+    field = ROLLUP_FIELDS[type]
+    counts = {"authorizations": 1} if type == "authorization" else {}
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                CardTransaction.objects.create(
+                    card_id=card_id,
+                    type=type,
+                    authorization_id=authorization_id,
+                    amount=amount,
+                    transaction_id=transaction_id,
+                    created_at=occurred_at,
+                )
+        except IntegrityError:
+            return False
+
+        changes = {field: F(field) + amount}
+        changes.update({name: F(name) + n for name, n in counts.items()})
+        rollup = CardDailySpend.objects.filter(card_id=card_id, day=day)
+        if not rollup.update(**changes, updated_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    CardDailySpend.objects.create(
+                        card_id=card_id, day=day, **{field: amount}, **counts
+                    )
+            except IntegrityError:
+                # Created by a concurrent entry of the same day
+                rollup.update(**changes, updated_at=timezone.now())
+    return True
+
+
+def spent_on(card_id, day):
+    """The card's spend on ``day``, from its rollup rather than the journal."""
+    rollup = CardDailySpend.objects.filter(card_id=card_id, day=day).first()
+    return rollup.spent if rollup else Decimal("0.00")
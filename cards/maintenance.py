@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Card
+
+
+def batch_update(cards, batch_size, **changes):
+    """
+    Apply ``changes`` to the cards matching ``cards``, ``batch_size`` at a
+    time, each batch with one UPDATE. The filter must stop matching updated
+    cards. Queryset updates skip ``Card.save``, so the cached profiles of
+    the batch are dropped here. Returns the number of cards updated.
+    """
+    # authorization imports the tasks that import this module
+    from .authorization import forget_cards
+
+    updated = 0
+    while True:
+        batch = list(cards.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return updated
+        updated += cards.filter(pk__in=batch).update(**changes)
+        transaction.on_commit(lambda batch=batch: forget_cards(batch))
+
+
+def reset_daily_spend(batch_size=None):
+    """
+    Reset the daily spend of every card that spent on an earlier day. Cards
+    with nothing spent keep their old ``last_reset``; ``Card.spent_today``
+    reads that as nothing spent today, so they need no write.
+    """
+    today = timezone.now().date()
+    return batch_update(
+        Card.objects.filter(last_reset__lt=today, daily_spend__gt=0),
+        batch_size or settings.CARD_MAINTENANCE_BATCH_SIZE,
+        daily_spend=0,
+        last_reset=today,
+        updated_at=timezone.now(),
+    )
+
+
+def deactivate_expired_cards(batch_size=None):
+    """
+    Deactivate and flag the cards whose expiry date has been reached, and
+    those without a valid expiry date, which ``Card.is_expired`` and
+    authorizations already treat as expired.
+    """
+    due = Q(expires_on__lte=timezone.localdate()) | Q(expires_on__isnull=True)
+    return batch_update(
+        Card.objects.filter(due, expired=False),
+        batch_size or settings.CARD_MAINTENANCE_BATCH_SIZE,
+        is_active=False,
+        expired=True,
+        updated_at=timezone.now(),
+    )
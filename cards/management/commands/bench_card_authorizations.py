@@ -0,0 +1,234 @@
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import Wallet
+from cards.authorization import authorize
+from cards.models import Card, CardDailySpend, generate_card_number
+from cards.tasks import record_card_authorization
+from users.models import User
+
+BENCH_EMAIL_DOMAIN = "@lumipay.invalid"
+BENCH_PIN = "1234"
+# Half the wallets run out of funds before their card reaches its daily limit
+WALLET_BALANCES = (Decimal("100000.00"), Decimal("200000.00"))
+DAILY_LIMIT = Decimal("150000.00")
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent card authorizations against throwaway cards, report "
+        "latency percentiles and throughput, and check that no card spent "
+        "beyond its wallet's balance or its daily limit. The cards are deleted "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=20)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--authorizations",
+            type=int,
+            default=500,
+            help="Authorizations per thread",
+        )
+        parser.add_argument(
+            "--legacy",
+            type=int,
+            default=10,
+            help="Authorizations to time on the row-per-check path, for comparison",
+        )
+        parser.add_argument(
+            "--persist",
+            action="store_true",
+            help="Queue the Card updates in the outbox instead of applying them here",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the cards for inspection"
+        )
+
+    def handle(self, *args, **options):
+        cards = self.create_cards(options["cards"])
+        try:
+            if options["legacy"]:
+                self.report("row per check", self.legacy_run(cards, options["legacy"]))
+            approved = self.run(
+                cards, options["threads"], options["authorizations"], options["persist"]
+            )
+            self.verify(cards, approved, options["persist"])
+        finally:
+            if not options["keep"]:
+                User.objects.filter(pk__in=[card.user_id for card in cards]).delete()
+
+    def create_cards(self, count):
+        run = uuid.uuid4().hex[:8]
+        cards = []
+        for i in range(count):
+            user = User(
+                email=f"bench-card-{run}-{i}{BENCH_EMAIL_DOMAIN}",
+                first_name="Bench",
+                last_name=str(i),
+                phone_number=f"+{run[:6]}{i:05d}",
+                nin=uuid.uuid4().hex,
+                bvn=uuid.uuid4().hex,
+                account_number=User.objects.generate_account_number(),
+            )
+            user.save()
+            Wallet.objects.create(
+                user=user,
+                account_number=user.account_number,
+                balance=WALLET_BALANCES[i % len(WALLET_BALANCES)],
+                bvn=user.bvn,
+            )
+            card = Card(
+                user=user,
+                card_number=generate_card_number("visa"),
+                card_type="visa",
+                cvv="123",
+                card_expiry_date=(timezone.now() + timedelta(days=365)).strftime(
+                    "%m/%y"
+                ),
+                daily_limit=DAILY_LIMIT,
+            )
+            card.set_pin(BENCH_PIN)
+            card.save()
+            cards.append(card)
+        return cards
+
+    def legacy_run(self, cards, count):
+        """Time the previous approach: load, verify and save the Card each time."""
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            card = Card.objects.select_related("user__wallet").get(
+                pk=random.choice(cards).pk
+            )
+            amount = Decimal(random.randint(100, 5000))
+            if card.check_pin(BENCH_PIN) and card.has_sufficient_funds(amount):
+                card.reset_daily_spend()
+                card.daily_spend += amount
+                card.last_used = timezone.now()
+                card.save(update_fields=["daily_spend", "last_used"])
+            latencies.append(time.perf_counter() - started)
+        # Undo the legacy spend so the main run starts from known counters
+        Card.objects.filter(pk__in=[card.pk for card in cards]).update(
+            daily_spend=0, last_used=None
+        )
+        return latencies
+
+    def run(self, cards, threads, authorizations, persist):
+        # Warm the cached profiles and PIN verifiers outside the timed run
+        warmup = [
+            authorize(card.pk, Decimal("0.01"), BENCH_PIN, persist=persist)
+            for card in cards
+        ]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(
+                pool.map(
+                    lambda _: self.authorize_loop(cards, authorizations, persist),
+                    range(threads),
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        latencies = [sample for samples, _, _ in results for sample in samples]
+        outcomes = sum((outcome for _, outcome, _ in results), Counter())
+        approved = warmup + [result for _, _, batch in results for result in batch]
+        self.report("cached counters", latencies)
+        self.stdout.write(
+            f"{len(latencies)} authorizations in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.0f}/s): "
+            + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+        )
+        return approved
+
+    def authorize_loop(self, cards, authorizations, persist):
+        latencies, outcomes, approved = [], Counter(), []
+        try:
+            for _ in range(authorizations):
+                card = random.choice(cards)
+                amount = Decimal(random.randint(100, 5000))
+                started = time.perf_counter()
+                result = authorize(card.pk, amount, BENCH_PIN, persist=persist)
+                latencies.append(time.perf_counter() - started)
+                outcomes[result.reason or "approved"] += 1
+                if result.approved:
+                    approved.append(result)
+        finally:
+            connection.close()
+        return latencies, outcomes, approved
+
+    def report(self, label, latencies):
+        samples = sorted(latencies)
+        self.stdout.write(
+            f"{label}: p50 {percentile(samples, 0.5) * 1000:.2f}ms, "
+            f"p95 {percentile(samples, 0.95) * 1000:.2f}ms, "
+            f"p99 {percentile(samples, 0.99) * 1000:.2f}ms "
+            f"over {len(samples)} authorizations"
+        )
+
+    def verify(self, cards, approved, persist):
+        if not persist:
+            for result in approved:
+                record_card_authorization(
+                    result.card_id,
+                    str(result.amount),
+                    result.authorized_at.date().isoformat(),
+                    result.authorized_at.isoformat(),
+                    authorization_id=result.authorization_id,
+                )
+        spent = Counter()
+        for result in approved:
+            spent[result.card_id] += result.amount
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.filter(
+                user_id__in=[card.user_id for card in cards]
+            )
+        }
+        over = [
+            card
+            for card in cards
+            if spent[str(card.pk)] > DAILY_LIMIT
+            or wallets[card.user_id].reserved != spent[str(card.pk)]
+            or wallets[card.user_id].available_balance < 0
+        ]
+        if over:
+            raise CommandError(
+                f"{len(over)} cards authorized beyond their limits or holds"
+            )
+        if persist:
+            self.stdout.write("Card updates queued in the outbox; rows not checked")
+            return
+        rollups = dict(
+            CardDailySpend.objects.filter(
+                card_id__in=[card.pk for card in cards]
+            ).values_list("card_id", "authorized")
+        )
+        mismatched = sum(
+            1
+            for card in Card.objects.filter(pk__in=[card.pk for card in cards])
+            if card.daily_spend != spent[str(card.pk)]
+            or rollups.get(card.pk, 0) != spent[str(card.pk)]
+        )
+        if mismatched:
+            raise CommandError(f"{mismatched} cards do not match their authorizations")
+        self.stdout.write(
+            self.style.SUCCESS(
+                "No card spent beyond its wallet's balance or its daily limit"
+            )
+        )
@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Wallet
+from cards.issuance import run_card_issuance
+from cards.models import Card, CardIssuance
+from cards.tasks import process_card_issuance
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue a virtual card of one type to many users, charging each the "
+        "card creation fee, in chunked transactions, and report throughput. "
+        "Cards are issued without a PIN; each cardholder sets their own. "
+        "Users come from a file of emails or are every wallet holder without "
+        "an active card of the type."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--card-type",
+            default="master card",
+            choices=[value for value, _ in Card.CARD_TYPES],
+        )
+        users = parser.add_mutually_exclusive_group(required=True)
+        users.add_argument("--emails-file", help="File with one email per line")
+        users.add_argument(
+            "--without-card",
+            action="store_true",
+            help="Every user with a wallet and no active card of the type",
+        )
+        parser.add_argument("--chunk-size", type=int, help="Users per transaction")
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue the issuance to Celery instead of running it here",
+        )
+
+    def handle(self, *args, **options):
+        card_type = options["card_type"]
+        user_ids = self.user_ids(options, card_type)
+        if not user_ids:
+            raise CommandError("No users to issue cards to")
+
+        issuance = CardIssuance.objects.create(
+            card_type=card_type,
+            user_ids=user_ids,
+            total_users=len(user_ids),
+        )
+        self.stdout.write(
+            f"Card issuance {issuance.pk}: {len(user_ids)} {card_type} cards"
+        )
+        if options["queue"]:
+            process_card_issuance.delay(str(issuance.pk))
+            self.stdout.write("Queued")
+            return
+
+        def report(issuance, results):
+            self.stdout.write(
+                f"{issuance.processed_users}/{issuance.total_users} users, "
+                f"{issuance.issued} issued, {issuance.failed} failed"
+            )
+
+        run_card_issuance(issuance, options["chunk_size"], on_chunk=report)
+        rate = issuance.issued / issuance.duration if issuance.duration else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Issued {issuance.issued} cards ({issuance.failed} failed) "
+                f"in {issuance.duration:.2f}s, {rate:.0f} cards/s"
+            )
+        )
+
+    def user_ids(self, options, card_type):
+        if options["without_card"]:
+            with_card = Card.objects.filter(card_type=card_type, is_active=True)
+            users = Wallet.objects.exclude(
+                user_id__in=with_card.values("user_id")
+            ).order_by("user_id")
+            return [str(pk) for pk in users.values_list("user_id", flat=True)]
+
+        try:
+            with open(options["emails_file"]) as emails_file:
+                emails = list(
+                    dict.fromkeys(line.strip() for line in emails_file if line.strip())
+                )
+        except OSError as exc:
+            raise CommandError(f"Cannot read {options['emails_file']}: {exc}")
+        ids = dict(User.objects.filter(email__in=emails).values_list("email", "pk"))
+        unknown = [email for email in emails if email not in ids]
+        if unknown:
+            raise CommandError(f"Unknown users: {', '.join(unknown[:20])}")
+        return [str(ids[email]) for email in emails]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+from cards.models import parse_expiry
+
+BATCH_SIZE = 2000
+
+
+def backfill_expiry_dates(apps, schema_editor):
+    # Cards past their expiry are deactivated by the next nightly run
+    Card = apps.get_model("cards", "Card")
+    batch = []
+    for card in Card.objects.only("card_expiry_date", "is_active").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        card.expires_on = parse_expiry(card.card_expiry_date)
+        # A card without a valid expiry has always counted as expired
+        card.expired = card.expires_on is None
+        card.is_active = card.is_active and not card.expired
+        batch.append(card)
+        if len(batch) == BATCH_SIZE:
+            Card.objects.bulk_update(batch, ["expires_on", "expired", "is_active"])
+            batch = []
+    Card.objects.bulk_update(batch, ["expires_on", "expired", "is_active"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cards", "0002_card_balance_from_wallet"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="card",
+            name="expired",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="card",
+            name="expires_on",
+            field=models.DateField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name="card",
+            name="last_reset",
+            field=models.DateField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_expiry_dates, migrations.RunPython.noop),
+    ]
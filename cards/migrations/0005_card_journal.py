@@ -0,0 +1,133 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:58
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def seed_daily_spends(apps, schema_editor):
+    # Spend recorded before the journal existed becomes its day's rollup, so
+    # authorizations reloaded from the rollup keep counting it
+    Card = apps.get_model("cards", "Card")
+    CardDailySpend = apps.get_model("cards", "CardDailySpend")
+    CardDailySpend.objects.bulk_create(
+        (
+            CardDailySpend(card_id=card_id, day=day, authorized=spend)
+            for card_id, day, spend in Card.objects.filter(
+                daily_spend__gt=0
+            ).values_list("pk", "last_reset", "daily_spend")
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cards", "0004_card_issuances"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CardDailySpend",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("authorizations", models.PositiveIntegerField(default=0)),
+                (
+                    "authorized",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "captured",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "released",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_spends",
+                        to="cards.card",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("card", "day"), name="card_daily_spend_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="CardTransaction",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("authorization", "Authorization"),
+                            ("capture", "Capture"),
+                            ("release", "Release"),
+                        ],
+                        max_length=13,
+                    ),
+                ),
+                ("authorization_id", models.CharField(max_length=20)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "transaction_id",
+                    models.CharField(blank=True, db_index=True, max_length=20),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="transactions",
+                        to="cards.card",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["card", "-created_at", "-id"],
+                        name="card_txn_card_created_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("authorization_id", "type"),
+                        name="card_txn_authorization_type_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(seed_daily_spends, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cards", "0005_card_journal"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="cardissuance",
+            name="pin_hash",
+        ),
+    ]
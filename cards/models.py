@@ -8,9 +8,12 @@ from django.core.mail import send_mail
 import uuid
 import random
 import string
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from decimal import Decimal
 from users.models import User
+from accounts.ledger import InsufficientFunds, apply_balance_changes
 from accounts.models import Wallet, TransactionHistory
+from accounts.utils.ids import ID_LENGTH
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.template.loader import render_to_string
@@ -21,6 +24,8 @@ logger = logging.getLogger(__name__)
 
 # Create your models here.
 
+MAX_ACTIVE_CARDS = 3  # Maximum number of active cards per user
+
 
 def generate_card_number(card_type):
     """Generate a valid card number based on card type"""
@@ -58,6 +63,21 @@ def generate_card_number(card_type):
     check_digit = (10 - (luhn_checksum(card_number + '0') % 10)) % 10
     return card_number + str(check_digit)
 
+
+def new_card_expiry():
+    """MM/YY expiry for a card issued today (4 years from now)"""
+    return (timezone.now() + timedelta(days=365*4)).strftime('%m/%y')
+
+
+def parse_expiry(card_expiry_date):
+    """The date an MM/YY expiry takes effect, or None if it is invalid"""
+    try:
+        month = int(card_expiry_date[:2])
+        year = int('20' + card_expiry_date[3:])  # Assuming 2-digit year
+        return date(year, month, 1)  # Set to first day of expiry month
+    except (TypeError, ValueError, IndexError):
+        return None
+
 class Card(models.Model):
     CARD_TYPES = [
         ('visa', 'Visa'),
@@ -71,16 +91,19 @@ class Card(models.Model):
     card_number = models.CharField(max_length=16, unique=True, editable=False)
     card_type = models.CharField(max_length=20, choices=CARD_TYPES, default="master card")
     card_expiry_date = models.CharField(max_length=5, editable=False)
+    # card_expiry_date as a date, filled in on save; the card is expired from
+    # this day on. The nightly job deactivates such cards and sets expired.
+    expires_on = models.DateField(null=True, editable=False, db_index=True)
+    expired = models.BooleanField(default=False, editable=False)
     cvv = models.CharField(max_length=3, editable=False)
     pin_hash = models.CharField(max_length=128, help_text="Hashed card PIN")
     is_active = models.BooleanField(default=True)
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_used = models.DateTimeField(null=True, blank=True)
     daily_limit = models.DecimalField(max_digits=10, decimal_places=2, default=500000.00)
     daily_spend = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    last_reset = models.DateField(auto_now_add=True)
+    last_reset = models.DateField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"{self.get_card_display()} - {self.masked_card_number} - {self.user.get_full_name() or self.user.email}"
@@ -103,6 +126,11 @@ class Card(models.Model):
             return f"**** **** **** {self.card_number[-4:]}"
         return ""
 
+    @property
+    def available_balance(self):
+        """Spendable funds: the wallet's balance less its active holds"""
+        return self.user.wallet.available_balance
+
     @property
     def expiry_month(self):
         """Get the expiry month"""
@@ -131,16 +159,7 @@ class Card(models.Model):
 
     def is_expired(self):
         """Check if the card is expired"""
-        if not self.card_expiry_date:
-            return True
-            
-        try:
-            month = int(self.card_expiry_date[:2])
-            year = int('20' + self.card_expiry_date[3:])  # Assuming 2-digit year
-            expiry_date = datetime(year, month, 1)  # Set to first day of expiry month
-            return expiry_date < datetime.now()
-        except (ValueError, IndexError):
-            return True
+        return self.expires_on is None or self.expires_on <= timezone.localdate()
 
     def reset_daily_spend(self):
         """Reset the daily spend if it's a new day"""
@@ -150,13 +169,26 @@ class Card(models.Model):
             self.last_reset = today
             self.save(update_fields=['daily_spend', 'last_reset'])
 
+    def spent_today(self):
+        """Today's spend, without resetting a stale counter in the database"""
+        if self.last_reset != timezone.now().date():
+            return Decimal('0.00')
+        return self.daily_spend
+
     def has_sufficient_funds(self, amount):
         """Check if the card has sufficient funds and within daily limit"""
-        self.reset_daily_spend()
-        has_funds = self.balance >= amount
-        within_daily_limit = (self.daily_spend + amount) <= self.daily_limit
+        has_funds = self.available_balance >= amount
+        within_daily_limit = (self.spent_today() + amount) <= self.daily_limit
         return has_funds and within_daily_limit and not self.is_expired()
 
+    def save(self, *args, **kwargs):
+        if self.expires_on is None:
+            self.expires_on = parse_expiry(self.card_expiry_date)
+        super().save(*args, **kwargs)
+        # Authorizations read a cached copy of the card
+        from .authorization import forget_card
+        transaction.on_commit(lambda: forget_card(self.pk))
+
     @classmethod
     def create_card(cls, user, card_type='master card', pin=None):
         """
@@ -182,27 +214,24 @@ class Card(models.Model):
             raise ValidationError(_(f"You already have an active {card_type} card"))
 
         # Check if user already has too many active cards
-        max_cards = 3  # Maximum number of cards per user
-        if user.cards.filter(is_active=True).count() >= max_cards:
-            raise ValidationError(_(f"Maximum limit of {max_cards} active cards reached"))
+        if user.cards.filter(is_active=True).count() >= MAX_ACTIVE_CARDS:
+            raise ValidationError(_(f"Maximum limit of {MAX_ACTIVE_CARDS} active cards reached"))
 
         # Get the card creation fee from settings and convert to Decimal
         from django.conf import settings
         from decimal import Decimal
         card_creation_fee = Decimal(str(getattr(settings, 'CARD_CREATION_FEE', 1000.00)))
 
+        wallet = Wallet.objects.get(user=user)
+        insufficient = ValidationError({
+            'error': _('Insufficient balance for card creation fee'),
+            'required_amount': card_creation_fee,
+            'current_balance': wallet.available_balance
+        })
+        if wallet.available_balance < card_creation_fee:
+            raise insufficient
+
         with transaction.atomic():
-            # Get the user's wallet and lock it for update
-            wallet = Wallet.objects.select_for_update().get(user=user)
-            
-            # Check if user has sufficient balance
-            if wallet.balance < card_creation_fee:
-                raise ValidationError({
-                    'error': _('Insufficient balance for card creation fee'),
-                    'required_amount': card_creation_fee,
-                    'current_balance': wallet.balance
-                })
-            
             # Generate card details
             card = cls(
                 user=user,
@@ -212,15 +241,19 @@ class Card(models.Model):
             )
             
             # Set expiry date (4 years from now)
-            expiry_date = (timezone.now() + timedelta(days=365*4)).strftime('%m/%y')
-            card.card_expiry_date = expiry_date
+            card.card_expiry_date = new_card_expiry()
             
             # Set the PIN
             card.set_pin(pin)
             
-            # Set initial balance (wallet balance minus fee)
-            wallet.balance -= card_creation_fee
-            wallet.save()
+            # Charge the fee with a conditional update instead of locking the
+            # wallet; the card spends from the wallet's live balance
+            try:
+                balances = apply_balance_changes({wallet.pk: -card_creation_fee})
+            except InsufficientFunds:
+                raise insufficient
+            wallet.balance = balances[wallet.pk]
+            user.wallet = wallet
             
             # Create transaction record for the card creation fee
             TransactionHistory.objects.create(
@@ -231,15 +264,113 @@ class Card(models.Model):
                 balance_after_transaction=wallet.balance
             )
             
-            # Set card balance (initial balance from wallet after fee deduction)
-            card.balance = wallet.balance
             card.save()
             
-            # Send email notification (in a try-except to prevent card creation from failing)
-            try:
-                from .email_utils import send_card_creation_email
-                send_card_creation_email(user, card)
-            except Exception as e:
-                logger.error(f"Failed to send card creation email to {user.email}: {str(e)}")
+            # Queue the email notification; it is sent once the card is committed
+            from .email_utils import send_card_creation_email
+            send_card_creation_email(user, card)
             
             return card
+
+
+class CardIssuance(models.Model):
+    """A batch of cards issued to many users at once, e.g. for an employer."""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='card_issuances',
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    card_type = models.CharField(max_length=20, choices=Card.CARD_TYPES)
+    user_ids = models.JSONField(default=list)
+    results = models.JSONField(default=list)
+    total_users = models.PositiveIntegerField(default=0)
+    processed_users = models.PositiveIntegerField(default=0)
+    issued = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Seconds spent issuing, excluding time waiting in the queue
+    duration = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_card_type_display()} - {self.total_users} users ({self.status})"
+
+
+class CardTransaction(models.Model):
+    """
+    One entry in a card's journal: an approved authorization, or the capture
+    or release of its held funds.
+    """
+
+    TYPES = [
+        ('authorization', 'Authorization'),
+        ('capture', 'Capture'),
+        ('release', 'Release'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='transactions')
+    type = models.CharField(max_length=13, choices=TYPES)
+    authorization_id = models.CharField(max_length=ID_LENGTH)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # The wallet debit of a capture. TransactionHistory is linked by its
+    # public id: on PostgreSQL its primary key includes created_at (it is
+    # partitioned) and old rows move to the archive.
+    transaction_id = models.CharField(max_length=ID_LENGTH, blank=True, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # An authorization is captured or released at most once, so
+            # recording an entry twice (e.g. a retried task) is a no-op
+            models.UniqueConstraint(
+                fields=['authorization_id', 'type'], name='card_txn_authorization_type_uniq'
+            ),
+        ]
+        indexes = [
+            # History pages: one card, newest first, keyset on (created_at, id)
+            models.Index(fields=['card', '-created_at', '-id'], name='card_txn_card_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_type_display()} of {self.amount} on card {self.card_id}"
+
+
+class CardDailySpend(models.Model):
+    """
+    A card's journal totals for one day, kept up to date with each entry.
+    Captures and releases count on the day of their authorization.
+    """
+
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='daily_spends')
+    day = models.DateField()
+    authorizations = models.PositiveIntegerField(default=0)
+    authorized = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    captured = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    released = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'day'], name='card_daily_spend_uniq'),
+        ]
+
+    @property
+    def spent(self):
+        """Spend counted against the daily limit"""
+        return self.authorized - self.released
+
+    def __str__(self):
+        return f"Card {self.card_id} on {self.day}: {self.spent}"
@@ -2,7 +2,7 @@ from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from django.core.validators import MinLengthValidator, RegexValidator
-from .models import Card
+from .models import Card, CardIssuance, CardTransaction
 from decimal import Decimal
 
 
@@ -31,17 +31,20 @@ class CardSerializer(serializers.ModelSerializer):
     """Serializer for card details"""
     daily_limit = CurrencyField()
     daily_spend = CurrencyField()
-    balance = CurrencyField()
+    # Cards spend from the owner's wallet
+    balance = CurrencyField(source='available_balance')
     expiry_date = serializers.SerializerMethodField()
     masked_card_number = serializers.SerializerMethodField()
     is_expired = serializers.SerializerMethodField()
+    # Bulk-issued cards have no PIN until the cardholder sets one
+    pin_set = serializers.SerializerMethodField()
     
     class Meta:
         model = Card
         fields = [
             'id', 'card_type', 'masked_card_number', 'card_expiry_date', 'expiry_date',
             'is_active', 'created_at', 'daily_limit', 'daily_spend',
-            'balance', 'is_expired', 'last_used'
+            'balance', 'is_expired', 'pin_set', 'last_used'
         ]
         read_only_fields = fields
     
@@ -51,7 +54,11 @@ class CardSerializer(serializers.ModelSerializer):
     def get_masked_card_number(self, obj):
         return obj.masked_card_number
     
+    def get_pin_set(self, obj):
+        return bool(obj.pin_hash)
+
     def get_is_expired(self, obj):
+        # From the date, so it is right before the nightly job flags the card
         return obj.is_expired()
 
 
@@ -105,4 +112,88 @@ class CreateCard(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         # Use the CardSerializer for consistent formatting
-        return CardSerializer(instance, context=self.context).to_representation(instance)
\ No newline at end of file
+        return CardSerializer(instance, context=self.context).to_representation(instance)
+
+class CardAuthorizationSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01')
+    )
+    pin = serializers.RegexField(
+        regex=r'^\d{4}$', error_messages={'invalid': 'PIN must be a 4-digit number'}
+    )
+
+
+class CardPinSerializer(serializers.Serializer):
+    pin = serializers.RegexField(
+        regex=r'^\d{4}$', error_messages={'invalid': 'PIN must be a 4-digit number'}
+    )
+    confirm_pin = serializers.CharField()
+
+    def validate(self, attrs):
+        if attrs['pin'] != attrs['confirm_pin']:
+            raise ValidationError({'confirm_pin': 'PINs do not match'})
+        return attrs
+
+
+class CardCaptureSerializer(serializers.Serializer):
+    # Defaults to the whole authorized amount
+    amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False
+    )
+
+
+class CardIssuanceSerializer(serializers.Serializer):
+    """
+    Issue a card of one type to many users. The cards are issued without a
+    PIN; each cardholder sets their own before the first authorization.
+    """
+    users = serializers.ListField(child=serializers.EmailField(), allow_empty=False)
+    card_type = serializers.ChoiceField(choices=Card.CARD_TYPES)
+
+    def validate_users(self, emails):
+        from django.conf import settings
+        from users.models import User
+
+        emails = list(dict.fromkeys(emails))
+        if len(emails) > settings.CARD_ISSUANCE_MAX_USERS:
+            raise ValidationError(
+                f'A card issuance can have at most {settings.CARD_ISSUANCE_MAX_USERS} users.'
+            )
+        # Resolved with one query so the batch itself works on ids
+        ids = dict(
+            User.objects.filter(email__in=emails).values_list('email', 'pk')
+        )
+        unknown = [email for email in emails if email not in ids]
+        if unknown:
+            raise ValidationError(f"Unknown users: {', '.join(unknown[:20])}")
+        return [str(ids[email]) for email in emails]
+
+
+class CardIssuanceStatusSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    cards_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CardIssuance
+        fields = [
+            'id', 'status', 'card_type', 'total_users', 'processed_users',
+            'progress', 'issued', 'failed', 'duration', 'cards_per_second',
+            'results', 'created_at', 'updated_at',
+        ]
+
+    def get_progress(self, obj):
+        if not obj.total_users:
+            return 100
+        return round(obj.processed_users * 100 / obj.total_users)
+
+    def get_cards_per_second(self, obj):
+        return round(obj.issued / obj.duration, 1) if obj.duration else None
+
+
+class CardTransactionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CardTransaction
+        fields = [
+            'id', 'type', 'authorization_id', 'amount', 'transaction_id', 'created_at',
+        ]
+        read_only_fields = fields
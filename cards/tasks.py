@@ -0,0 +1,71 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from . import maintenance
+from .issuance import run_card_issuance
+from .journal import record_card_transaction
+from .models import Card, CardIssuance
+
+
+@shared_task
+def record_card_authorization(
+    card_id, amount, day, authorized_at, authorization_id=None
+):
+    """
+    Apply an approved authorization to the Card row, or with a negative
+    ``amount`` the release of its funds. Tasks may run late or out of order,
+    so the daily spend is only changed on a counter of the same day and
+    ``last_reset`` and ``last_used`` never move backwards. With an
+    ``authorization_id`` the authorization is also added to the card's
+    journal, once even if the task is retried.
+    """
+    amount = Decimal(amount)
+    day = date.fromisoformat(day)
+    authorized_at = datetime.fromisoformat(authorized_at)
+    with transaction.atomic():
+        if authorization_id and not record_card_transaction(
+            card_id, "authorization", authorization_id, amount, day, authorized_at
+        ):
+            return f"Authorization {authorization_id} already recorded"
+        updated = Card.objects.filter(pk=card_id).update(
+            daily_spend=Case(
+                When(last_reset=day, then=F("daily_spend") + amount),
+                When(last_reset__lt=day, then=Value(max(amount, Decimal("0")))),
+                default=F("daily_spend"),
+            ),
+            last_reset=Greatest(F("last_reset"), Value(day)),
+            last_used=Greatest(
+                Coalesce(F("last_used"), Value(authorized_at)), Value(authorized_at)
+            ),
+        )
+    return f"Recorded authorization of {amount} on card {card_id}: {updated} updated"
+
+
+@shared_task
+def reset_card_daily_spend():
+    reset = maintenance.reset_daily_spend()
+    return f"Reset the daily spend of {reset} cards"
+
+
+@shared_task
+def deactivate_expired_cards():
+    deactivated = maintenance.deactivate_expired_cards()
+    return f"Deactivated {deactivated} expired cards"
+
+
+@shared_task
+def process_card_issuance(issuance_id):
+    issuance = CardIssuance.objects.get(pk=issuance_id)
+    if issuance.status == "completed":
+        return f"Card issuance {issuance_id} already completed"
+    try:
+        run_card_issuance(issuance)
+    except Exception:
+        CardIssuance.objects.filter(pk=issuance_id).update(status="failed")
+        raise
+    return f"Card issuance {issuance_id}: {issuance.issued} issued, {issuance.failed} failed"
@@ -1,3 +1,426 @@
-from django.test import TestCase
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.holds import release_expired_holds
+from accounts.models import Wallet, WalletHold
+from notifications.models import OutboxMessage
+from users.models import User
+from .authorization import (
+    PROFILE_KEY,
+    authorization_hold,
+    authorize,
+    capture_authorization,
+    release_authorization,
+)
+from .maintenance import deactivate_expired_cards, reset_daily_spend
+from .journal import spent_on
+from .models import Card, CardDailySpend, CardTransaction, generate_card_number
+from .serializers import CardSerializer
+from .tasks import record_card_authorization
+
+PIN = "1234"
+
+
+def make_card(
+    balance=Decimal("10000.00"), daily_limit=Decimal("5000.00"), card_type="visa"
+):
+    user = User.objects.create(
+        email=f"{uuid.uuid4().hex[:12]}@example.com",
+        first_name="Ada",
+        last_name="Obi",
+        phone_number=f"+234{uuid.uuid4().int % 10**10:010d}",
+        nin=uuid.uuid4().hex,
+        bvn=uuid.uuid4().hex,
+        account_number=User.objects.generate_account_number(),
+    )
+    Wallet.objects.create(
+        user=user, account_number=user.account_number, bvn=user.bvn, balance=balance
+    )
+    card = Card(
+        user=user,
+        card_number=generate_card_number(card_type),
+        card_type=card_type,
+        cvv="123",
+        card_expiry_date=(timezone.now() + timedelta(days=365)).strftime("%m/%y"),
+        daily_limit=daily_limit,
+    )
+    card.set_pin(PIN)
+    card.save()
+    return card
+
+
+def queued_card_updates():
+    return OutboxMessage.objects.filter(task=record_card_authorization.name)
+
+
+class CardAuthorizationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.card = make_card()
+        self.wallet = self.card.user.wallet
+
+    def test_approval_holds_funds_and_queues_the_card_update(self):
+        result = authorize(self.card.pk, Decimal("500.00"), PIN)
+        self.assertTrue(result.approved)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.reserved, Decimal("500.00"))
+
+        message = queued_card_updates().get()
+        self.assertEqual(message.kwargs["authorization_id"], result.authorization_id)
+        record_card_authorization(*message.args, **message.kwargs)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.daily_spend, Decimal("500.00"))
+        self.assertTrue(
+            CardTransaction.objects.filter(
+                authorization_id=result.authorization_id, type="authorization"
+            ).exists()
+        )
+
+    def test_incorrect_pin_is_declined_until_tries_run_out(self):
+        for _ in range(settings.CARD_PIN_MAX_ATTEMPTS):
+            result = authorize(self.card.pk, Decimal("500.00"), "0000")
+            self.assertEqual(result.reason, "incorrect_pin")
+        result = authorize(self.card.pk, Decimal("500.00"), PIN)
+        self.assertEqual(result.reason, "pin_tries_exceeded")
+        self.assertFalse(WalletHold.objects.exists())
+        self.assertFalse(queued_card_updates().exists())
+
+    def test_daily_limit_counts_approved_amounts(self):
+        self.assertTrue(authorize(self.card.pk, Decimal("4000.00"), PIN).approved)
+        result = authorize(self.card.pk, Decimal("1000.01"), PIN)
+        self.assertEqual(result.reason, "daily_limit_exceeded")
+        self.assertTrue(authorize(self.card.pk, Decimal("1000.00"), PIN).approved)
+
+    def test_insufficient_funds_queues_nothing_and_keeps_the_limit(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal("100.00"))
+        result = authorize(self.card.pk, Decimal("5000.00"), PIN)
+        self.assertFalse(result.approved)
+        self.assertEqual(result.reason, "insufficient_funds")
+        self.assertEqual(result.authorization_id, "")
+        self.assertFalse(WalletHold.objects.exists())
+        self.assertFalse(queued_card_updates().exists())
+
+        # The declined amount was taken back off the day's spend
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal("10000.00"))
+        self.assertTrue(authorize(self.card.pk, Decimal("5000.00"), PIN).approved)
+
+    def test_inactive_card_is_declined(self):
+        self.card.is_active = False
+        self.card.save()
+        cache.clear()
+        result = authorize(self.card.pk, Decimal("500.00"), PIN)
+        self.assertEqual(result.reason, "card_inactive")
+
+    def test_another_users_card_is_not_found(self):
+        other = make_card()
+        result = authorize(self.card.pk, Decimal("500.00"), PIN, user=other.user)
+        self.assertEqual(result.reason, "card_not_found")
+
+    def test_release_returns_funds_and_refunds_the_spend(self):
+        result = authorize(self.card.pk, Decimal("5000.00"), PIN)
+        hold = authorization_hold(self.card.pk, result.authorization_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            release_authorization(hold, self.card.pk, result.authorization_id)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.reserved, Decimal("0.00"))
+        refund = queued_card_updates().exclude(kwargs__has_key="authorization_id")
+        self.assertEqual(refund.get().args[1], "-5000.00")
+        self.assertTrue(authorize(self.card.pk, Decimal("5000.00"), PIN).approved)
+
+    def test_expired_hold_refunds_the_spend(self):
+        result = authorize(self.card.pk, Decimal("5000.00"), PIN)
+        WalletHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_expired_holds(), 1)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.reserved, Decimal("0.00"))
+        hold = authorization_hold(self.card.pk, result.authorization_id)
+        self.assertEqual(hold.status, "expired")
+        self.assertTrue(
+            CardTransaction.objects.filter(
+                authorization_id=result.authorization_id,
+                type="release",
+                amount=Decimal("5000.00"),
+            ).exists()
+        )
+        refund = queued_card_updates().exclude(kwargs__has_key="authorization_id")
+        self.assertEqual(refund.get().args[1], "-5000.00")
+        self.assertTrue(authorize(self.card.pk, Decimal("5000.00"), PIN).approved)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class CardJournalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.card = make_card()
+        self.client = APIClient()
+        self.client.force_authenticate(self.card.user)
+
+    def approve(self, amount):
+        """Authorize ``amount`` and run the queued card update."""
+        result = authorize(self.card.pk, Decimal(amount), PIN)
+        message = queued_card_updates().get(
+            kwargs__authorization_id=result.authorization_id
+        )
+        record_card_authorization(*message.args, **message.kwargs)
+        return result, message
+
+    def rollup(self):
+        return CardDailySpend.objects.get(card=self.card, day=timezone.localdate())
+
+    def test_retried_authorization_is_recorded_once(self):
+        result, message = self.approve("500.00")
+        self.assertEqual(
+            record_card_authorization(*message.args, **message.kwargs),
+            f"Authorization {result.authorization_id} already recorded",
+        )
+        self.assertEqual(
+            CardTransaction.objects.filter(
+                authorization_id=result.authorization_id
+            ).count(),
+            1,
+        )
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.daily_spend, Decimal("500.00"))
+        rollup = self.rollup()
+        self.assertEqual(
+            (rollup.authorizations, rollup.authorized), (1, Decimal("500.00"))
+        )
+
+    def test_rollup_totals_captures_and_releases(self):
+        captured, _ = self.approve("500.00")
+        released, _ = self.approve("300.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            capture_authorization(
+                authorization_hold(self.card.pk, captured.authorization_id),
+                self.card.pk,
+                captured.authorization_id,
+                Decimal("200.00"),
+            )
+            release_authorization(
+                authorization_hold(self.card.pk, released.authorization_id),
+                self.card.pk,
+                released.authorization_id,
+            )
+
+        rollup = self.rollup()
+        self.assertEqual(
+            (rollup.authorizations, rollup.authorized, rollup.captured),
+            (2, Decimal("800.00"), Decimal("200.00")),
+        )
+        # The uncaptured 300.00 of the first and all of the second
+        self.assertEqual(rollup.released, Decimal("600.00"))
+        self.assertEqual(
+            spent_on(self.card.pk, timezone.localdate()), Decimal("200.00")
+        )
+        self.assertEqual(
+            sorted(CardTransaction.objects.values_list("type", flat=True)),
+            ["authorization", "authorization", "capture", "release", "release"],
+        )
+
+    def test_journal_is_paged_newest_first(self):
+        first, _ = self.approve("500.00")
+        self.approve("300.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            capture_authorization(
+                authorization_hold(self.card.pk, first.authorization_id),
+                self.card.pk,
+                first.authorization_id,
+            )
+        expected = list(
+            CardTransaction.objects.order_by("-created_at", "-pk").values_list(
+                "type", "authorization_id"
+            )
+        )
+        self.assertEqual(len(expected), 3)
+
+        entries = []
+        response = self.client.get(
+            reverse("cards:card-transactions", args=[self.card.pk]), {"page_size": 2}
+        )
+        while True:
+            self.assertEqual(response.status_code, 200)
+            entries += [
+                (entry["type"], entry["authorization_id"])
+                for entry in response.data["data"]
+            ]
+            if response.data["pagination"]["next"] is None:
+                break
+            response = self.client.get(response.data["pagination"]["next"])
+        self.assertEqual(entries, expected)
+        self.assertEqual(entries[0], ("capture", first.authorization_id))
+
+    def test_journal_of_another_users_card_is_not_found(self):
+        other = make_card()
+        response = self.client.get(reverse("cards:card-transactions", args=[other.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class CardAuthorizationViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.card = make_card()
+        self.client = APIClient()
+        self.client.force_authenticate(self.card.user)
+
+    def test_approval_does_not_depend_on_the_broker(self):
+        url = reverse("cards:card-authorize", args=[self.card.pk])
+        broker_down = mock.patch.object(
+            record_card_authorization, "apply_async", side_effect=OSError("down")
+        )
+        with broker_down:
+            response = self.client.post(
+                url, {"amount": "500.00", "pin": PIN}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["data"]["approved"])
+        self.assertEqual(queued_card_updates().count(), 1)
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"])
+class CardAuthorizationCaptureViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.card = make_card()
+        self.result = authorize(self.card.pk, Decimal("500.00"), PIN)
+        self.client = APIClient()
+
+    def url(self, operation):
+        return reverse(
+            f"cards:card-authorization-{operation}",
+            args=[self.card.pk, self.result.authorization_id],
+        )
+
+    def test_cardholder_cannot_capture_or_release(self):
+        self.client.force_authenticate(self.card.user)
+        for operation in ("capture", "release"):
+            response = self.client.post(self.url(operation), {}, format="json")
+            self.assertEqual(response.status_code, 403)
+        hold = authorization_hold(self.card.pk, self.result.authorization_id)
+        self.assertEqual(hold.status, "active")
+
+    def test_staff_can_capture(self):
+        staff = make_card().user
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        response = self.client.post(
+            self.url("capture"), {"amount": "300.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["amount"], "300.00")
+        wallet = Wallet.objects.get(user=self.card.user)
+        self.assertEqual(wallet.balance, Decimal("9700.00"))
+        self.assertEqual(wallet.reserved, Decimal("0.00"))
+
+
+class CardExpiryTests(TestCase):
+    def setUp(self):
+        self.card = make_card()
+
+    def set_expiry(self, card, expires_on):
+        Card.objects.filter(pk=card.pk).update(expires_on=expires_on)
+        card.refresh_from_db()
+
+    def test_is_expired_follows_the_date_before_the_nightly_job(self):
+        self.set_expiry(self.card, timezone.localdate())
+        self.assertFalse(self.card.expired)
+        self.assertTrue(CardSerializer(self.card).data["is_expired"])
+
+        self.set_expiry(self.card, timezone.localdate() + timedelta(days=1))
+        self.assertFalse(CardSerializer(self.card).data["is_expired"])
+
+    def test_expired_and_undated_cards_are_deactivated(self):
+        undated, current = make_card(), make_card()
+        self.set_expiry(self.card, timezone.localdate() - timedelta(days=1))
+        self.set_expiry(undated, None)
+
+        self.assertEqual(deactivate_expired_cards(batch_size=1), 2)
+        for card, expired in ((self.card, True), (undated, True), (current, False)):
+            card.refresh_from_db()
+            self.assertEqual((card.expired, card.is_active), (expired, not expired))
+        self.assertEqual(deactivate_expired_cards(), 0)
+
+    def test_maintenance_drops_cached_profiles(self):
+        cache.clear()
+        spent = make_card()
+        for card in (self.card, spent):
+            self.assertTrue(authorize(card.pk, Decimal("500.00"), PIN).approved)
+        Card.objects.filter(pk=spent.pk).update(
+            daily_spend=Decimal("500.00"),
+            last_reset=timezone.localdate() - timedelta(days=1),
+        )
+        self.set_expiry(self.card, timezone.localdate() - timedelta(days=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(deactivate_expired_cards(), 1)
+            self.assertEqual(reset_daily_spend(), 1)
+        for card in (self.card, spent):
+            self.assertIsNone(cache.get(PROFILE_KEY.format(card.pk)))
+        result = authorize(self.card.pk, Decimal("500.00"), PIN)
+        self.assertEqual(result.reason, "card_inactive")
+
+
+@override_settings(ALLOWED_HOSTS=["testserver"], CARD_CREATION_FEE=1000.00)
+class CardIssuancePinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.holders = [make_card(card_type="verve").user for _ in range(2)]
+        staff = make_card().user
+        staff.is_staff = True
+        staff.save()
+        self.client = APIClient()
+        self.client.force_authenticate(staff)
+        response = self.client.post(
+            reverse("cards:card-issuance"),
+            {"users": [user.email for user in self.holders], "card_type": "visa"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["data"]["issued"], 2)
+        self.cards = [user.cards.get(card_type="visa") for user in self.holders]
+
+    def set_pin(self, card, pin, user=None):
+        self.client.force_authenticate(user or card.user)
+        return self.client.post(
+            reverse("cards:card-pin", args=[card.pk]),
+            {"pin": pin, "confirm_pin": pin},
+            format="json",
+        )
+
+    def test_cards_are_issued_without_a_pin(self):
+        for card in self.cards:
+            self.assertEqual(card.pin_hash, "")
+            self.assertFalse(CardSerializer(card).data["pin_set"])
+            result = authorize(card.pk, Decimal("500.00"), PIN)
+            self.assertEqual(result.reason, "pin_not_set")
+        self.assertFalse(WalletHold.objects.exists())
+
+    def test_each_cardholder_sets_their_own_pin(self):
+        first, second = self.cards
+        self.assertEqual(self.set_pin(first, PIN).status_code, 200)
+        self.assertEqual(self.set_pin(second, "4321").status_code, 200)
+        self.assertTrue(authorize(first.pk, Decimal("500.00"), PIN).approved)
+        self.assertEqual(
+            authorize(second.pk, Decimal("500.00"), PIN).reason, "incorrect_pin"
+        )
+        self.assertTrue(authorize(second.pk, Decimal("500.00"), "4321").approved)
+
+    def test_pin_is_set_once_and_only_by_the_cardholder(self):
+        first, second = self.cards
+        self.assertEqual(self.set_pin(first, "9999", user=second.user).status_code, 404)
+        self.assertEqual(self.set_pin(first, PIN).status_code, 200)
+        self.assertEqual(self.set_pin(first, "9999").status_code, 409)
+        self.assertTrue(authorize(first.pk, Decimal("500.00"), PIN).approved)
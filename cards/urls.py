@@ -10,11 +10,36 @@ urlpatterns = [
     # Create a new card
     path('create/', views.CreateCardView.as_view(), name='create-card'),
     
+    # Issue cards to many users at once (staff only)
+    path('bulk-issue/', views.CardIssuanceView.as_view(), name='card-issuance'),
+    path('bulk-issue/<uuid:id>/', views.CardIssuanceDetailView.as_view(), name='card-issuance-detail'),
+
     # List all cards for the authenticated user
     path('my-cards/', views.UserCardsView.as_view(), name='user-cards'),
     
     # View or deactivate a specific card
     path('<uuid:id>/', views.CardDetailView.as_view(), name='card-detail'),
+
+    # A card's journal of authorizations, captures and releases
+    path('<uuid:id>/transactions/', views.CardTransactionsView.as_view(), name='card-transactions'),
+
+    # Set the PIN of a card issued without one
+    path('<uuid:id>/pin/', views.CardPinView.as_view(), name='card-pin'),
+
+    # Authorize a payment on a card
+    path('<uuid:id>/authorize/', views.CardAuthorizationView.as_view(), name='card-authorize'),
+
+    # Capture or release an authorization's held funds
+    path(
+        '<uuid:id>/authorizations/<str:authorization_id>/capture/',
+        views.CardAuthorizationCaptureView.as_view(),
+        name='card-authorization-capture',
+    ),
+    path(
+        '<uuid:id>/authorizations/<str:authorization_id>/release/',
+        views.CardAuthorizationCaptureView.as_view(operation='release'),
+        name='card-authorization-release',
+    ),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
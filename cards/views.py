@@ -1,9 +1,30 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
 from rest_framework import generics, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Card
-from .serializers import CreateCard
+from .authorization import (
+    authorization_hold,
+    authorize,
+    capture_authorization,
+    forget_card,
+    release_authorization,
+)
+from .issuance import run_card_issuance
+from accounts.pagination import KeysetPagination
+from .models import Card, CardIssuance, CardTransaction
+from .serializers import (
+    CardAuthorizationSerializer,
+    CardCaptureSerializer,
+    CardIssuanceSerializer,
+    CardIssuanceStatusSerializer,
+    CardPinSerializer,
+    CardTransactionSerializer,
+    CreateCard,
+)
+from .tasks import process_card_issuance
 
 
 class CreateCardView(generics.CreateAPIView):
@@ -39,7 +60,9 @@ class UserCardsView(generics.ListAPIView):
     
     def get_queryset(self):
         # Only return active cards for the current user
-        return Card.objects.filter(user=self.request.user, is_active=True)
+        return Card.objects.filter(
+            user=self.request.user, is_active=True
+        ).select_related('user__wallet')
 
 
 class CardDetailView(generics.RetrieveDestroyAPIView):
@@ -53,9 +76,253 @@ class CardDetailView(generics.RetrieveDestroyAPIView):
     
     def get_queryset(self):
         # Only allow users to see their own cards
-        return Card.objects.filter(user=self.request.user)
+        return Card.objects.filter(user=self.request.user).select_related('user__wallet')
     
     def perform_destroy(self, instance):
         # Instead of deleting, mark the card as inactive
         instance.is_active = False
         instance.save()
+
+
+class CardTransactionsView(APIView):
+    """
+    The journal of one of the user's cards, newest first, paged with a
+    cursor over the ``(card, created_at)`` index.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get(self, request, id):
+        if not Card.objects.filter(id=id, user=request.user).exists():
+            return Response(
+                {"message": "Card not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(
+            CardTransaction.objects.filter(card_id=id), request, view=self
+        )
+        return Response(
+            {
+                "message": "Card transactions fetched successfully",
+                "data": CardTransactionSerializer(page, many=True).data,
+                "pagination": paginator.get_pagination_info(),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CardPinView(APIView):
+    """
+    Set the PIN of one of the user's cards that was issued without one, as
+    bulk-issued cards are. A PIN that is already set is not changed here.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id):
+        serializer = CardPinSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cards = Card.objects.filter(id=id, user=request.user)
+        # Only a card still without a PIN is updated, even on concurrent requests
+        updated = cards.filter(pin_hash="").update(
+            pin_hash=make_password(serializer.validated_data["pin"]),
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            if not cards.exists():
+                return Response(
+                    {"message": "Card not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            return Response(
+                {"message": "Card PIN is already set"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        forget_card(id)
+        return Response(
+            {"message": "Card PIN set successfully"},
+            status=status.HTTP_200_OK,
+        )
+
+
+class CardAuthorizationView(APIView):
+    """
+    Authorize a payment on one of the user's cards. Checks run against cached
+    card data and atomic counters and the amount is held on the user's
+    wallet; the card row is updated in the background.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id):
+        serializer = CardAuthorizationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = authorize(
+            id,
+            serializer.validated_data["amount"],
+            serializer.validated_data["pin"],
+            user=request.user,
+        )
+        if not result.approved:
+            return Response(
+                {
+                    "message": result.message,
+                    "data": {"approved": False, "reason": result.reason},
+                },
+                status=(
+                    status.HTTP_404_NOT_FOUND
+                    if result.reason == "card_not_found"
+                    else status.HTTP_402_PAYMENT_REQUIRED
+                ),
+            )
+
+        return Response(
+            {
+                "message": result.message,
+                "data": {
+                    "approved": True,
+                    "authorization_id": result.authorization_id,
+                    "amount": str(result.amount),
+                    "daily_spend": str(result.daily_spend),
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CardAuthorizationCaptureView(APIView):
+    """
+    Capture an authorization, debiting the held amount (or part of it) from
+    the wallet, or with ``operation="release"`` return the held funds. Staff
+    only: settlement is the acquirer's side, not the cardholder's.
+    """
+    permission_classes = [IsAdminUser]
+    operation = "capture"
+
+    def post(self, request, id, authorization_id):
+        hold = authorization_hold(id, authorization_id)
+        if hold is None:
+            return Response(
+                {"message": "Authorization not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if self.operation == "release":
+            if release_authorization(hold, id, authorization_id) is None:
+                hold.refresh_from_db(fields=["status"])
+                return Response(
+                    {"message": f"Authorization is already {hold.status}"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(
+                {
+                    "message": "Authorization released",
+                    "data": {"authorization_id": authorization_id},
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        serializer = CardCaptureSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        amount = serializer.validated_data.get("amount")
+        if amount is not None and amount > hold.remaining:
+            return Response(
+                {"message": "Capture amount exceeds the authorized amount"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        entry = capture_authorization(hold, id, authorization_id, amount)
+        if entry is None:
+            hold.refresh_from_db(fields=["status"])
+            return Response(
+                {"message": f"Authorization is already {hold.status}"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {
+                "message": "Authorization captured",
+                "data": {
+                    "authorization_id": authorization_id,
+                    "transaction_id": entry.transaction_id,
+                    "amount": str(entry.amount),
+                    "balance": str(entry.balance_after_transaction),
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class CardIssuanceView(APIView):
+    """
+    Issue virtual cards to many users at once. Small batches run inline;
+    larger ones run on a worker and are polled through CardIssuanceDetailView.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = CardIssuanceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"message": "Validation error", "errors": serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_ids = serializer.validated_data["users"]
+        issuance = CardIssuance.objects.create(
+            requested_by=request.user,
+            card_type=serializer.validated_data["card_type"],
+            user_ids=user_ids,
+            total_users=len(user_ids),
+        )
+
+        if len(user_ids) <= settings.CARD_ISSUANCE_SYNC_LIMIT:
+            run_card_issuance(issuance)
+            return Response(
+                {
+                    "message": "Card issuance processed",
+                    "data": CardIssuanceStatusSerializer(issuance).data,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+
+        process_card_issuance.delay(str(issuance.id))
+        return Response(
+            {
+                "message": "Card issuance queued",
+                "data": CardIssuanceStatusSerializer(issuance).data,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class CardIssuanceDetailView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, id):
+        try:
+            issuance = CardIssuance.objects.get(id=id)
+        except CardIssuance.DoesNotExist:
+            return Response(
+                {"message": "Card issuance not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "message": "Card issuance fetched successfully",
+                "data": CardIssuanceStatusSerializer(issuance).data,
+            },
+            status=status.HTTP_200_OK,
+        )
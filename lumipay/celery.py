@@ -23,6 +23,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 
 # Set default Django settings
@@ -37,6 +38,14 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def lease_transaction_id_node(**kwargs):
+    # Each pool process leases its own transaction id node when it starts
+    from accounts.utils.ids import transaction_id_generator
+
+    transaction_id_generator.node_id()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 import os
 import dj_database_url
 from decouple import config
+from celery.schedules import crontab
 
 # =========================
 # BASE DIRECTORY
@@ -18,6 +19,19 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY is missing from environment variables.")
 
+# Key for the NIN/BVN fingerprints used in uniqueness lookups. Rotating it
+# requires re-running the backfill_identity_fingerprints command.
+IDENTITY_FINGERPRINT_KEY = os.getenv("IDENTITY_FINGERPRINT_KEY", SECRET_KEY)
+# Uniqueness checks use the fingerprints only. Run
+# backfill_identity_fingerprints before deploying; if it reports users it
+# could not fingerprint, the fallback compares NIN/BVN against their hashes,
+# a PBKDF2 check per row, and refuses signups (503) rather than check more
+# than IDENTITY_FINGERPRINT_FALLBACK_LIMIT rows.
+IDENTITY_FINGERPRINT_FALLBACK = (
+    os.getenv("IDENTITY_FINGERPRINT_FALLBACK", "False") == "True"
+)
+IDENTITY_FINGERPRINT_FALLBACK_LIMIT = 100
+
 DEBUG = os.getenv("DEBUG", "False") == "True"
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "").split(",")
 
@@ -40,6 +54,7 @@ INSTALLED_APPS = [
     "cards",
     "providers",
     "payments",
+    "notifications",
     # Third-party apps
     "rest_framework",
     "rest_framework.authtoken",
@@ -160,8 +175,38 @@ USE_TZ = True
 # =========================
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
+MEDIA_URL = "/media/"
+MEDIA_ROOT = BASE_DIR / "media"
+# Archived transaction history segments (accounts.archive) get their own
+# storage so they can live on cheaper disk or object storage
+HISTORY_ARCHIVE_ROOT = os.getenv("HISTORY_ARCHIVE_ROOT", BASE_DIR / "history_archive")
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+    "history_archive": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": HISTORY_ARCHIVE_ROOT},
+    },
+}
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# =========================
+# CACHE
+# =========================
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
 # =========================
 # CELERY CONFIGURATION
 # =========================
@@ -171,6 +216,178 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Africa/Lagos"
+# Statements render on their own worker pool so PDF work never delays
+# notifications or transfers:
+#   celery -A lumipay worker -Q statements --concurrency=2 --max-tasks-per-child=200
+CELERY_TASK_ROUTES = {
+    "accounts.tasks.generate_statement": {"queue": "statements"},
+    "accounts.tasks.process_statement_run": {"queue": "statements"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "relay-outbox-messages": {
+        "task": "notifications.tasks.relay_outbox_messages",
+        "schedule": timedelta(seconds=5),
+    },
+    "purge-sent-outbox-messages": {
+        "task": "notifications.tasks.purge_sent_outbox_messages",
+        "schedule": timedelta(days=1),
+    },
+    "purge-expired-idempotency-keys": {
+        "task": "accounts.tasks.purge_expired_idempotency_keys",
+        "schedule": timedelta(hours=1),
+    },
+    "purge-expired-statements": {
+        "task": "accounts.tasks.purge_expired_statements",
+        "schedule": timedelta(hours=6),
+    },
+    "maintain-transaction-partitions": {
+        "task": "accounts.tasks.maintain_transaction_partitions",
+        "schedule": timedelta(days=1),
+    },
+    "archive-cold-transaction-history": {
+        "task": "accounts.tasks.archive_cold_transaction_history",
+        "schedule": crontab(day_of_month=2, hour=3, minute=0),
+    },
+    "release-expired-wallet-holds": {
+        "task": "accounts.tasks.release_expired_wallet_holds",
+        "schedule": timedelta(minutes=5),
+    },
+    # Card days run on UTC: 01:00 in CELERY_TIMEZONE is midnight UTC
+    "reset-card-daily-spend": {
+        "task": "cards.tasks.reset_card_daily_spend",
+        "schedule": crontab(hour=1, minute=5),
+    },
+    "deactivate-expired-cards": {
+        "task": "cards.tasks.deactivate_expired_cards",
+        "schedule": crontab(hour=1, minute=15),
+    },
+    "send-monthly-statements": {
+        "task": "accounts.tasks.send_monthly_statements",
+        "schedule": crontab(day_of_month=1, hour=2, minute=0),
+    },
+}
 
 # Card settings
 CARD_CREATION_FEE = 1000.00  # N1000 card creation fee
+# Seconds a card's authorization profile stays cached; saving a card drops it
+CARD_AUTH_PROFILE_TIMEOUT = 300
+# Incorrect PINs allowed per card per day before authorizations are declined
+CARD_PIN_MAX_ATTEMPTS = 3
+# How long an uncaptured authorization holds funds on the wallet
+CARD_AUTHORIZATION_HOLD_TIMEOUT = timedelta(days=7)
+# Cards changed per UPDATE by the nightly daily-spend reset and expiry jobs
+CARD_MAINTENANCE_BATCH_SIZE = 5000
+# Bulk card issuance: users per request, per transaction and per email batch,
+# and the largest batch issued inline instead of on a worker
+CARD_ISSUANCE_MAX_USERS = 10000
+CARD_ISSUANCE_CHUNK_SIZE = 500
+CARD_ISSUANCE_MAIL_BATCH_SIZE = 100
+CARD_ISSUANCE_SYNC_LIMIT = 200
+
+# Account number settings
+ACCOUNT_NUMBER_BANK_CODE = os.getenv("ACCOUNT_NUMBER_BANK_CODE", "999")
+# Legacy accounts were issued random numbers without a check digit, so the
+# check is only enforced once those have been migrated.
+ACCOUNT_NUMBER_CHECK_DIGIT_REQUIRED = (
+    os.getenv("ACCOUNT_NUMBER_CHECK_DIGIT_REQUIRED", "False") == "True"
+)
+
+# Transaction id settings
+# Every process that writes transactions needs its own node id (0-1023) for
+# transaction/session ids. It leases a free one from the cache, which must be
+# shared by all processes (REDIS_URL), for TRANSACTION_ID_NODE_LEASE seconds
+# at a time. TRANSACTION_ID_NODE_ID pins one instead and must then differ per
+# process. Without REDIS_URL the cache is per process, so a single process
+# (development) uses node 0.
+TRANSACTION_ID_NODE_ID = os.getenv(
+    "TRANSACTION_ID_NODE_ID", None if os.getenv("REDIS_URL") else "0"
+)
+TRANSACTION_ID_NODE_LEASE = 300
+
+# Bulk transfer settings
+BULK_TRANSFER_MAX_ROWS = 10000
+BULK_TRANSFER_CHUNK_SIZE = 200
+# Larger batches are processed by a Celery worker and polled for progress
+BULK_TRANSFER_SYNC_LIMIT = 200
+# How long a batch's total stays held on the sender's wallet
+BULK_TRANSFER_HOLD_TIMEOUT = timedelta(days=1)
+
+# Wallet hold settings
+# Default lifetime of a hold; the sweeper releases active holds past it
+WALLET_HOLD_TIMEOUT = timedelta(days=7)
+# Expired holds released per sweeper transaction
+WALLET_HOLD_SWEEP_BATCH_SIZE = 1000
+
+# Idempotency-Key settings for money-moving endpoints
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# How long a retry waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+# A request still marked processing after this long is treated as abandoned;
+# its claim is only taken over once its transaction has ended
+IDEMPOTENCY_PROCESSING_TIMEOUT = timedelta(minutes=2)
+
+# Transactional outbox settings
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_BACKOFF = 300  # seconds
+OUTBOX_RETENTION = timedelta(days=7)
+# Tasks taking one list argument whose pending messages are merged per batch
+OUTBOX_COALESCE_TASKS = ["notifications.tasks.send_notifications"]
+# Most list items in one coalesced task call; the rest go in further calls
+OUTBOX_COALESCE_MAX_ITEMS = 100
+
+# Notification settings
+NOTIFICATION_MAX_RETRIES = 5
+NOTIFICATION_RETRY_BACKOFF = 30  # seconds, doubled on each retry
+NOTIFICATION_MAX_BACKOFF = 1800  # seconds
+
+# Hashing settings
+# Iterations per secret type; None uses the default password hasher. NIN and
+# BVN are already looked up by fingerprint, so their hashes need far less cost.
+SECRET_HASH_ITERATIONS = {
+    "password": None,
+    "pin": None,
+    "nin": 100000,
+    "bvn": 100000,
+}
+# Processes per web worker for password hashing; 0 hashes inline
+HASHING_POOL_WORKERS = int(os.getenv("HASHING_POOL_WORKERS", "2"))
+# Hashes allowed in flight per web worker before requests wait, and how long
+# they wait (seconds) before failing with 503
+HASHING_POOL_MAX_PENDING = 8
+HASHING_POOL_TIMEOUT = 5
+AUTHENTICATION_BACKENDS = ["users.backends.PooledModelBackend"]
+
+# Transaction export settings
+# Rows fetched per server-side cursor round trip and written per streamed chunk
+TRANSACTION_EXPORT_CHUNK_SIZE = 2000
+
+# TransactionHistory partitions (PostgreSQL): months created ahead, and months
+# kept attached before older ones are detached (0 keeps every month)
+TRANSACTION_PARTITION_MONTHS_AHEAD = 3
+TRANSACTION_PARTITION_RETAIN_MONTHS = int(
+    os.getenv("TRANSACTION_PARTITION_RETAIN_MONTHS", 0)
+)
+
+# Cold history archive: rows older than this many months move to compressed
+# segments of up to HISTORY_ARCHIVE_SEGMENT_WALLETS wallets per month, with a
+# sparse index entry every HISTORY_ARCHIVE_BLOCK_ROWS rows
+HISTORY_ARCHIVE_AFTER_MONTHS = 12
+HISTORY_ARCHIVE_SEGMENT_WALLETS = 1000
+HISTORY_ARCHIVE_BLOCK_ROWS = 256
+
+# Statement settings
+# Rendered statements are reused for identical requests until they expire
+STATEMENT_ARTIFACT_TTL = timedelta(days=7)
+# Rows per separately rendered statement section; bounds renderer memory
+STATEMENT_SECTION_ROWS = 2000
+# Month-end mailing: wallets per claimed chunk, statements per email task,
+# how long a claimed chunk may go unfinished before another worker takes it
+# over, and how many workers the scheduled run starts
+STATEMENT_RUN_CHUNK_SIZE = 200
+STATEMENT_MAIL_BATCH_SIZE = 50
+STATEMENT_RUN_CHUNK_LEASE = timedelta(minutes=30)
+STATEMENT_RUN_WORKERS = int(os.getenv("STATEMENT_RUN_WORKERS", 4))
+# Warm the statement renderer (fonts, stylesheets) when a worker process starts
+STATEMENT_RENDERER_PRELOAD = (
+    os.getenv("STATEMENT_RENDERER_PRELOAD", "True") == "True"
+)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "lumipay.settings")
 
 application = get_wsgi_application()
+
+# Lease this worker's transaction id node now, failing startup if none is free
+from accounts.utils.ids import transaction_id_generator  # noqa: E402
+
+transaction_id_generator.node_id()
@@ -0,0 +1,6 @@
+from django.contrib import admin
+from .models import OutboxMessage, FailedNotification
+
+# Register your models here.
+admin.site.register(OutboxMessage)
+admin.site.register(FailedNotification)
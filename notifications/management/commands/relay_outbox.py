@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import relay_outbox
+
+
+class Command(BaseCommand):
+    help = "Continuously publish pending outbox messages to the Celery broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--interval", type=float, default=0.5, help="Seconds to sleep when idle"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox once and exit"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            sent = relay_outbox(options["batch_size"])
+            total += sent
+            if sent:
+                self.stdout.write(f"Relayed {sent} messages ({total} total)")
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS(f"Relayed {total} messages"))
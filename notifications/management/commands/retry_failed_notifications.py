@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notifications.models import FailedNotification
+from notifications.service import notification, notify_many
+
+
+class Command(BaseCommand):
+    help = "Queue dead-lettered notifications for another delivery attempt"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", help="Only retry notifications of this kind")
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        failed = FailedNotification.objects.order_by("id")
+        if options["kind"]:
+            failed = failed.filter(kind=options["kind"])
+
+        total = 0
+        while True:
+            batch = list(failed[: options["batch_size"]])
+            if not batch:
+                break
+            with transaction.atomic():
+                notify_many(
+                    [notification(f.kind, f.recipients, **f.context) for f in batch]
+                )
+                FailedNotification.objects.filter(pk__in=[f.pk for f in batch]).delete()
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Queued {total} notifications"))
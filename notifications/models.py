@@ -0,0 +1,49 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    A Celery task call recorded in the same transaction as the change that
+    triggered it. The relay publishes it to the broker after commit, so a
+    rollback never sends anything and broker latency never holds row locks.
+    """
+
+    STATUS_CHOICES = [("pending", "Pending"), ("sent", "Sent")]
+
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                condition=Q(status="pending"),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class FailedNotification(models.Model):
+    """Dead-letter store for notifications that exhausted their retries."""
+
+    kind = models.CharField(max_length=50)
+    recipients = models.JSONField(default=list)
+    context = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} to {', '.join(self.recipients)}"
@@ -0,0 +1,94 @@
+import logging
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, *args, **kwargs):
+    """
+    Record a call to the Celery ``task`` in the outbox.
+
+    Call it inside the transaction that makes the change being announced:
+    the message commits or rolls back with it and is published later by
+    ``relay_outbox``.
+    """
+    return OutboxMessage.objects.create(task=task.name, args=list(args), kwargs=kwargs)
+
+
+def relay_outbox(batch_size=None):
+    """
+    Publish one batch of pending outbox messages to the broker.
+
+    Rows are claimed with ``SKIP LOCKED`` so several relays can run at once.
+    Messages for tasks listed in ``OUTBOX_COALESCE_TASKS`` take a single list
+    argument and are merged into task calls of up to
+    ``OUTBOX_COALESCE_MAX_ITEMS`` items; a message is never split across
+    calls. Delivery is
+    at-least-once: a relay that dies after publishing but before committing
+    publishes the batch again. Failed publishes are retried with exponential
+    backoff. Returns the number of messages sent.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    sent = 0
+
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+
+        # (task, args, kwargs, messages) in publishing order
+        calls = []
+        coalesced = {}
+        max_items = settings.OUTBOX_COALESCE_MAX_ITEMS
+        for message in messages:
+            if message.task not in settings.OUTBOX_COALESCE_TASKS:
+                calls.append((message.task, message.args, message.kwargs, [message]))
+                continue
+            call = coalesced.get(message.task)
+            if call is None or len(call[1][0]) + len(message.args[0]) > max_items:
+                # Start a new call rather than grow this one past the cap
+                call = coalesced[message.task] = (message.task, [[]], {}, [])
+                calls.append(call)
+            call[1][0].extend(message.args[0])
+            call[3].append(message)
+
+        for task, args, kwargs, members in calls:
+            try:
+                current_app.send_task(task, args=args, kwargs=kwargs)
+            except Exception as e:
+                logger.error(f"Failed to relay outbox task {task}: {str(e)}")
+                for message in members:
+                    message.attempts += 1
+                    message.last_error = str(e)
+                    message.available_at = now + timedelta(
+                        seconds=min(2**message.attempts, settings.OUTBOX_MAX_BACKOFF)
+                    )
+                    message.save(
+                        update_fields=["attempts", "last_error", "available_at"]
+                    )
+                continue
+            OutboxMessage.objects.filter(pk__in=[m.pk for m in members]).update(
+                status="sent", sent_at=timezone.now(), attempts=F("attempts") + 1
+            )
+            sent += len(members)
+
+    return sent
+
+
+def purge_sent_messages():
+    cutoff = timezone.now() - settings.OUTBOX_RETENTION
+    deleted, _ = OutboxMessage.objects.filter(
+        status="sent", sent_at__lte=cutoff
+    ).delete()
+    return deleted
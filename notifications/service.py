@@ -0,0 +1,130 @@
+import logging
+import mimetypes
+import os
+import smtplib
+
+from django.conf import settings
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+
+from .outbox import enqueue
+
+logger = logging.getLogger(__name__)
+
+# kind -> (subject, template); .html templates also get a plain-text part
+TEMPLATES = {
+    "welcome": ("Welcome to LumiPay!", "emails/welcome_email.html"),
+    "card_created": ("Your New LumiPay Card is Ready!", "emails/card_created.html"),
+    "transaction": ("Transaction Alert 💸", "emails/transaction_alert.txt"),
+    "statement": ("Your LumiPay Statement", "emails/monthly_statement.txt"),
+}
+
+_connection = None
+_connection_pid = None
+
+
+def notification(kind, recipients, **context):
+    """
+    Build a JSON-serialisable notification for ``notify_many``. An
+    ``attachments`` list of storage paths in the context is attached to the
+    email when it is sent.
+    """
+    if kind not in TEMPLATES:
+        raise ValueError(f"Unknown notification kind: {kind}")
+    return {"kind": kind, "to": list(recipients), "context": context}
+
+
+def notify(kind, recipients, **context):
+    """Queue one notification in the outbox of the current transaction."""
+    notify_many([notification(kind, recipients, **context)])
+
+
+def notify_many(notifications):
+    """
+    Queue several notifications as outbox messages of at most
+    ``OUTBOX_COALESCE_MAX_ITEMS`` items, so the relay never has to publish
+    one larger than its cap.
+    """
+    from .tasks import send_notifications
+
+    size = settings.OUTBOX_COALESCE_MAX_ITEMS
+    for start in range(0, len(notifications), size):
+        enqueue(send_notifications, notifications[start : start + size])
+
+
+def build_message(item):
+    subject, template = TEMPLATES[item["kind"]]
+    context = {"support_email": settings.DEFAULT_FROM_EMAIL, **item["context"]}
+    body = render_to_string(template, context)
+    if not template.endswith(".html"):
+        message = EmailMultiAlternatives(
+            subject, body, settings.DEFAULT_FROM_EMAIL, item["to"]
+        )
+    else:
+        message = EmailMultiAlternatives(
+            subject, strip_tags(body), settings.DEFAULT_FROM_EMAIL, item["to"]
+        )
+        message.attach_alternative(body, "text/html")
+    for name in item["context"].get("attachments", []):
+        with default_storage.open(name) as handle:
+            message.attach(
+                os.path.basename(name), handle.read(), mimetypes.guess_type(name)[0]
+            )
+    return message
+
+
+def get_connection():
+    """
+    Return this worker process's email connection, opening it on first use.
+
+    The connection stays open between tasks, so a worker pays the SMTP
+    connect/TLS/login cost once instead of once per email.
+    """
+    global _connection, _connection_pid
+    if _connection is None or _connection_pid != os.getpid():
+        _connection = mail.get_connection(fail_silently=False)
+        _connection_pid = os.getpid()
+    _connection.open()
+    return _connection
+
+
+def close_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+    _connection = None
+
+
+def send_message(message):
+    try:
+        get_connection().send_messages([message])
+    except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+        # The server may have dropped an idle connection; reconnect once
+        logger.warning(f"Email connection failed, reconnecting: {str(e)}")
+        close_connection()
+        get_connection().send_messages([message])
+
+
+def deliver(notifications):
+    """
+    Render and send ``notifications`` over the pooled connection.
+
+    Returns ``(notification, error)`` pairs for those that could not be sent,
+    so callers can retry only the failures.
+    """
+    failed = []
+    for item in notifications:
+        try:
+            send_message(build_message(item))
+        except Exception as e:
+            logger.error(
+                f"Failed to send {item['kind']} email to {item['to']}: {str(e)}"
+            )
+            failed.append((item, str(e)))
+    return failed
@@ -0,0 +1,57 @@
+from celery import shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+
+from .models import FailedNotification
+from .outbox import purge_sent_messages, relay_outbox
+from .service import close_connection, deliver
+
+
+@shared_task
+def relay_outbox_messages():
+    sent = relay_outbox()
+    return f"Relayed {sent} outbox messages"
+
+
+@shared_task
+def purge_sent_outbox_messages():
+    deleted = purge_sent_messages()
+    return f"Purged {deleted} sent outbox messages"
+
+
+@shared_task(bind=True, max_retries=settings.NOTIFICATION_MAX_RETRIES)
+def send_notifications(self, notifications):
+    """
+    Send a batch of notifications over the worker's pooled connection.
+    Failures are retried with exponential backoff and moved to the
+    FailedNotification dead-letter store once retries run out.
+    """
+    failed = deliver(notifications)
+    if not failed:
+        return f"Sent {len(notifications)} notifications"
+
+    if self.request.retries >= self.max_retries:
+        FailedNotification.objects.bulk_create(
+            [
+                FailedNotification(
+                    kind=item["kind"],
+                    recipients=item["to"],
+                    context=item["context"],
+                    error=error,
+                    attempts=self.request.retries + 1,
+                )
+                for item, error in failed
+            ]
+        )
+        return f"Sent {len(notifications) - len(failed)}, dead-lettered {len(failed)}"
+
+    countdown = min(
+        settings.NOTIFICATION_RETRY_BACKOFF * 2**self.request.retries,
+        settings.NOTIFICATION_MAX_BACKOFF,
+    )
+    raise self.retry(args=[[item for item, _ in failed]], countdown=countdown)
+
+
+@worker_process_shutdown.connect
+def close_email_connection(**kwargs):
+    close_connection()
@@ -0,0 +1,229 @@
+import threading
+from collections import Counter
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core import mail
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import FailedNotification, OutboxMessage
+from .outbox import enqueue, relay_outbox
+from .service import close_connection, notification, notify, notify_many
+from .tasks import send_notifications
+
+# A task that is not coalesced, so each message is one published call
+TASK = mock.Mock()
+TASK.name = "accounts.tasks.process_bulk_transfer"
+
+
+def published(send_task):
+    """The first argument of every published call, one per message."""
+    return [call.kwargs["args"][0] for call in send_task.call_args_list]
+
+
+class OutboxEnqueueTests(TestCase):
+    def test_message_rolls_back_with_its_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue(TASK, "rolled back")
+                raise RuntimeError("change failed")
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        with transaction.atomic():
+            enqueue(TASK, "committed", chunk=2)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(
+            (message.task, message.args, message.kwargs, message.status),
+            (TASK.name, ["committed"], {"chunk": 2}, "pending"),
+        )
+
+    def test_relay_publishes_each_message_once(self):
+        for n in range(5):
+            enqueue(TASK, n)
+        with mock.patch("notifications.outbox.current_app") as app:
+            self.assertEqual(relay_outbox(batch_size=3), 3)
+            self.assertEqual(relay_outbox(batch_size=3), 2)
+            self.assertEqual(relay_outbox(batch_size=3), 0)
+        self.assertEqual(published(app.send_task), list(range(5)))
+        self.assertEqual(OutboxMessage.objects.filter(status="sent").count(), 5)
+
+
+@skipUnless(
+    connection.features.has_select_for_update_skip_locked,
+    "Concurrent relays need SELECT ... FOR UPDATE SKIP LOCKED",
+)
+class ConcurrentRelayTests(TransactionTestCase):
+    messages = 200
+    relays = 6
+
+    def test_concurrent_relays_publish_each_message_exactly_once(self):
+        OutboxMessage.objects.bulk_create(
+            [OutboxMessage(task=TASK.name, args=[n]) for n in range(self.messages)]
+        )
+        start = threading.Barrier(self.relays)
+
+        def relay():
+            try:
+                start.wait()
+                while relay_outbox(batch_size=7):
+                    pass
+            finally:
+                connection.close()
+
+        with mock.patch("notifications.outbox.current_app") as app:
+            threads = [threading.Thread(target=relay) for _ in range(self.relays)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        counts = Counter(published(app.send_task))
+        self.assertEqual(set(counts), set(range(self.messages)))
+        self.assertEqual(max(counts.values()), 1)
+        self.assertFalse(OutboxMessage.objects.filter(status="pending").exists())
+
+    def test_relay_skips_messages_claimed_by_another_relay(self):
+        OutboxMessage.objects.bulk_create(
+            [OutboxMessage(task=TASK.name, args=[n]) for n in range(4)]
+        )
+        first = OutboxMessage.objects.order_by("id").first()
+        claimed, done = threading.Event(), threading.Event()
+
+        def hold_claim():
+            try:
+                with transaction.atomic():
+                    OutboxMessage.objects.select_for_update().get(pk=first.pk)
+                    claimed.set()
+                    done.wait(10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_claim)
+        holder.start()
+        claimed.wait(10)
+        with mock.patch("notifications.outbox.current_app") as app:
+            self.assertEqual(relay_outbox(), 3)
+            done.set()
+            holder.join()
+            self.assertEqual(relay_outbox(), 1)
+        self.assertEqual(sorted(published(app.send_task)), [0, 1, 2, 3])
+
+
+def alert(n, **context):
+    return notification(
+        "transaction", [f"user{n}@example.com"], amount="100.00", **context
+    )
+
+
+@override_settings(OUTBOX_COALESCE_MAX_ITEMS=100)
+class NotificationTests(TestCase):
+    def setUp(self):
+        close_connection()
+
+    def tearDown(self):
+        close_connection()
+
+    def relay(self):
+        """Relay the outbox, running published notification tasks inline."""
+        with mock.patch("notifications.outbox.current_app") as app:
+            sent = relay_outbox()
+        for call in app.send_task.call_args_list:
+            send_notifications.apply(args=call.kwargs["args"])
+        return sent, app.send_task
+
+    def test_notify_is_sent_once_the_outbox_is_relayed(self):
+        with transaction.atomic():
+            notify("transaction", ["ada@example.com"], amount="500.00")
+        self.assertEqual(len(mail.outbox), 0)
+
+        sent, _ = self.relay()
+        self.assertEqual(sent, 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["ada@example.com"])
+        self.assertEqual(mail.outbox[0].subject, "Transaction Alert 💸")
+        self.assertIn("500.00", mail.outbox[0].body)
+
+    def test_notify_many_splits_batches_at_the_coalescing_cap(self):
+        notify_many([alert(n) for n in range(250)])
+        sizes = [
+            len(message.args[0]) for message in OutboxMessage.objects.order_by("id")
+        ]
+        self.assertEqual(sizes, [100, 100, 50])
+
+        self.relay()
+        self.assertEqual(len(mail.outbox), 250)
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            notification("newsletter", ["ada@example.com"])
+
+    def test_relay_coalesces_messages_without_splitting_them(self):
+        notify_many([alert(n) for n in range(150)])
+        for n in range(3):
+            notify("transaction", [f"single{n}@example.com"], amount="1.00")
+
+        sent, send_task = self.relay()
+        self.assertEqual(sent, 5)
+        self.assertEqual(
+            [len(call.kwargs["args"][0]) for call in send_task.call_args_list],
+            [100, 53],
+        )
+        self.assertEqual(len(mail.outbox), 153)
+
+    def test_failed_publish_is_retried_with_backoff(self):
+        notify("transaction", ["ada@example.com"], amount="500.00")
+        with mock.patch("notifications.outbox.current_app") as app:
+            app.send_task.side_effect = OSError("broker down")
+            self.assertEqual(relay_outbox(), 0)
+            self.assertEqual(relay_outbox(), 0)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(
+            (message.status, message.attempts, message.last_error),
+            ("pending", 1, "broker down"),
+        )
+        delay = message.available_at - timezone.now()
+        self.assertTrue(timedelta(seconds=1) < delay <= timedelta(seconds=2))
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(self.relay()[0], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_only_failed_notifications_are_retried_with_backoff(self):
+        broken = alert(1, attachments=["statements/missing.pdf"])
+        with mock.patch.object(send_notifications, "retry") as retry:
+            retry.side_effect = RuntimeError("retry")
+            result = send_notifications.apply(args=[[alert(0), broken]], retries=2)
+
+        self.assertIsInstance(result.result, RuntimeError)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            retry.call_args.kwargs,
+            {"args": [[broken]], "countdown": settings.NOTIFICATION_RETRY_BACKOFF * 4},
+        )
+        self.assertFalse(FailedNotification.objects.exists())
+
+    @override_settings(NOTIFICATION_MAX_BACKOFF=60)
+    def test_retry_backoff_is_capped(self):
+        broken = alert(1, attachments=["statements/missing.pdf"])
+        with mock.patch.object(send_notifications, "retry") as retry:
+            retry.side_effect = RuntimeError("retry")
+            send_notifications.apply(args=[[broken]], retries=3)
+        self.assertEqual(retry.call_args.kwargs["countdown"], 60)
+
+    def test_last_retry_moves_failures_to_the_dead_letter_store(self):
+        broken = alert(1, attachments=["statements/missing.pdf"])
+        retries = send_notifications.max_retries
+        result = send_notifications.apply(args=[[alert(0), broken]], retries=retries)
+
+        self.assertEqual(result.result, "Sent 1, dead-lettered 1")
+        self.assertEqual(len(mail.outbox), 1)
+        failed = FailedNotification.objects.get()
+        self.assertEqual(
+            (failed.kind, failed.recipients, failed.attempts),
+            ("transaction", ["user1@example.com"], retries + 1),
+        )
+        self.assertEqual(failed.context["attachments"], ["statements/missing.pdf"])
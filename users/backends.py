@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+
+from .hashing import hash_secrets, verify_secret
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that checks passwords on the hashing pool, so logins are
+    bounded by the same back-pressure as registrations.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            hash_secrets(password=password)
+            return None
+
+        if not verify_secret(password, user.password):
+            return None
+        hasher = identify_hasher(user.password)
+        preferred = get_hasher("default")
+        if hasher.algorithm != preferred.algorithm or hasher.must_update(user.password):
+            user.set_password(password)
+            user.save(update_fields=["password"])
+        if self.user_can_authenticate(user):
+            return user
+        return None
@@ -1,5 +1,5 @@
 from rest_framework.views import exception_handler
-from rest_framework.exceptions import Throttled
+from rest_framework.exceptions import APIException, Throttled
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -16,3 +16,15 @@ def custom_exception_handler(exc, context):
         )
 
     return response
+
+
+class ServiceBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service is busy. Please try again shortly."
+    default_code = "service_busy"
+
+
+class IdentityCheckUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Registration is temporarily unavailable. Please try again later."
+    default_code = "identity_check_unavailable"
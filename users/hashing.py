@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    get_hasher,
+    identify_hasher,
+)
+
+from .exceptions import ServiceBusy
+
+
+class IdentityPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with a configurable iteration count, for secrets that do not need
+    password-grade cost. Its hashes use the standard ``pbkdf2_sha256`` format,
+    so ``check_password`` verifies them with the default hasher.
+    """
+
+    def __init__(self, iterations):
+        self.iterations = iterations
+
+
+def hasher_for(secret_type):
+    """Return the hasher configured for ``secret_type`` in SECRET_HASH_ITERATIONS."""
+    iterations = settings.SECRET_HASH_ITERATIONS.get(secret_type)
+    if iterations is None:
+        return get_hasher("default")
+    return IdentityPBKDF2PasswordHasher(iterations)
+
+
+def is_hashed(value):
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _encode(hasher, value):
+    # Runs in a pool process with the hasher pickled from the parent
+    return hasher.encode(value, hasher.salt())
+
+
+def _verify(hasher, value, encoded):
+    return hasher.verify(value, encoded)
+
+
+class HashingPool:
+    """
+    A bounded process pool for password-grade hashing.
+
+    Independent hashes run in parallel on other cores instead of pinning the
+    request worker, and at most ``HASHING_POOL_MAX_PENDING`` hashes may be
+    queued per process; beyond that callers wait up to
+    ``HASHING_POOL_TIMEOUT`` seconds and then get ``ServiceBusy``. With
+    ``HASHING_POOL_WORKERS = 0`` hashes run inline.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._pending = 0
+        self._available = threading.Condition()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Pools do not survive fork; each worker process starts its own
+                self._pid = os.getpid()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.HASHING_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=django.setup,
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._pid = self._executor = None
+
+    def _reserve(self, count):
+        # Reserve all of a request's slots at once, so concurrent requests
+        # holding part of what they need cannot starve each other
+        count = min(count, settings.HASHING_POOL_MAX_PENDING)
+        with self._available:
+            if not self._available.wait_for(
+                lambda: self._pending + count <= settings.HASHING_POOL_MAX_PENDING,
+                timeout=settings.HASHING_POOL_TIMEOUT,
+            ):
+                raise ServiceBusy()
+            self._pending += count
+        return count
+
+    def _release(self, count):
+        with self._available:
+            self._pending -= count
+            self._available.notify_all()
+
+    def map(self, fn, calls):
+        """Run ``fn(*args)`` for each args tuple and return results in order."""
+        if not settings.HASHING_POOL_WORKERS:
+            return [fn(*args) for args in calls]
+
+        executor = self._get_executor()
+        reserved = self._reserve(len(calls))
+        try:
+            futures = [executor.submit(fn, *args) for args in calls]
+            return [future.result() for future in futures]
+        finally:
+            self._release(reserved)
+
+
+hashing_pool = HashingPool()
+
+
+def hash_secrets(**secrets):
+    """
+    Hash several secrets in parallel, each with its configured hasher, e.g.
+    ``hash_secrets(password=..., pin=...)``. Returns the encoded hashes by name.
+    """
+    names = list(secrets)
+    encoded = hashing_pool.map(
+        _encode, [(hasher_for(name), secrets[name]) for name in names]
+    )
+    return dict(zip(names, encoded))
+
+
+def verify_secret(value, encoded):
+    """Check ``value`` against an encoded hash on the pool."""
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hashing_pool.map(_verify, [(hasher, value, encoded)])[0]
@@ -0,0 +1,126 @@
+import csv
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import Wallet
+from users.hashing import is_hashed
+from users.models import User
+from users.utils.fingerprints import identity_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate the NIN/BVN fingerprint columns on users and wallets in batches. "
+        "Stored values are salted hashes, so rows that were already hashed can only "
+        "be fingerprinted from a KYC export passed with --source."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--source",
+            help="CSV file with account_number,nin,bvn columns from the KYC provider",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer")
+        source = self.load_source(options["source"]) if options["source"] else {}
+
+        pending = User.objects.filter(
+            Q(nin_fingerprint__isnull=True) | Q(bvn_fingerprint__isnull=True)
+        ).order_by("pk")
+
+        updated = 0
+        unfingerprinted = []
+        last_pk = None
+        while True:
+            batch_qs = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            changed = []
+            for user in batch:
+                raw = source.get(user.account_number, {})
+                nin_done = self.fingerprint_field(user, "nin", raw.get("nin"))
+                bvn_done = self.fingerprint_field(user, "bvn", raw.get("bvn"))
+                if nin_done or bvn_done:
+                    changed.append(user)
+                if not (user.nin_fingerprint and user.bvn_fingerprint):
+                    unfingerprinted.append(user.account_number)
+
+            with transaction.atomic():
+                User.objects.bulk_update(
+                    changed, ["nin", "bvn", "nin_fingerprint", "bvn_fingerprint"]
+                )
+                fingerprints = {
+                    user.pk: user.bvn_fingerprint
+                    for user in changed
+                    if user.bvn_fingerprint
+                }
+                wallets = list(
+                    Wallet.objects.filter(
+                        user_id__in=fingerprints, bvn_fingerprint__isnull=True
+                    )
+                )
+                for wallet in wallets:
+                    wallet.bvn_fingerprint = fingerprints[wallet.user_id]
+                Wallet.objects.bulk_update(wallets, ["bvn_fingerprint"])
+
+            updated += len(changed)
+            self.stdout.write(
+                f"Processed batch ending at {last_pk} ({updated} updated)"
+            )
+
+        if unfingerprinted:
+            logger.warning(
+                "%d users still have no NIN/BVN fingerprint: %s",
+                len(unfingerprinted),
+                ", ".join(unfingerprinted),
+            )
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Fingerprinted {updated} users; {len(unfingerprinted)} still "
+                    "need a --source entry. Until they have one, turn "
+                    "IDENTITY_FINGERPRINT_FALLBACK on to check them by hash"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Fingerprinted {updated} users; none left, uniqueness "
+                    "checks are fingerprint-only"
+                )
+            )
+
+    def load_source(self, path):
+        try:
+            with open(path, newline="") as handle:
+                return {row["account_number"]: row for row in csv.DictReader(handle)}
+        except (OSError, KeyError) as e:
+            raise CommandError(f"Could not read source file {path}: {e}")
+
+    def fingerprint_field(self, user, field, raw_value):
+        """Set ``<field>_fingerprint`` on ``user`` if the raw value is known."""
+        fingerprint_attr = f"{field}_fingerprint"
+        if getattr(user, fingerprint_attr):
+            return False
+
+        stored = getattr(user, field)
+        if stored and not is_hashed(stored):
+            # Legacy plaintext value: fingerprint it and hash it in place
+            getattr(user, f"set_{field}")()
+            return True
+
+        if raw_value and getattr(user, f"check_{field}")(raw_value):
+            setattr(user, fingerprint_attr, identity_fingerprint(raw_value))
+            return True
+        return False
@@ -0,0 +1,68 @@
+import random
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from users.models import User
+from users.utils.account_numbers import AccountNumberAllocator, is_valid_account_number
+
+
+def legacy_account_number():
+    """The previous strategy: random digits plus an exists() query per attempt."""
+    while True:
+        account_number = "".join(random.choices(string.digits, k=10))
+        if not User.objects.filter(account_number=account_number).exists():
+            return account_number
+
+
+class Command(BaseCommand):
+    help = "Compare account-number allocation throughput under parallel registration"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--count", type=int, default=500, help="Numbers per worker")
+
+    def handle(self, *args, **options):
+        workers, count = options["workers"], options["count"]
+        allocator = AccountNumberAllocator(name="account_number_benchmark")
+
+        for label, allocate in (
+            ("legacy random + exists()", legacy_account_number),
+            ("block allocator", allocator.allocate),
+        ):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(
+                    pool.map(lambda _: self.run_worker(allocate, count), range(workers))
+                )
+            elapsed = time.perf_counter() - started
+
+            numbers = [
+                number for worker_numbers, _ in results for number in worker_numbers
+            ]
+            queries = sum(worker_queries for _, worker_queries in results)
+            total = len(numbers)
+            self.stdout.write(
+                f"{label}: {total} numbers in {elapsed:.3f}s "
+                f"({total / elapsed:,.0f}/s), {queries / total:.3f} queries each, "
+                f"{total - len(set(numbers))} duplicates, "
+                f"{sum(not is_valid_account_number(n) for n in numbers)} failing check digit"
+            )
+
+    def run_worker(self, allocate, count):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count_queries):
+                numbers = [allocate() for _ in range(count)]
+        finally:
+            connection.close()
+        return numbers, queries
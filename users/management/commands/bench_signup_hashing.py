@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from users.hashing import hash_secrets, hashing_pool
+
+SECRETS = {
+    "password": "correct horse battery",
+    "pin": "123456",
+    "nin": "123456789012345",
+    "bvn": "543210987654321",
+}
+
+
+def sequential_signup():
+    """The previous path: four password-grade hashes on the request thread."""
+    return [make_password(value) for value in SECRETS.values()]
+
+
+def pooled_signup():
+    return hash_secrets(**SECRETS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the hashing cost of a registration done sequentially in the "
+        "web worker with the hashing pool and per-secret hasher policy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=20)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Concurrent requests in one web worker",
+        )
+
+    def handle(self, *args, **options):
+        signups, concurrency = options["signups"], options["concurrency"]
+        pool_workers = settings.HASHING_POOL_WORKERS
+        # Start the pool processes outside the timed run
+        pooled_signup()
+
+        for label, signup, cores in (
+            ("sequential", sequential_signup, 1),
+            (f"pooled ({pool_workers} processes)", pooled_signup, 1 + pool_workers),
+        ):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as threads:
+                list(threads.map(lambda _: signup(), range(signups)))
+            elapsed = time.perf_counter() - started
+            rate = signups / elapsed
+            cores = min(cores, os.cpu_count())
+            self.stdout.write(
+                f"{label}: {signups} signups in {elapsed:.2f}s "
+                f"({rate:.1f}/s, {rate / cores:.1f}/s per core, "
+                f"{elapsed / signups * 1000:.0f}ms each)"
+            )
+
+        hashing_pool.shutdown()
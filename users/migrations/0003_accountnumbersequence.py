@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+def create_account_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # The allocator reads its block size from INCREMENT BY
+    schema_editor.execute(
+        "CREATE SEQUENCE IF NOT EXISTS users_account_number_seq "
+        "START WITH 1 INCREMENT BY 100"
+    )
+
+
+def drop_account_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP SEQUENCE IF EXISTS users_account_number_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_bvn_fingerprint_user_nin_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountNumberSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("next_serial", models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(
+            create_account_number_sequence, drop_account_number_sequence
+        ),
+    ]
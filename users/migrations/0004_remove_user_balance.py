@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_accountnumbersequence"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="user",
+            name="balance",
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-import random, string, uuid
+import uuid
+from decimal import Decimal
+from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.hashers import make_password, check_password
+from .hashing import hasher_for, is_hashed
+from .utils.fingerprints import identity_fingerprint
 
 
 class CustomUserManager(BaseUserManager):
@@ -29,10 +33,22 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
     def generate_account_number(self):
-        while True:
-            account_number = "".join(random.choices(string.digits, k=10))
-            if not User.objects.filter(account_number=account_number).exists():
-                return account_number
+        from .utils.account_numbers import account_number_allocator
+
+        return account_number_allocator.allocate()
+
+
+class AccountNumberSequence(models.Model):
+    """
+    Counter backing account-number block reservations on databases without
+    native sequences. PostgreSQL uses ``users_account_number_seq`` instead.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    next_serial = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} - {self.next_serial}"
 
 
 class User(AbstractUser):
@@ -43,6 +59,13 @@ class User(AbstractUser):
     email = models.EmailField(unique=True, blank=False)
     nin = models.CharField(max_length=128, blank=False, unique=True, null=False)
     bvn = models.CharField(max_length=128, blank=False, unique=True, null=False)
+    # Keyed fingerprints of the raw NIN/BVN, used for indexed uniqueness checks
+    nin_fingerprint = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
+    bvn_fingerprint = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
     phone_number = models.CharField(max_length=15, blank=False, unique=True)
     account_number = models.CharField(max_length=10, unique=True, blank=False)
 
@@ -51,7 +74,6 @@ class User(AbstractUser):
         choices=[("NGN", "Naira"), ("USD", "Dollar"), ("EUR", "Euro")],
         default="NGN",
     )
-    balance = models.DecimalField(max_digits=12, decimal_places=2, default=100000.00)
     pin = models.CharField(max_length=128, blank=True, null=True)
 
     # 🧾 Profile / KYC
@@ -85,21 +107,36 @@ class User(AbstractUser):
         full_name = f"{self.first_name} {self.last_name}".strip()
         return full_name if full_name else self.email
 
+    @property
+    def display_name(self):
+        """Name shown to counterparties: full name, else email."""
+        return f"{self.first_name} {self.last_name}".strip() or self.email
+
+    @property
+    def balance(self):
+        """Live balance, derived from the user's wallet."""
+        try:
+            return self.wallet.balance
+        except ObjectDoesNotExist:
+            return Decimal("0.00")
+
     def save(self, *args, **kwargs):
-        if self.pin and not self.pin.startswith("pbkdf2_"):
-            self.pin = make_password(self.pin)
+        if self.pin and not is_hashed(self.pin):
+            self.pin = make_password(self.pin, hasher=hasher_for("pin"))
         super().save(*args, **kwargs)
 
     def set_pin(self, raw_pin):
-        self.pin = make_password(raw_pin)
+        self.pin = make_password(raw_pin, hasher=hasher_for("pin"))
 
     def set_bvn(self, *args, **kwargs):
-        if self.bvn and not self.bvn.startswith("pbkdf2_"):
-            self.bvn = make_password(self.bvn)
+        if self.bvn and not is_hashed(self.bvn):
+            self.bvn_fingerprint = identity_fingerprint(self.bvn)
+            self.bvn = make_password(self.bvn, hasher=hasher_for("bvn"))
 
     def set_nin(self, *args, **kwargs):
-        if self.nin and not self.nin.startswith("pbkdf2_"):
-            self.nin = make_password(self.nin)
+        if self.nin and not is_hashed(self.nin):
+            self.nin_fingerprint = identity_fingerprint(self.nin)
+            self.nin = make_password(self.nin, hasher=hasher_for("nin"))
 
     def check_bvn(self, raw_bvn):
         return check_password(raw_bvn, self.bvn)
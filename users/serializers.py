@@ -1,3 +1,6 @@
+import logging
+
+from django.conf import settings
 from django.db import transaction
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
@@ -5,7 +8,48 @@ from rest_framework import serializers
 from .models import User
 from accounts.models import Wallet
 from rest_framework.exceptions import ValidationError
+from .exceptions import IdentityCheckUnavailable
+from .hashing import hash_secrets
 from .utils.email_utils import send_welcome_email
+from .utils.fingerprints import identity_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def identity_exists(field, value):
+    """
+    Whether a user already has this NIN or BVN, looked up by its indexed
+    fingerprint. With IDENTITY_FINGERPRINT_FALLBACK on, up to
+    IDENTITY_FINGERPRINT_FALLBACK_LIMIT rows not covered by
+    backfill_identity_fingerprints are also compared by hash; beyond that
+    the check fails closed with ``IdentityCheckUnavailable``.
+    """
+    fingerprint = identity_fingerprint(value)
+    if User.objects.filter(**{f"{field}_fingerprint": fingerprint}).exists():
+        return True
+    if not settings.IDENTITY_FINGERPRINT_FALLBACK:
+        return False
+    limit = settings.IDENTITY_FINGERPRINT_FALLBACK_LIMIT
+    pending = list(
+        User.objects.filter(**{f"{field}_fingerprint__isnull": True})
+        .only(field)
+        .order_by("pk")[: limit + 1]
+    )
+    if len(pending) > limit:
+        logger.error(
+            "More than %d users have no %s fingerprint; refusing signups until "
+            "backfill_identity_fingerprints has run",
+            limit,
+            field.upper(),
+        )
+        raise IdentityCheckUnavailable()
+    if pending:
+        logger.warning(
+            "%d users have no %s fingerprint; run backfill_identity_fingerprints",
+            len(pending),
+            field.upper(),
+        )
+    return any(getattr(user, f"check_{field}")(value) for user in pending)
 
 
 class RegisterUserSerializer(serializers.ModelSerializer):
@@ -66,10 +110,8 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         if len(nin) != 15:
             raise ValidationError("NIN must be 15 characters long")
 
-        # Check if NIN already exists by comparing hashes
-        for user in User.objects.all():
-            if user.check_nin(nin):
-                raise ValidationError("NIN already exists")
+        if identity_exists("nin", nin):
+            raise ValidationError("NIN already exists")
 
         # BVN validation
         bvn = attrs.get("bvn")
@@ -80,10 +122,8 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         if len(bvn) != 15:
             raise ValidationError("BVN must be 15 characters long")
 
-        # Check if BVN already exists by comparing hashes
-        for user in User.objects.all():
-            if user.check_bvn(bvn):
-                raise ValidationError("BVN already exists")
+        if identity_exists("bvn", bvn):
+            raise ValidationError("BVN already exists")
 
         return attrs
 
@@ -93,42 +133,45 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         password = validated_data.pop("password")
         pin = validated_data.pop("pin")
 
+        nin = validated_data.pop("nin")
+        bvn = validated_data.pop("bvn")
+
+        # The four hashes are independent, so they run in parallel on the
+        # hashing pool; ServiceBusy (503) propagates when it is saturated
+        hashes = hash_secrets(password=password, pin=pin, nin=nin, bvn=bvn)
+
         try:
+            # Allocated before the transaction so the block reservation is
+            # never rolled back with a failed registration
+            account_number = User.objects.generate_account_number()
             with transaction.atomic():
-                user = User.objects.create(**validated_data)
-                user.set_password(password)
-                user.set_pin(pin)
-                user.set_nin(validated_data["nin"])
-                user.set_bvn(validated_data["bvn"])
-                user.account_number = User.objects.generate_account_number()
+                user = User(
+                    account_number=account_number,
+                    password=hashes["password"],
+                    pin=hashes["pin"],
+                    nin=hashes["nin"],
+                    nin_fingerprint=identity_fingerprint(nin),
+                    bvn=hashes["bvn"],
+                    bvn_fingerprint=identity_fingerprint(bvn),
+                    **validated_data,
+                )
                 user.save()
 
                 Wallet.objects.create(
                     user=user,
                     account_number=user.account_number,
-                    balance=user.balance,
                     bvn=user.bvn,
+                    bvn_fingerprint=user.bvn_fingerprint,
                 )
 
-                # Send welcome email
-                try:
-                    send_welcome_email(user)
-                except Exception as e:
-                    # Log the error but don't fail the registration
-                    import logging
-
-                    logger = logging.getLogger(__name__)
-                    error_msg = (
-                        f"Failed to send welcome email to {user.email}: {str(e)}"
-                    )
-                    logger.error(error_msg, exc_info=True)
-                    # Print to console for better visibility in development
-                    print(f"\n=== EMAIL ERROR ===\n{error_msg}\n==============\n")
+                # Queue the welcome email with the registration
+                send_welcome_email(user)
 
                 return user
-        except Exception as e:
-            print(validated_data)
-            raise ValidationError(f"Registration failed: {str(e)}")
+        except Exception:
+            # Logged without the payload, which holds personal details
+            logger.exception("Registration failed")
+            raise ValidationError("Registration failed")
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -161,8 +204,4 @@ class UserProfileSerializer(serializers.ModelSerializer):
         ]
     
     def get_balance(self, obj):
-        try:
-            wallet = Wallet.objects.get(user=obj)
-            return wallet.balance
-        except Wallet.DoesNotExist:
-            return 0
+        return obj.balance
@@ -1,3 +1,274 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .backends import PooledModelBackend
+from .exceptions import IdentityCheckUnavailable, ServiceBusy
+from .hashing import HashingPool, _encode, hashing_pool
+from .models import AccountNumberSequence, User
+from .serializers import identity_exists
+from .utils.account_numbers import (
+    ACCOUNT_NUMBER_BLOCK_SIZE,
+    AccountNumberAllocator,
+    format_account_number,
+    is_valid_account_number,
+    nuban_check_digit,
+)
+from .utils.fingerprints import identity_fingerprint
+
+NIN = "123456789012345"
+
+
+def make_user(n, nin, fingerprint=True, bvn=None):
+    return User.objects.create(
+        email=f"user{n}@example.com",
+        first_name="Ada",
+        last_name="Obi",
+        phone_number=f"+2348000000{n:03d}",
+        account_number=f"{n:010d}",
+        nin=make_password(nin),
+        nin_fingerprint=identity_fingerprint(nin) if fingerprint else None,
+        bvn=make_password(bvn or f"bvn-{n}"),
+    )
+
+
+class IdentityExistsTests(TestCase):
+    def test_fingerprinted_nin_is_found_with_one_query(self):
+        make_user(1, NIN)
+        with self.assertNumQueries(1):
+            self.assertTrue(identity_exists("nin", NIN))
+
+    @override_settings(IDENTITY_FINGERPRINT_FALLBACK=True)
+    def test_fallback_compares_unfingerprinted_rows_by_hash(self):
+        make_user(1, NIN, fingerprint=False)
+        with self.assertLogs("users.serializers", "WARNING"):
+            self.assertFalse(identity_exists("nin", "999999999999999"))
+            self.assertTrue(identity_exists("nin", NIN))
+
+    @override_settings(IDENTITY_FINGERPRINT_FALLBACK=False)
+    def test_fallback_off_skips_unfingerprinted_rows(self):
+        make_user(1, NIN, fingerprint=False)
+        with self.assertNumQueries(1):
+            self.assertFalse(identity_exists("nin", NIN))
+
+    @override_settings(
+        IDENTITY_FINGERPRINT_FALLBACK=True, IDENTITY_FINGERPRINT_FALLBACK_LIMIT=1
+    )
+    def test_fallback_fails_closed_past_its_limit(self):
+        make_user(1, NIN, fingerprint=False)
+        make_user(2, "999999999999999", fingerprint=False)
+        with mock.patch.object(User, "check_nin") as check_nin:
+            with self.assertLogs("users.serializers", "ERROR"):
+                with self.assertRaises(IdentityCheckUnavailable):
+                    identity_exists("nin", "111111111111111")
+        check_nin.assert_not_called()
+
+    def test_lookups_are_index_only_after_the_backfill(self):
+        nins = [f"{n:015d}" for n in range(1, 4)]
+        for n, nin in enumerate(nins, start=1):
+            make_user(n, nin, fingerprint=False, bvn=f"{n + 100:015d}")
+
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, "w") as source:
+            source.write("account_number,nin,bvn\n")
+            for n, nin in enumerate(nins, start=1):
+                source.write(f"{n:010d},{nin},{n + 100:015d}\n")
+        call_command("backfill_identity_fingerprints", source=path, stdout=StringIO())
+        self.assertFalse(User.objects.filter(nin_fingerprint__isnull=True).exists())
+        self.assertFalse(User.objects.filter(bvn_fingerprint__isnull=True).exists())
+
+        with mock.patch.object(User, "check_nin") as check_nin:
+            with self.assertNumQueries(1) as queries:
+                self.assertTrue(identity_exists("nin", nins[1]))
+            with self.assertNumQueries(1):
+                self.assertFalse(identity_exists("nin", "999999999999999"))
+        check_nin.assert_not_called()
+        self.assertIn("nin_fingerprint", queries.captured_queries[0]["sql"])
+        with self.assertNumQueries(1):
+            self.assertTrue(identity_exists("bvn", f"{102:015d}"))
+
+
+@override_settings(ACCOUNT_NUMBER_BANK_CODE="011")
+class AccountNumberTests(TestCase):
+    def test_check_digit_matches_known_vectors(self):
+        # The CBN NUBAN example: bank 011, serial 000001457
+        self.assertEqual(nuban_check_digit("000001457"), "9")
+        self.assertEqual(nuban_check_digit("000000000", bank_code="000"), "0")
+        self.assertEqual(format_account_number(1457), "0000014579")
+
+    def test_invalid_account_numbers_are_rejected(self):
+        self.assertTrue(is_valid_account_number("0000014579"))
+        for value in (
+            "000001457",
+            "00000145790",
+            "",
+            "00000145a9",
+            " 000014579",
+            "0000014578",
+            None,
+            14579,
+        ):
+            with self.subTest(value=value):
+                self.assertFalse(is_valid_account_number(value))
+
+    def test_allocator_skips_numbers_taken_inside_its_block(self):
+        AccountNumberSequence.objects.create(name="tests", next_serial=5000)
+        make_user(1, NIN)
+        User.objects.filter(email="user1@example.com").update(
+            account_number=format_account_number(5001)
+        )
+        allocator = AccountNumberAllocator(name="tests")
+
+        numbers = [allocator.allocate() for _ in range(3)]
+        self.assertEqual(
+            numbers, [format_account_number(n) for n in (5000, 5002, 5003)]
+        )
+        self.assertTrue(all(is_valid_account_number(n) for n in numbers))
+        with self.assertNumQueries(0):
+            allocator.allocate()
+
+        # The next block starts after the whole reserved block
+        for _ in range(ACCOUNT_NUMBER_BLOCK_SIZE - 5):
+            allocator.allocate()
+        self.assertEqual(
+            allocator.allocate(),
+            format_account_number(5000 + ACCOUNT_NUMBER_BLOCK_SIZE),
+        )
+
+
+@override_settings(HASHING_POOL_WORKERS=1, HASHING_POOL_MAX_PENDING=2)
+class HashingPoolTests(TestCase):
+    def setUp(self):
+        self.pool = HashingPool()
+        self.addCleanup(self.pool.shutdown)
+
+    def use_threads(self):
+        """Run the pool on one thread instead of spawning a process."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        return mock.patch.object(self.pool, "_get_executor", return_value=executor)
+
+    def test_hashes_on_a_one_worker_process_pool(self):
+        hasher = get_hasher("default")
+        first, second = self.pool.map(_encode, [(hasher, "secret"), (hasher, "pin")])
+        self.assertTrue(check_password("secret", first))
+        self.assertTrue(check_password("pin", second))
+        self.assertEqual(self.pool._pending, 0)
+
+    @override_settings(HASHING_POOL_WORKERS=0)
+    def test_no_workers_hashes_inline(self):
+        with mock.patch.object(self.pool, "_get_executor") as get_executor:
+            self.assertEqual(self.pool.map(str.upper, [("a",), ("b",)]), ["A", "B"])
+        get_executor.assert_not_called()
+
+    def test_reservations_wait_for_released_slots(self):
+        self.assertEqual(self.pool._reserve(2), 2)
+        reserved = threading.Event()
+        waiter = threading.Thread(
+            target=lambda: reserved.set() if self.pool._reserve(1) else None
+        )
+        waiter.start()
+        self.assertFalse(reserved.wait(0.1))
+
+        self.pool._release(2)
+        waiter.join()
+        self.assertTrue(reserved.is_set())
+        self.assertEqual(self.pool._pending, 1)
+
+    def test_large_requests_reserve_at_most_the_whole_pool(self):
+        self.assertEqual(self.pool._reserve(5), 2)
+        self.pool._release(2)
+        self.assertEqual(self.pool._pending, 0)
+
+    @override_settings(HASHING_POOL_TIMEOUT=0.05)
+    def test_saturated_pool_raises_service_busy_after_the_timeout(self):
+        started, finish = threading.Event(), threading.Event()
+
+        def slow(value):
+            started.set()
+            finish.wait(5)
+            return value
+
+        with self.use_threads():
+            busy = threading.Thread(target=self.pool.map, args=(slow, [("a",), ("b",)]))
+            busy.start()
+            started.wait(5)
+            with self.assertRaises(ServiceBusy):
+                self.pool.map(str.upper, [("c",)])
+
+            finish.set()
+            busy.join()
+            self.assertEqual(self.pool.map(str.upper, [("c",)]), ["C"])
+        self.assertEqual(self.pool._pending, 0)
+
+    def test_failed_hashes_release_their_slots(self):
+        with self.use_threads():
+            with self.assertRaises(ValueError):
+                self.pool.map(int, [("1",), ("not a number",)])
+        self.assertEqual(self.pool._pending, 0)
+
+
+class PooledModelBackendTests(TestCase):
+    def setUp(self):
+        self.user = make_user(1, NIN)
+        self.user.set_password("correct horse")
+        self.user.save()
+
+    def login(self, password, email="user1@example.com"):
+        return authenticate(None, email=email, password=password)
+
+    def test_checks_passwords_on_the_pool(self):
+        self.assertEqual(
+            settings.AUTHENTICATION_BACKENDS, ["users.backends.PooledModelBackend"]
+        )
+        with mock.patch.object(hashing_pool, "map", wraps=hashing_pool.map) as pool_map:
+            self.assertEqual(self.login("correct horse"), self.user)
+            self.assertIsNone(self.login("wrong"))
+        self.assertEqual(pool_map.call_count, 2)
+
+    def test_unknown_email_still_hashes(self):
+        with mock.patch("users.backends.hash_secrets") as hash_secrets:
+            self.assertIsNone(self.login("correct horse", "nobody@example.com"))
+        hash_secrets.assert_called_once_with(password="correct horse")
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password("correct horse", hasher="pbkdf2_sha1")
+        )
+        self.assertEqual(self.login("correct horse"), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+    def test_inactive_users_cannot_log_in(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(
+            PooledModelBackend().authenticate(
+                None, email="user1@example.com", password="correct horse"
+            )
+        )
+
+    @override_settings(ALLOWED_HOSTS=["testserver"], HASHING_POOL_TIMEOUT=0.05)
+    def test_login_returns_503_while_the_pool_is_saturated(self):
+        reserved = hashing_pool._reserve(settings.HASHING_POOL_MAX_PENDING)
+        try:
+            response = APIClient().post(
+                reverse("login_user"),
+                {"email": "user1@example.com", "password": "correct horse"},
+                format="json",
+            )
+        finally:
+            hashing_pool._release(reserved)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data["detail"].code, "service_busy")
@@ -0,0 +1,109 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+# Serials are reserved in blocks of this size. On PostgreSQL the block size
+# is read from the INCREMENT BY of users_account_number_seq instead, so the
+# two cannot disagree.
+ACCOUNT_NUMBER_BLOCK_SIZE = 100
+ACCOUNT_NUMBER_SEQUENCE = "users_account_number_seq"
+
+# NUBAN weights applied to the 3-digit bank code followed by the 9-digit serial
+NUBAN_WEIGHTS = [3, 7, 3, 3, 7, 3, 3, 7, 3, 3, 7, 3]
+
+
+def nuban_check_digit(serial, bank_code=None):
+    """Return the NUBAN check digit for a 9-digit serial."""
+    bank_code = bank_code or settings.ACCOUNT_NUMBER_BANK_CODE
+    digits = f"{bank_code}{serial}"
+    total = sum(int(d) * w for d, w in zip(digits, NUBAN_WEIGHTS))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_account_number(account_number, bank_code=None):
+    """Check the length, digits and check digit of an account number."""
+    if (
+        not isinstance(account_number, str)
+        or len(account_number) != 10
+        or not account_number.isdigit()
+    ):
+        return False
+    return account_number[-1] == nuban_check_digit(account_number[:9], bank_code)
+
+
+def format_account_number(serial):
+    serial = f"{serial:09d}"
+    return serial + nuban_check_digit(serial)
+
+
+class AccountNumberAllocator:
+    """
+    Hand out unique NUBAN-style account numbers from pre-reserved blocks.
+
+    Each process reserves ``ACCOUNT_NUMBER_BLOCK_SIZE`` serials with one query
+    and serves numbers from memory until the block runs out, so allocation
+    never queries per attempt. Legacy random account numbers that happen to
+    fall inside a block are skipped with a single lookup per block.
+    """
+
+    def __init__(self, name="account_number"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pending = []
+
+    def allocate(self):
+        with self._lock:
+            # A forked worker must not reuse the block held by its parent
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending = []
+            while not self._pending:
+                self._pending = self._reserve_block()
+            return self._pending.pop()
+
+    def _reserve_block(self):
+        start, size = self._next_block()
+        candidates = [
+            format_account_number(serial) for serial in range(start, start + size)
+        ]
+        from users.models import User
+
+        taken = set(
+            User.objects.filter(account_number__in=candidates).values_list(
+                "account_number", flat=True
+            )
+        )
+        # Reverse so pop() hands numbers out in ascending order
+        return [number for number in reversed(candidates) if number not in taken]
+
+    def _next_block(self):
+        """The first serial and size of a newly reserved block."""
+        if connection.vendor == "postgresql":
+            # nextval() is not rolled back with the surrounding transaction,
+            # so a failed registration can never hand its block out twice
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(%s), increment_by FROM pg_sequences "
+                    "WHERE schemaname = current_schema() AND sequencename = %s",
+                    [ACCOUNT_NUMBER_SEQUENCE, ACCOUNT_NUMBER_SEQUENCE],
+                )
+                return cursor.fetchone()
+
+        from users.models import AccountNumberSequence
+
+        with transaction.atomic():
+            AccountNumberSequence.objects.get_or_create(name=self.name)
+            AccountNumberSequence.objects.filter(name=self.name).update(
+                next_serial=F("next_serial") + ACCOUNT_NUMBER_BLOCK_SIZE
+            )
+            end = AccountNumberSequence.objects.values_list(
+                "next_serial", flat=True
+            ).get(name=self.name)
+        return end - ACCOUNT_NUMBER_BLOCK_SIZE, ACCOUNT_NUMBER_BLOCK_SIZE
+
+
+account_number_allocator = AccountNumberAllocator()
@@ -0,0 +1,19 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+
+
+def identity_fingerprint(value):
+    """
+    Return a deterministic keyed fingerprint (HMAC-SHA256) for a NIN or BVN.
+
+    The salted hashes stored in ``User.nin``/``User.bvn`` can only be compared
+    one row at a time, so uniqueness checks use this fingerprint instead. It
+    is keyed with a server secret, so a leaked column cannot be brute-forced
+    without the key.
+    """
+    if value is None:
+        return None
+    key = settings.IDENTITY_FINGERPRINT_KEY.encode()
+    return hmac.new(key, str(value).strip().encode(), hashlib.sha256).hexdigest()